@@ -1,8 +1,18 @@
 import streamlit as st
+import pandas as pd
+from typing import Optional
 from veilon_core.db import execute_query
 import veilon_core.accounts as am
+from veilon_core.equity import equity_curve
+from veilon_core.events import account_events_timeline
+from veilon_core.scheduler import snapshot
+from veilon_core.search import search_accounts
+from veilon_core.stats import STAT_LABELS, account_trade_stats, trade_stats
+from veilon_core.trades import account_trades
 from millify import millify
 
+SEARCH_PAGE_SIZE = 50
+
 ALLOWED_ACTIONS_BY_STATUS = {
     "Phase 1": ["Close", "Disable", "Reset", "Set Balance", "Deposit/Withdraw"],
     "Funded": ["Close", "Disable", "Reset", "Set Balance", "Deposit/Withdraw"],
@@ -11,35 +21,6 @@ ALLOWED_ACTIONS_BY_STATUS = {
     "Disabled": ["Enable", "Close", "Reset", "Set Balance", "Deposit/Withdraw"],
 }
 
-def get_timeframe_filter(timeframe: str, column: str = "created_at") -> str:
-    """
-    Returns a SQL WHERE clause fragment for a given timeframe.
-    """
-    if timeframe == "Today":
-        return f"{column}::date = CURRENT_DATE"
-
-    if timeframe == "This Week":
-        return f"{column} >= date_trunc('week', CURRENT_DATE)"
-
-    if timeframe == "This Month":
-        return f"{column} >= date_trunc('month', CURRENT_DATE)"
-
-    if timeframe == "Last Month":
-        return f"""
-            {column} >= date_trunc('month', CURRENT_DATE - INTERVAL '1 month')
-            AND {column} < date_trunc('month', CURRENT_DATE)
-        """
-
-    if timeframe == "This Quarter":
-        return f"{column} >= date_trunc('quarter', CURRENT_DATE)"
-
-    if timeframe == "This Year":
-        return f"{column} >= date_trunc('year', CURRENT_DATE)"
-
-    # All Time
-    return "TRUE"
-
-
 @st.dialog("New Account", dismissible=True, width="medium")
 def create_account_dialog():
     col1, col2 = st.columns(2)
@@ -100,14 +81,38 @@ def account_info_dialog(account_id):
     st.write("Funded at: ")
     st.write("Notes")
 
+    st.subheader("Equity Curve", anchor=False, divider="gray")
+    curve = equity_curve(account_id)
+    if curve.empty:
+        st.caption("No equity history yet.")
+    else:
+        st.line_chart(curve, x="at", y=["equity", "balance"], x_label="", y_label="")
+
+    st.subheader("Trading Statistics", anchor=False, divider="gray")
+    stats = account_trade_stats(account_id)
+    if not stats:
+        st.caption("No closed trades yet.")
+    else:
+        with st.container(border=False, horizontal=True, horizontal_alignment="center"):
+            st.metric("Trades", millify(stats["n_trades"]))
+            st.metric("Win Rate", f"{stats['win_rate']:.1%}")
+            st.metric("Profit Factor", "-" if pd.isna(stats["profit_factor"]) else f"{stats['profit_factor']:.2f}")
+            st.metric("Avg R", "-" if pd.isna(stats["avg_r"]) else f"{stats['avg_r']:.2f}")
+            st.metric("Max Drawdown", millify(stats["max_drawdown"], 2))
+            st.metric("Sharpe", "-" if pd.isna(stats["sharpe"]) else f"{stats['sharpe']:.2f}")
+            st.metric("Consistency", "-" if pd.isna(stats["consistency"]) else f"{stats['consistency']:.0%}")
+
     st.subheader("Payout History", anchor=False, divider="gray")
-    st.dataframe(execute_query("SELECT * FROM payouts "))
+    st.dataframe(execute_query(
+        "SELECT * FROM payouts WHERE account_id = %s ORDER BY created_at DESC;", (account_id,)
+    ))
 
     st.subheader("Trade History", anchor=False, divider="gray")
-    st.dataframe(execute_query("SELECT * FROM trades"))
+    st.dataframe(account_trades(account_id))
 
     st.subheader("Events", anchor=False, divider="gray")
-    st.dataframe(execute_query("SELECT * FROM events"))
+    events, _ = account_events_timeline(account_id=account_id, limit=100)
+    st.dataframe(events, hide_index=True)
 
 
 @st.dialog("Set Balance", width="small")
@@ -255,42 +260,178 @@ def render_header():
                 label_visibility="hidden",
             )
 
+
+def accounts_table(
+    user_id: Optional[int] = None,
+    status: Optional[str] = None,      # "Phase 1" | "Funded" | "In Review" | "Closed" | "Disabled"
+    plan_id: Optional[int] = None,
+):
+    accounts_df = am.accounts_frame(user_id=user_id, plan_id=plan_id)
+
+    if accounts_df.empty:
+        st.info("No accounts found.")
+        # Keep selection state consistent
+        if st.session_state.get("has_accounts_selection") or st.session_state.get("selected_account_ids"):
+            st.session_state["has_accounts_selection"] = False
+            st.session_state["selected_account_ids"] = []
+        return
+
+    if status is not None:
+        accounts_df = accounts_df[accounts_df["status"] == status]
+
+        if accounts_df.empty:
+            st.info("No accounts match the selected status.")
+            st.session_state["has_accounts_selection"] = False
+            st.session_state["selected_account_ids"] = []
+            return
+
+    # Trading statistics come from the precomputed account_trade_stats.
+    stats_ids = None if user_id is None and plan_id is None else accounts_df["id"].tolist()
+    stats = trade_stats(stats_ids).reindex(accounts_df["id"])
+    for column in STAT_LABELS:
+        accounts_df[column] = stats[column].to_numpy()
+
+    DISPLAY_COLUMNS = [
+        "id",
+        "user_id",
+        "order_id",
+        "plan_id",
+        "balance",
+        "status",
+        "created_at",
+        "funded_at",
+        "closed_at",
+        *STAT_LABELS,
+        "notes",
+    ]
+
+    COLUMN_LABELS = {
+        "id": "Account ID",
+        "user_id": "User ID",
+        "order_id": "Order ID",
+        "plan_id": "Plan ID",
+        "balance": "Balance",
+        "status": "Status",
+        "created_at": "Opened At",
+        "funded_at": "Funded At",
+        "closed_at": "Closed At",
+        **STAT_LABELS,
+        "notes": "Notes",
+    }
+
+    # Copy-on-write: selecting and renaming share the column data.
+    df = accounts_df[DISPLAY_COLUMNS].rename(columns=COLUMN_LABELS)
+
+    table = st.dataframe(
+        df,
+        key="accounts_df",
+        on_select="rerun",
+        selection_mode=["single-row"],
+        hide_index=True,
+        column_config={
+            "Balance": st.column_config.NumberColumn("Balance", format="dollar"),
+            "Status": st.column_config.MultiselectColumn(
+                "Status",
+                options=["Phase 1", "Funded", "In Review", "Closed", "Disabled"],
+                color=["#D6EAF8", "#D5F5E3", "#FDEBD0", "#F5B7B1", "#E5E7E9"],
+            ),
+            "Opened At": st.column_config.DatetimeColumn("Opened At", format="DD/MM/YY hh:mm:ss"),
+            "Closed At": st.column_config.DatetimeColumn("Closed At", format="DD/MM/YY hh:mm:ss"),
+            "Funded At": st.column_config.DatetimeColumn("Funded At", format="DD/MM/YY hh:mm:ss"),
+            "Win Rate": st.column_config.NumberColumn("Win Rate", format="percent"),
+            "Profit Factor": st.column_config.NumberColumn("Profit Factor", format="%.2f"),
+            "Avg R": st.column_config.NumberColumn("Avg R", format="%.2f"),
+            "Max Drawdown": st.column_config.NumberColumn("Max Drawdown", format="dollar"),
+            "Sharpe": st.column_config.NumberColumn("Sharpe", format="%.2f"),
+            "Consistency": st.column_config.NumberColumn("Consistency", format="percent"),
+        },
+    )
+
+    selected_rows = table.selection.get("rows", [])
+    sync_selection(df.iloc[selected_rows]["Account ID"].tolist() if selected_rows else [])
+
+
+def sync_selection(selected_ids: list):
+    # ---- Sync + force rerun once on change ----
+    current_is_selected = bool(selected_ids)
+    state_changed = (
+        current_is_selected != st.session_state.get("has_accounts_selection", False)
+        or selected_ids != st.session_state.get("selected_account_ids", [])
+    )
+
+    if state_changed:
+        st.session_state["has_accounts_selection"] = current_is_selected
+        st.session_state["selected_account_ids"] = selected_ids
+        st.rerun()
+
+
+def reset_search_pages():
+    # Keyset cursors of the result pages visited so far; index 0 is the first page.
+    st.session_state["accounts_search_cursors"] = [None]
+
+
+def search_results_table(query: str):
+    if "accounts_search_cursors" not in st.session_state:
+        reset_search_pages()
+    cursors = st.session_state["accounts_search_cursors"]
+
+    rows, next_cursor = search_accounts(query, after=cursors[-1], limit=SEARCH_PAGE_SIZE)
+    if not rows and len(cursors) == 1:
+        st.info("No accounts match the search.")
+        sync_selection([])
+        return
+
+    table = st.dataframe(
+        rows,
+        key="accounts_search_df",
+        on_select="rerun",
+        selection_mode=["single-row"],
+        hide_index=True,
+        column_order=["account_id", "user_id", "plan_id", "source", "snippet", "matches", "at"],
+        column_config={
+            "account_id": st.column_config.NumberColumn("Account ID", format="%d"),
+            "user_id": st.column_config.NumberColumn("User ID", format="%d"),
+            "plan_id": st.column_config.NumberColumn("Plan ID", format="%d"),
+            "source": "Best Match",
+            "snippet": st.column_config.TextColumn("Snippet", width="large"),
+            "matches": st.column_config.NumberColumn("Matches", format="%d"),
+            "at": st.column_config.DatetimeColumn("At", format="DD/MM/YY hh:mm:ss"),
+        },
+    )
+
+    with st.container(border=False, horizontal=True, horizontal_alignment="right", vertical_alignment="center"):
+        st.caption(f"Page {len(cursors)}")
+        if st.button("", key="search-prev", icon=":material/chevron_left:", type="tertiary", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if st.button("", key="search-next", icon=":material/chevron_right:", type="tertiary", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+
+    selected_rows = table.selection.get("rows", [])
+    sync_selection([rows[i]["account_id"] for i in selected_rows])
+
+
 def accounts_page():
     render_header()
     timeframe = st.session_state.get("timeframe-selection", "All Time")
 
-    time_filter = get_timeframe_filter(timeframe, "created_at")
+    kpis = snapshot(f"accounts_kpis:{timeframe}")
 
     with st.container(border=False, horizontal=True, horizontal_alignment="center"):
         with st.container(border=True):
-
-            rows = execute_query("""
-                SELECT COUNT(*) AS total_accounts
-                FROM accounts;
-            """)
-
-            st.metric("Total Accounts", millify(rows[0]["total_accounts"], 2))
+            st.metric("Total Accounts", millify(kpis["total_accounts"], 2))
 
         with st.container(border=True):
-            rows = execute_query(f"""
-                SELECT COUNT(*) AS new_accounts
-                FROM accounts
-                WHERE {time_filter};
-            """)
-
-            st.metric("New Accounts", millify(rows[0]["new_accounts"], 2))
+            st.metric("New Accounts", millify(kpis["new_accounts"], 2))
 
         with st.container(border=True):
-
-            rows = execute_query("""
-                SELECT COALESCE(SUM(balance), 0) AS total_funded_capital
-                FROM accounts
-                WHERE funded_at IS NOT NULL
-                AND closed_at IS NOT NULL;
-            """)
-
-            total_funded_capital = rows[0]["total_funded_capital"] if rows else 0
-            st.metric("Total Funded Capital", millify(total_funded_capital, 2))
+            funded, funded_start = kpis["total_funded_capital"], kpis.get("funded_capital_start")
+            st.metric(
+                "Total Funded Capital",
+                "–" if funded is None else millify(funded, 2),
+                delta=None if funded is None or funded_start is None else millify(funded - funded_start, 2),
+            )
 
     # Ensure keys exist
     if "has_accounts_selection" not in st.session_state:
@@ -304,6 +445,16 @@ def accounts_page():
 
     # ---- Actions bar (above table) ----
     with st.container(border=False, horizontal=True, horizontal_alignment="right"):
+        search_query = st.text_input(
+            "Search",
+            key="accounts_search",
+            placeholder="Search notes and events",
+            label_visibility="collapsed",
+            icon=":material/search:",
+            width=280,
+            on_change=reset_search_pages,
+        ).strip()
+
         # Initialise filter state once
         st.session_state.setdefault("accounts_filter_user", "")
         st.session_state.setdefault("accounts_filter_status", None)
@@ -374,7 +525,7 @@ def accounts_page():
             icon=":material/info:",
             disabled=actions_dropdown,
         ):
-            account_info_dialog(id)
+            account_info_dialog(st.session_state["selected_account_ids"][0])
 
         if st.button(
             "",
@@ -397,8 +548,12 @@ def accounts_page():
             rows = execute_query("SELECT id FROM users WHERE email = %s;", (user_filter,))
             user_id_filter = rows[0]["id"] if rows else -1  # -1 yields no results (safe)
 
-    # ---- Render table with filters ----
-    am.accounts_table(
+    # ---- Render search results, or the table with filters ----
+    if search_query:
+        search_results_table(search_query)
+        return
+
+    accounts_table(
         user_id=user_id_filter,
         status=st.session_state.get("accounts_filter_status"),
         plan_id=st.session_state.get("accounts_filter_plan_id"),
@@ -1,6 +1,6 @@
 import streamlit as st
-from veilon_core.db import execute_query
-import pandas as pd
+from veilon_core.affiliates import affiliate_balances, affiliate_ledger, commission_watermark
+from millify import millify
 
 def render_header():
     with st.container(border=False, horizontal=True, vertical_alignment="center"):
@@ -15,6 +15,61 @@ def render_header():
 def affiliates_page():
     render_header()
 
-    
+    # Commissions are computed by the `affiliates` batch job (veilon_core.jobs).
+    processed_through = commission_watermark()
+    balances = affiliate_balances()
+
+    with st.container(border=False, horizontal=True, horizontal_alignment="center"):
+        with st.container(border=True):
+            st.metric("Affiliates", millify(len(balances)))
+
+        with st.container(border=True):
+            st.metric("Commissions", millify(balances["commissions"].sum(), 2))
+
+        with st.container(border=True):
+            st.metric("Clawbacks", millify(-balances["clawbacks"].sum(), 2))
+
+        with st.container(border=True):
+            st.metric("Owed", millify(balances["owed"].sum(), 2))
+
+    if processed_through:
+        st.caption(f"Commissions processed through order #{processed_through}.")
+
+    event = st.dataframe(
+        balances,
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        column_config={
+            "id": None,
+            "code": st.column_config.TextColumn("Code"),
+            "name": st.column_config.TextColumn("Name"),
+            "lifetime_orders": st.column_config.NumberColumn("Orders", format="%d"),
+            "commissions": st.column_config.NumberColumn("Commissions", format="dollar"),
+            "clawbacks": st.column_config.NumberColumn("Clawbacks", format="dollar"),
+            "paid": st.column_config.NumberColumn("Paid", format="dollar"),
+            "pending": st.column_config.NumberColumn("Requested", format="dollar"),
+            "owed": st.column_config.NumberColumn("Owed", format="dollar"),
+        },
+    )
+
+    if event.selection.rows:
+        affiliate = balances.iloc[event.selection.rows[0]]
+        st.subheader(f"{affiliate['name']} ({affiliate['code']})", anchor=False)
+        st.dataframe(
+            affiliate_ledger(int(affiliate["id"])),
+            hide_index=True,
+            column_config={
+                "order_id": st.column_config.NumberColumn("Order ID", format="%d"),
+                "kind": st.column_config.TextColumn("Type"),
+                "rate_pct": st.column_config.NumberColumn("Rate %"),
+                "amount": st.column_config.NumberColumn("Amount", format="dollar"),
+                "order_amount": st.column_config.NumberColumn("Order Amount", format="dollar"),
+                "status": st.column_config.TextColumn("Order Status"),
+                "created_at": st.column_config.DatetimeColumn("Created"),
+            },
+        )
+
+
 if __name__ == "__main__":
-    affiliates_page()
\ No newline at end of file
+    affiliates_page()
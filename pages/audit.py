@@ -0,0 +1,132 @@
+import streamlit as st
+from datetime import datetime, time, timedelta, timezone
+from veilon_core.events import account_event_types, account_events_timeline, parse_payload_filter
+
+PAGE_SIZE = 50
+ACTOR_TYPES = ("All", "user", "admin", "system")
+
+
+def reset_audit_pages():
+    # Keyset cursors of the pages visited so far; index 0 is the first page.
+    st.session_state["audit_cursors"] = [None]
+
+
+def render_filters():
+    st.session_state.setdefault("audit_filter_account", "")
+    st.session_state.setdefault("audit_filter_types", [])
+    st.session_state.setdefault("audit_filter_actor_type", None)
+    st.session_state.setdefault("audit_filter_actor_id", "")
+    st.session_state.setdefault("audit_filter_payload", "")
+    st.session_state.setdefault("audit_filter_dates", ())
+
+    with st.popover(
+        "",
+        width=40,
+        type="tertiary",
+        icon=":material/filter_alt:",
+    ):
+        account_input = st.text_input(
+            "Account ID",
+            value=st.session_state["audit_filter_account"],
+        )
+
+        event_types = st.multiselect(
+            "Event Types",
+            options=account_event_types(),
+            default=st.session_state["audit_filter_types"],
+        )
+
+        actor_type = st.selectbox(
+            "Actor",
+            options=ACTOR_TYPES,
+            index=ACTOR_TYPES.index(st.session_state["audit_filter_actor_type"] or "All"),
+        )
+        actor_id_input = st.text_input("Actor ID", value=st.session_state["audit_filter_actor_id"])
+
+        payload_input = st.text_area(
+            "Payload",
+            placeholder="One per line, e.g.\ndelta < -1000\nreason = \"manual\"",
+            value=st.session_state["audit_filter_payload"],
+            help="key <op> value with op one of = != < <= > >=. Values are read as JSON.",
+        )
+
+        dates = st.date_input("Occurred", value=st.session_state["audit_filter_dates"])
+
+        if st.button("Apply", type="primary", use_container_width=True):
+            st.session_state["audit_filter_account"] = account_input.strip()
+            st.session_state["audit_filter_types"] = event_types
+            st.session_state["audit_filter_actor_type"] = None if actor_type == "All" else actor_type
+            st.session_state["audit_filter_actor_id"] = actor_id_input.strip()
+            st.session_state["audit_filter_payload"] = payload_input.strip()
+            st.session_state["audit_filter_dates"] = tuple(dates)
+            reset_audit_pages()
+            st.rerun()
+
+
+def _day_start(day) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def audit_page():
+    if "audit_cursors" not in st.session_state:
+        reset_audit_pages()
+
+    with st.container(border=False, horizontal=True, vertical_alignment="center"):
+        st.subheader("Audit Log", anchor=False)
+        with st.container(border=False, horizontal=True, horizontal_alignment="right"):
+            render_filters()
+
+    account_filter = st.session_state["audit_filter_account"]
+    actor_id_filter = st.session_state["audit_filter_actor_id"]
+    dates = st.session_state["audit_filter_dates"]
+    cursors = st.session_state["audit_cursors"]
+
+    try:
+        payload_filters = [
+            parse_payload_filter(line)
+            for line in st.session_state["audit_filter_payload"].splitlines()
+            if line.strip()
+        ]
+    except ValueError as e:
+        st.error(str(e))
+        return
+
+    rows, next_cursor = account_events_timeline(
+        account_id=int(account_filter) if account_filter.isdigit() else None,
+        event_types=st.session_state["audit_filter_types"],
+        actor_type=st.session_state["audit_filter_actor_type"],
+        actor_id=int(actor_id_filter) if actor_id_filter.isdigit() else None,
+        payload_filters=payload_filters,
+        start=_day_start(dates[0]) if len(dates) > 0 else None,
+        end=_day_start(dates[1] + timedelta(days=1)) if len(dates) > 1 else None,
+        after=cursors[-1],
+        limit=PAGE_SIZE,
+    )
+
+    st.dataframe(
+        rows,
+        hide_index=True,
+        column_config={
+            "id": st.column_config.NumberColumn("Event ID", format="%d"),
+            "account_id": st.column_config.NumberColumn("Account ID", format="%d"),
+            "event_type": "Type",
+            "event_status": "Status",
+            "actor_type": "Actor",
+            "actor_id": st.column_config.NumberColumn("Actor ID", format="%d"),
+            "payload": st.column_config.JsonColumn("Payload"),
+            "occurred_at": st.column_config.DatetimeColumn("Occurred At", format="DD/MM/YY hh:mm:ss"),
+        },
+    )
+
+    with st.container(border=False, horizontal=True, horizontal_alignment="right", vertical_alignment="center"):
+        st.caption(f"Page {len(cursors)}")
+        if st.button("", key="audit-prev", icon=":material/chevron_left:", type="tertiary", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if st.button("", key="audit-next", icon=":material/chevron_right:", type="tertiary", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+
+
+if __name__ == "__main__":
+    audit_page()
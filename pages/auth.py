@@ -1,5 +1,4 @@
 import streamlit as st
-from streamlit_extras.stylable_container import stylable_container
 
 def is_logged_in() -> bool:
     """Wrapper around st.user / st.session_state, depending on how auth is configured."""
@@ -13,6 +12,9 @@ def is_logged_in() -> bool:
 
 
 def google_login_button():
+    # Only needed while logged out; keeps streamlit_extras off the app.py import path.
+    from streamlit_extras.stylable_container import stylable_container
+
     with stylable_container(
         key="google_signin_container",
         css_styles=r"""
@@ -1,4 +1,6 @@
 import streamlit as st
+from veilon_core.coupons import COUPON_KINDS, coupon_create, coupon_list, coupon_set_active, validate_coupon
+from veilon_core.db import execute_query
 
 def render_header():
     with st.container(border=False, horizontal=True, vertical_alignment="center"):
@@ -10,8 +12,103 @@ def render_header():
         ):
             st.subheader(f"Coupons", anchor=False)
 
+        with st.container(
+            border=False,
+            horizontal=True,
+            horizontal_alignment="right",
+            vertical_alignment="center",
+        ):
+            if st.button("New Coupon", icon=":material/add:", type="primary"):
+                create_coupon_dialog()
+
+
+@st.dialog("New Coupon", dismissible=True, width="medium")
+def create_coupon_dialog():
+    plan_rows = execute_query("SELECT id, name FROM plans ORDER BY name;")
+    plan_name_to_id = {r["name"]: r["id"] for r in plan_rows}
+
+    col1, col2 = st.columns(2)
+    with col1:
+        code = st.text_input("Code", placeholder="SAVE10")
+        kind = st.selectbox("Type", COUPON_KINDS, format_func=str.title)
+        value = st.number_input("Percent off" if kind == "percent" else "Amount off", min_value=0.0, value=10.0)
+        min_amount = st.number_input("Minimum order", min_value=0.0, value=0.0)
+    with col2:
+        plans = st.multiselect("Plans", list(plan_name_to_id), placeholder="All plans")
+        max_redemptions = st.number_input("Max redemptions", min_value=0, value=0, help="0 = unlimited")
+        per_user_limit = st.number_input("Per-user limit", min_value=0, value=1, help="0 = unlimited")
+        expires_on = st.date_input("Expires", value=None)
+
+    if st.button("Create Coupon", icon=":material/add:", type="primary", disabled=not code.strip()):
+        try:
+            coupon_create(
+                code,
+                kind,
+                value,
+                min_amount=min_amount,
+                plan_ids=[plan_name_to_id[p] for p in plans] or None,
+                max_redemptions=max_redemptions or None,
+                per_user_limit=per_user_limit or None,
+                expires_at=expires_on,
+            )
+            st.rerun()
+        except Exception as e:
+            st.error(f"Failed to create coupon: {e}")
+
+
+def render_coupon_tester():
+    plan_rows = execute_query("SELECT id, name, price FROM plans ORDER BY name;")
+    if not plan_rows:
+        return
+    with st.popover("Test Code", icon=":material/sell:"):
+        code = st.text_input("Code", key="coupon-test-code")
+        plan = st.selectbox("Plan", plan_rows, format_func=lambda r: r["name"], key="coupon-test-plan")
+        if code:
+            check = validate_coupon(code, plan["id"], plan["price"] or 0)
+            if check.ok:
+                st.success(f"{check.discount} off, pays {check.final_amount}.")
+            else:
+                st.error(f"Rejected: {check.reason.replace('_', ' ')}.")
+
+
 def coupons_page():
     render_header()
 
+    coupons = coupon_list()
+
+    with st.container(border=False, horizontal=True, horizontal_alignment="right"):
+        render_coupon_tester()
+
+    event = st.dataframe(
+        coupons,
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        column_config={
+            "id": None,
+            "code": st.column_config.TextColumn("Code"),
+            "kind": st.column_config.TextColumn("Type"),
+            "value": st.column_config.NumberColumn("Value"),
+            "plan_ids": st.column_config.ListColumn("Plans"),
+            "min_amount": st.column_config.NumberColumn("Min Order", format="dollar"),
+            "max_redemptions": st.column_config.NumberColumn("Cap", format="%d"),
+            "per_user_limit": st.column_config.NumberColumn("Per User", format="%d"),
+            "redemptions": st.column_config.NumberColumn("Redeemed", format="%d"),
+            "discount_given": st.column_config.NumberColumn("Discount Given", format="dollar"),
+            "starts_at": st.column_config.DatetimeColumn("Starts"),
+            "expires_at": st.column_config.DatetimeColumn("Expires"),
+            "is_active": st.column_config.CheckboxColumn("Active"),
+            "created_at": st.column_config.DatetimeColumn("Created"),
+        },
+    )
+
+    if event.selection.rows:
+        coupon = coupons[event.selection.rows[0]]
+        label = "Deactivate" if coupon["is_active"] else "Activate"
+        if st.button(f"{label} {coupon['code']}", icon=":material/toggle_on:"):
+            coupon_set_active(coupon["id"], not coupon["is_active"])
+            st.rerun()
+
+
 if __name__ == "__main__":
-    coupons_page()
\ No newline at end of file
+    coupons_page()
@@ -1,11 +1,19 @@
 import streamlit as st
 import static.elements.metrics as metrics
 from millify import millify
-from numpy.random import default_rng as rng
+from veilon_core.scheduler import snapshot
 
-changes = list(rng(4).standard_normal(20))
-data = [sum(changes[:i]) for i in range(20)]
-delta = round(data[-1], 2)
+
+def render_metric(metric: dict, chart_type=None):
+    delta = f"{metric['delta_pct']:+.1f}%" if metric["delta_pct"] is not None else None
+    st.metric(
+        metric["label"],
+        millify(metric["value"], 2),
+        chart_data=metric["series"] if chart_type else None,
+        chart_type=chart_type or "line",
+        delta=delta,
+        delta_color="off"
+        )
 
 
 @st.dialog("Logout")
@@ -47,6 +55,8 @@ def render_header():
 
 def dashboard_page():
     render_header()
+    timeframe = st.session_state.get("timeframe-selection", "This Month")
+    kpis = snapshot(f"dashboard:{timeframe}")
 
     overview_tab, revenue_tab, payouts_tab = st.tabs(["Overview", "Revenue", "Payouts"])
 
@@ -60,32 +70,12 @@ def dashboard_page():
                 with st.container(
                     border=True,
                 ): 
-                    st.metric(
-                        "New Users", 
-                        millify(321),
-                        delta=delta,
-                        delta_color="off"
-                        )
+                    render_metric(kpis["new_users"])
 
                 with st.container(
                     border=True,
                 ): 
-                    st.metric(
-                        "New Accounts", 
-                        millify(198),
-                        delta=delta,
-                        delta_color="off"
-                        )
-                
-                with st.container(
-                    border=True,
-                ): 
-                    st.metric(
-                        "New Accounts", 
-                        millify(198),
-                        delta=delta,
-                        delta_color="off"
-                        )
+                    render_metric(kpis["new_accounts"])
                     
         with st.container(
                 border=False,
@@ -95,26 +85,12 @@ def dashboard_page():
                 with st.container(
                     border=True,
                 ): 
-                    st.metric(
-                        "Revenue", 
-                        millify(101250),
-                        chart_data=data,
-                        chart_type="line",
-                        delta=delta,
-                        delta_color="off"
-                        )
+                    render_metric(kpis["revenue"], chart_type="line")
 
                 with st.container(
                     border=True,
                 ): 
-                    st.metric(
-                        "Payouts", 
-                        millify(32120),
-                        chart_data=data,
-                        chart_type="bar",
-                        delta=delta,
-                        delta_color="off"
-                        )
+                    render_metric(kpis["payouts"], chart_type="bar")
         
 if __name__ == "__main__":
     dashboard_page()
\ No newline at end of file
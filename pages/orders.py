@@ -1,7 +1,12 @@
 import streamlit as st
+from datetime import timedelta
 from veilon_core.db import execute_query
+from veilon_core.orders import ORDER_STATUSES, orders_ledger
+from veilon_core.scheduler import snapshot
 from millify import millify
 
+PAGE_SIZE = 50
+
 def render_header():
     with st.container(border=False, horizontal=True, vertical_alignment="center"):
         with st.container(
@@ -26,29 +31,142 @@ def render_header():
                 label_visibility="hidden",
             )
 
+
+def reset_ledger_pages():
+    # Keyset cursors of the pages visited so far; index 0 is the first page.
+    st.session_state["orders_cursors"] = [None]
+
+
+def render_filters():
+    st.session_state.setdefault("orders_filter_user", "")
+    st.session_state.setdefault("orders_filter_status", None)
+    st.session_state.setdefault("orders_filter_plan_id", None)
+    st.session_state.setdefault("orders_filter_dates", ())
+
+    with st.popover(
+        "",
+        width=40,
+        type="tertiary",
+        icon=":material/filter_alt:",
+    ):
+        user_input = st.text_input(
+            "User",
+            placeholder="Email or User ID",
+            value=st.session_state["orders_filter_user"],
+        )
+
+        status_options = ["All", *ORDER_STATUSES]
+        status_sel = st.selectbox(
+            "Status",
+            options=status_options,
+            index=status_options.index(st.session_state["orders_filter_status"] or "All"),
+        )
+
+        plan_rows = execute_query("SELECT id, name FROM plans ORDER BY name;")
+        plan_name_to_id = {r["name"]: r["id"] for r in plan_rows}
+        plan_options = ["All Plans"] + list(plan_name_to_id.keys())
+        current_plan_name = next(
+            (n for n, pid in plan_name_to_id.items() if pid == st.session_state["orders_filter_plan_id"]),
+            "All Plans",
+        )
+        plan_name = st.selectbox("Plan", options=plan_options, index=plan_options.index(current_plan_name))
+
+        dates = st.date_input("Created", value=st.session_state["orders_filter_dates"])
+
+        if st.button("Apply", type="primary", use_container_width=True):
+            st.session_state["orders_filter_user"] = user_input.strip()
+            st.session_state["orders_filter_status"] = None if status_sel == "All" else status_sel
+            st.session_state["orders_filter_plan_id"] = None if plan_name == "All Plans" else plan_name_to_id[plan_name]
+            st.session_state["orders_filter_dates"] = tuple(dates)
+            reset_ledger_pages()
+            st.rerun()
+
+
+def render_ledger():
+    if "orders_cursors" not in st.session_state:
+        reset_ledger_pages()
+
+    with st.container(border=False, horizontal=True, horizontal_alignment="right"):
+        render_filters()
+
+    user_filter = st.session_state["orders_filter_user"]
+    dates = st.session_state["orders_filter_dates"]
+    cursors = st.session_state["orders_cursors"]
+
+    rows, next_cursor = orders_ledger(
+        status=st.session_state["orders_filter_status"],
+        plan_id=st.session_state["orders_filter_plan_id"],
+        user_id=int(user_filter) if user_filter.isdigit() else None,
+        email=user_filter if user_filter and not user_filter.isdigit() else None,
+        created_from=dates[0] if len(dates) > 0 else None,
+        created_to=dates[1] + timedelta(days=1) if len(dates) > 1 else None,
+        after=cursors[-1],
+        limit=PAGE_SIZE,
+    )
+
+    st.dataframe(
+        rows,
+        hide_index=True,
+        column_config={
+            "id": st.column_config.NumberColumn("Order ID", format="%d"),
+            "user_id": st.column_config.NumberColumn("User ID", format="%d"),
+            "email": "Email",
+            "plan_id": st.column_config.NumberColumn("Plan ID", format="%d"),
+            "plan_name": "Plan",
+            "amount": st.column_config.NumberColumn("Amount", format="dollar"),
+            "status": "Status",
+            "coupon_code": "Coupon",
+            "refunded_amount": st.column_config.NumberColumn("Refunded", format="dollar"),
+            "created_at": st.column_config.DatetimeColumn("Created At", format="DD/MM/YY hh:mm:ss"),
+        },
+    )
+
+    with st.container(border=False, horizontal=True, horizontal_alignment="right", vertical_alignment="center"):
+        st.caption(f"Page {len(cursors)}")
+        if st.button("", key="orders-prev", icon=":material/chevron_left:", type="tertiary", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if st.button("", key="orders-next", icon=":material/chevron_right:", type="tertiary", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+
+
 def orders_page():
     render_header()
+    timeframe = st.session_state.get("timeframe-selection", "This Month")
+    kpis = snapshot(f"orders_kpis:{timeframe}")
+    totals = kpis["totals"]
 
     with st.container(border=False, horizontal=True, horizontal_alignment="center"):
             with st.container(border=True): 
-                st.metric("Total Revenue", millify(123456, 2))
+                st.metric("Total Revenue", millify(totals["gross_revenue"], 2))
 
             with st.container(border=True): 
-                st.metric("Total Refunds", millify(12345, 2))
+                st.metric("Total Refunds", millify(totals["refunds"], 2))
             
             with st.container(border=True): 
-                st.metric("Payment Success Rate", "90.12%")
-
+                success_rate = totals["success_rate"]
+                st.metric("Payment Success Rate", f"{success_rate:.2%}" if success_rate == success_rate else "–")
 
+    by_plan_tab, by_coupon_tab = st.tabs(["By Plan", "By Coupon"])
+    breakdown_config = {
+        "plan_id": None,
+        "plan_name": "Plan",
+        "coupon_code": "Coupon",
+        "orders": "Orders",
+        "settled": "Paid",
+        "failed": "Failed",
+        "gross_revenue": st.column_config.NumberColumn("Revenue", format="dollar"),
+        "refunds": st.column_config.NumberColumn("Refunds", format="dollar"),
+        "net_revenue": st.column_config.NumberColumn("Net", format="dollar"),
+        "success_rate": st.column_config.NumberColumn("Success Rate", format="percent"),
+    }
+    with by_plan_tab:
+        st.dataframe(kpis["by_plan"], hide_index=True, column_config=breakdown_config)
+    with by_coupon_tab:
+        st.dataframe(kpis["by_coupon"], hide_index=True, column_config=breakdown_config)
 
-    orders_table = execute_query(
-        """
-        SELECT 
-            *
-        FROM orders;
-        """)
-    
-    st.dataframe(orders_table)
+    render_ledger()
 
 if __name__ == "__main__":
-    orders_page()
\ No newline at end of file
+    orders_page()
@@ -1,5 +1,7 @@
 import streamlit as st
-from veilon_core.db import execute_query
+import pandas as pd
+from veilon_core.payouts import PayoutScenario, forecast_payouts
+from veilon_core.scheduler import snapshot
 from millify import millify
 
 def render_header():
@@ -26,32 +28,85 @@ def render_header():
                 label_visibility="hidden",
             )
 
+def render_scenario_controls() -> PayoutScenario:
+    defaults = PayoutScenario()
+    with st.popover("Assumptions", icon=":material/tune:"):
+        horizon_days = st.slider("Horizon (days)", 7, 180, defaults.horizon_days)
+        daily_return_pct = st.slider("Daily return (% of size)", 0.0, 1.0, defaults.daily_return_pct, step=0.01)
+        request_rate = st.slider("Request rate", 0.0, 1.0, defaults.request_rate, step=0.05)
+        monthly_breach_rate = st.slider("Monthly breach rate", 0.0, 1.0, defaults.monthly_breach_rate, step=0.01)
+        min_payout = st.number_input("Minimum payout", min_value=0.0, value=defaults.min_payout, step=50.0)
+
+    return PayoutScenario(
+        horizon_days=horizon_days,
+        daily_return_pct=daily_return_pct,
+        request_rate=request_rate,
+        monthly_breach_rate=monthly_breach_rate,
+        min_payout=min_payout,
+    )
+
+
 def payouts_page():
     render_header()
+    timeframe = st.session_state.get("timeframe-selection", "This Month")
 
     trader_payouts_tab, affiliate_payouts_tab = st.tabs(["Traders", "Affiliates"])
 
     with trader_payouts_tab:
+        with st.container(border=False, horizontal=True, horizontal_alignment="right"):
+            scenario = render_scenario_controls()
+
+        # Inputs are cached and refreshed in the background; changing the
+        # assumptions only reruns the NumPy forecast.
+        per_account, forecast = forecast_payouts(snapshot("payouts:forecast_inputs"), scenario)
+
         with st.container(border=False, horizontal=True, horizontal_alignment="center"):
                 with st.container(border=True): 
-                    st.metric("Total Payouts", millify(123456, 2))
+                    st.metric("Total Payouts", millify(snapshot(f"dashboard:{timeframe}")["payouts"]["value"], 2))
 
                 with st.container(border=True): 
-                    st.metric("Forecasted Payouts", millify(12345, 2))
+                    st.metric(
+                        "Forecasted Payouts",
+                        millify(forecast["forecast_total"], 2),
+                        help=f"Expected over the next {scenario.horizon_days} days across {forecast['accounts']} funded accounts.",
+                    )
                 
                 with st.container(border=True): 
-                    st.metric("Pending Payouts", millify(1234, 2))
+                    st.metric("Pending Payouts", millify(snapshot("payouts:pending"), 2))
+
+        st.bar_chart(
+            pd.DataFrame({"Expected": forecast["daily"]}, index=pd.RangeIndex(len(forecast["daily"]), name="Days from now")),
+            x_label="Days from now",
+            y_label="",
+        )
+
+        st.dataframe(
+            per_account.sort_values("expected_total", ascending=False).head(100),
+            column_config={
+                "account_id": st.column_config.NumberColumn("Account ID", format="%d"),
+                "next_payout_in_days": st.column_config.NumberColumn("Next Payout In (days)"),
+                "accrued": st.column_config.NumberColumn("Accrued Share", format="dollar"),
+                "next_expected": st.column_config.NumberColumn("Next Expected", format="dollar"),
+                "expected_total": st.column_config.NumberColumn("Expected Total", format="dollar"),
+            },
+        )
 
     with affiliate_payouts_tab:
+        affiliates = snapshot(f"affiliates_kpis:{timeframe}")
+
         with st.container(border=False, horizontal=True, horizontal_alignment="center"):
                 with st.container(border=True): 
-                    st.metric("Total Affiliate Payouts", millify(123456, 2))
+                    st.metric("Total Affiliate Payouts", millify(affiliates["paid"], 2))
 
                 with st.container(border=True): 
-                    st.metric("Forecasted Affiliate Payouts", millify(12345, 2))
+                    st.metric(
+                        "Forecasted Affiliate Payouts",
+                        millify(affiliates["forecast"], 2),
+                        help="Net commissions earned over the last 30 days, as a run rate for the next 30.",
+                    )
                 
                 with st.container(border=True): 
-                    st.metric("Pending Affiliate Payouts", millify(1234, 2))
+                    st.metric("Pending Affiliate Payouts", millify(affiliates["pending"], 2), help="Commissions net of clawbacks not yet paid out.")
 
 if __name__ == "__main__":
     payouts_page()
\ No newline at end of file
@@ -1,5 +1,9 @@
 import streamlit as st
+from dataclasses import replace
 from veilon_core.db import execute_query
+from veilon_core.scheduler import snapshot
+from veilon_core.simulator import PlanSpec, SimulationParams, TraderModel, simulate_plan
+from millify import millify
 
 def render_header():
     with st.container(border=False, horizontal=True, vertical_alignment="center"):
@@ -11,6 +15,80 @@ def render_header():
         ):
             st.subheader(f"Plans", anchor=False)
 
+
+# Every admin session shares the server process; keep one run to a couple of cores.
+SIMULATION_WORKERS = 2
+
+
+@st.cache_data(show_spinner="Simulating traders...", max_entries=32)
+def run_simulation(spec: PlanSpec, params: SimulationParams, model_fitted_at: float, _model: TraderModel) -> dict:
+    # Seeded, so identical inputs always give identical results. The model
+    # is refitted hourly; its fit time is part of the key, the arrays are not hashed.
+    return simulate_plan(spec, params, _model, workers=SIMULATION_WORKERS)
+
+
+def render_simulator(plans_table):
+    st.subheader("Plan Simulator", anchor=False)
+
+    plan_by_name = {row["name"]: row for row in plans_table}
+    plan_name = st.selectbox("Start from plan", ["Defaults"] + list(plan_by_name))
+    base = PlanSpec.from_plan(plan_by_name[plan_name]) if plan_name in plan_by_name else PlanSpec()
+
+    with st.form("plan-simulator"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            account_size = st.number_input("Account Size", value=base.account_size, step=5_000.0)
+            price = st.number_input("Price", value=base.price, step=10.0)
+            phase_count = st.number_input("Phases", value=base.phase_count, min_value=1, max_value=3)
+        with col2:
+            profit_target_pct = st.number_input("Profit Target %", value=base.profit_target_pct, step=0.5)
+            max_daily_loss_pct = st.number_input("Max Daily Loss %", value=base.max_daily_loss_pct, step=0.5)
+            max_trailing_drawdown_pct = st.number_input("Max Trailing Drawdown %", value=base.max_trailing_drawdown_pct, step=0.5)
+        with col3:
+            min_trading_days = st.number_input("Min Trading Days", value=base.min_trading_days, min_value=0)
+            profit_split_pct = st.number_input("Profit Split %", value=base.profit_split_pct, step=5.0)
+            payout_cycle_days = st.number_input("Payout Cycle (days)", value=base.payout_cycle_days, min_value=1)
+
+        with st.container(horizontal=True):
+            n_traders = st.select_slider("Traders", options=[10_000, 100_000, 1_000_000], value=100_000)
+            seed = st.number_input("Seed", value=0, min_value=0)
+
+        submitted = st.form_submit_button("Run", type="primary")
+
+    if not submitted:
+        return
+
+    spec = replace(
+        base,
+        account_size=account_size,
+        price=price,
+        phase_count=int(phase_count),
+        profit_target_pct=profit_target_pct,
+        max_daily_loss_pct=max_daily_loss_pct,
+        max_trailing_drawdown_pct=max_trailing_drawdown_pct,
+        min_trading_days=int(min_trading_days),
+        profit_split_pct=profit_split_pct,
+        payout_cycle_days=int(payout_cycle_days),
+    )
+    model = snapshot("plans:trader_model")
+    result = run_simulation(spec, SimulationParams(n_traders=n_traders, seed=int(seed)), model.fitted_at, model)
+
+    with st.container(border=False, horizontal=True, horizontal_alignment="center"):
+        with st.container(border=True):
+            st.metric("Pass Rate", f"{result['funded_rate']:.1%}")
+        with st.container(border=True):
+            st.metric("Expected Payout", millify(result["expected_payout"], 2))
+        with st.container(border=True):
+            st.metric("Margin", millify(result["margin"], 2), delta=f"{result['margin_pct']:.1%}", delta_color="off")
+
+    st.caption(
+        f"{result['traders']:,} traders · model: {result['model']} · seed {result['seed']} · "
+        f"phase pass rates {', '.join(f'{p:.1%}' for p in result['phase_pass_rate'])} · "
+        f"payout p50/p90/p99 {millify(result['payout_p50'])}/{millify(result['payout_p90'])}/{millify(result['payout_p99'])} · "
+        f"{result['seconds']}s"
+    )
+
+
 def plans_page():
     render_header()
 
@@ -23,5 +101,7 @@ def plans_page():
     
     st.dataframe(plans_table)
 
+    render_simulator(plans_table)
+
 if __name__ == "__main__":
-    plans_page()
\ No newline at end of file
+    plans_page()
@@ -17,8 +17,8 @@ def query_page():
     query_input = st.text_input(label="Custom Query Input", placeholder="SELECT * FROM accounts;")
 
     if query_input:
-        custom_table = execute_query(
-            query_input)
+        # Ad-hoc queries run read-only, on a replica when one is healthy.
+        custom_table = execute_query(query_input, replica=True)
         
         st.dataframe(custom_table)
 
@@ -8,7 +8,8 @@ AFFILIATES_PAGE = st.Page("pages/affiliates.py", title="Affiliates", icon=":mate
 COUPONS_PAGE = st.Page("pages/coupons.py", title="Coupons", icon=":material/redeem:")
 PAYOUTS_PAGE = st.Page("pages/payouts.py", title="Payouts", icon=":material/paid:")
 PLANS_PAGE = st.Page("pages/plans.py", title="Plans", icon=":material/package_2:")
+AUDIT_PAGE = st.Page("pages/audit.py", title="Audit Log", icon=":material/history:")
 QUERY_PAGE = st.Page("pages/query.py", title="Custom Query", icon=":material/query_stats:")
 LOGOUT = st.Page("pages/logout.py", title="Logout", icon=":material/logout:")
 
-PAGES = [DASHBOARD_PAGE, ORDERS_PAGE, PAYOUTS_PAGE, ACCOUNTS_PAGE, USERS_PAGE, PLANS_PAGE, AFFILIATES_PAGE, COUPONS_PAGE, QUERY_PAGE, LOGOUT]
\ No newline at end of file
+PAGES = [DASHBOARD_PAGE, ORDERS_PAGE, PAYOUTS_PAGE, ACCOUNTS_PAGE, USERS_PAGE, PLANS_PAGE, AFFILIATES_PAGE, COUPONS_PAGE, AUDIT_PAGE, QUERY_PAGE, LOGOUT]
\ No newline at end of file
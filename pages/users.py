@@ -1,7 +1,11 @@
 import streamlit as st
+import pandas as pd
 from veilon_core.db import execute_query
+from veilon_core.users import FUNNEL_STAGES, cohort_funnels
 from millify import millify
 
+COHORT_MONTHS = 12
+
 def render_header():
     with st.container(border=False, horizontal=True, vertical_alignment="center"):
         with st.container(
@@ -26,6 +30,48 @@ def render_header():
                 label_visibility="hidden",
             )
 
+def render_cohorts():
+    st.subheader("Signup Cohorts", anchor=False, divider="gray")
+    funnels = cohort_funnels(COHORT_MONTHS)
+    if funnels.empty:
+        st.caption("No cohort data yet. Run: python -m veilon_core.jobs cohorts --full")
+        return
+
+    totals = funnels[[stage for stage, _ in FUNNEL_STAGES]].sum()
+    st.bar_chart(
+        pd.DataFrame(
+            {"Users": totals.to_numpy()},
+            index=pd.Index([label for _, label in FUNNEL_STAGES], name="Stage"),
+        ),
+        horizontal=True,
+        sort=False,
+        x_label="",
+        y_label="",
+    )
+
+    st.dataframe(
+        funnels,
+        hide_index=True,
+        column_order=[
+            "cohort_month", "users", "ordered_rate", "phase1_rate", "funded_rate", "funded_step",
+            "paid_out_rate", "days_to_order_p50", "days_to_fund_p50", "days_to_fund_p90", "days_to_payout_p50",
+        ],
+        column_config={
+            "cohort_month": st.column_config.DateColumn("Cohort", format="MMM YYYY"),
+            "users": st.column_config.NumberColumn("Signups", format="%d"),
+            "ordered_rate": st.column_config.NumberColumn("First Order", format="percent"),
+            "phase1_rate": st.column_config.NumberColumn("Phase 1", format="percent"),
+            "funded_rate": st.column_config.NumberColumn("Funded", format="percent"),
+            "funded_step": st.column_config.NumberColumn("Phase 1 → Funded", format="percent"),
+            "paid_out_rate": st.column_config.NumberColumn("First Payout", format="percent"),
+            "days_to_order_p50": st.column_config.NumberColumn("Days to Order", format="%.1f"),
+            "days_to_fund_p50": st.column_config.NumberColumn("Days to Fund", format="%.1f"),
+            "days_to_fund_p90": st.column_config.NumberColumn("Days to Fund (p90)", format="%.1f"),
+            "days_to_payout_p50": st.column_config.NumberColumn("Days to Payout", format="%.1f"),
+        },
+    )
+
+
 def users_page():
     render_header()
 
@@ -39,6 +85,8 @@ def users_page():
             with st.container(border=True): 
                 st.metric("Inactive Users", millify(453, 2))
 
+    render_cohorts()
+
     users_table = execute_query(
         """
         SELECT 
@@ -1,8 +1,11 @@
 from __future__ import annotations
+from datetime import datetime, timedelta, timezone
 from typing import Any, Optional, Sequence
-from veilon_core.db import execute_query
+from veilon_core.db import execute_query, query_frame, transaction
+from veilon_core.equity import equity_record_point, equity_record_points
+from veilon_core.timeframes import timeframe_bounds
 from psycopg2.extras import Json
-import streamlit as st
+import numpy as np
 import pandas as pd
 
 def derive_status(row) -> str:
@@ -32,108 +35,85 @@ def derive_status(row) -> str:
     return f"Phase {int(phase)}" if pd.notna(phase) else "Phase 1"
 
 
-def accounts_table(
+def derive_status_frame(df: pd.DataFrame) -> np.ndarray:
+    """derive_status for a whole frame at once (same precedence)."""
+    phase = df["phase"].fillna(1).astype(int).to_numpy()
+    labels = {p: f"Phase {p}" for p in np.unique(phase)}
+    return np.select(
+        [
+            df["closed_at"].notna().to_numpy(),
+            (df["in_review"] == True).to_numpy(bool),  # noqa: E712 -- NULL is not in review
+            ~df["is_enabled"].fillna(False).to_numpy(bool),
+            (df["is_funded"] == True).to_numpy(bool) | df["funded_at"].notna().to_numpy(),  # noqa: E712
+        ],
+        ["Closed", "In Review", "Disabled", "Funded"],
+        default=np.vectorize(labels.get, otypes=[object])(phase) if len(phase) else np.array([], dtype=object),
+    )
+
+
+ACCOUNTS_FRAME_SQL = """
+    SELECT id, user_id, order_id, plan_id, balance::float8 AS balance, phase,
+           is_enabled, is_funded, in_review, created_at, funded_at, closed_at, notes
+    FROM accounts
+    WHERE (%(user_id)s::bigint IS NULL OR user_id = %(user_id)s)
+      AND (%(plan_id)s::bigint IS NULL OR plan_id = %(plan_id)s)
+    ORDER BY id
+    LIMIT %(limit)s;
+"""
+
+
+def accounts_frame(
     user_id: Optional[int] = None,
-    status: Optional[str] = None,      # "Phase 1" | "Funded" | "In Review" | "Closed" | "Disabled"
     plan_id: Optional[int] = None,
-):
-    accounts_rows = execute_query(
-        """
-        SELECT *
-        FROM accounts
-        WHERE (%s IS NULL OR user_id = %s)
-          AND (%s IS NULL OR plan_id = %s)
-        ;
-        """,
-        (user_id, user_id, plan_id, plan_id),
-    )
+    limit: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Accounts with a derived `status`, built through frames.ACCOUNTS_SCHEMA:
+    categorical status, downcast ids, parsed timestamps.
+    """
+    from veilon_core.frames import ACCOUNTS_SCHEMA
 
-    accounts_df = pd.DataFrame(accounts_rows)
-
-    if accounts_df.empty:
-        st.info("No accounts found.")
-        # Keep selection state consistent
-        if st.session_state.get("has_accounts_selection") or st.session_state.get("selected_account_ids"):
-            st.session_state["has_accounts_selection"] = False
-            st.session_state["selected_account_ids"] = []
-        return
-
-    accounts_df["status"] = accounts_df.apply(derive_status, axis=1)
-
-    if status is not None:
-        accounts_df = accounts_df[accounts_df["status"] == status]
-
-        if accounts_df.empty:
-            st.info("No accounts match the selected status.")
-            st.session_state["has_accounts_selection"] = False
-            st.session_state["selected_account_ids"] = []
-            return
-
-
-
-    DISPLAY_COLUMNS = [
-        "id",
-        "user_id",
-        "order_id",
-        "plan_id",
-        "balance",
-        "status",
-        "created_at",
-        "funded_at",
-        "closed_at",
-        "notes",
-    ]
-
-    COLUMN_LABELS = {
-        "id": "Account ID",
-        "user_id": "User ID",
-        "order_id": "Order ID",
-        "plan_id": "Plan ID",
-        "balance": "Balance",
-        "status": "Status",
-        "created_at": "Opened At",
-        "funded_at": "Funded At",
-        "closed_at": "Closed At",
-        "notes": "Notes",
-    }
-
-    df = accounts_df.loc[:, DISPLAY_COLUMNS].copy()
-    df = df.rename(columns=COLUMN_LABELS)
-
-    table = st.dataframe(
-        df,
-        key="accounts_df",
-        on_select="rerun",
-        selection_mode=["single-row"],
-        hide_index=True,
-        column_config={
-            "Balance": st.column_config.NumberColumn("Balance", format="dollar"),
-            "Status": st.column_config.MultiselectColumn(
-                "Status",
-                options=["Phase 1", "Funded", "In Review", "Closed", "Disabled"],
-                color=["#D6EAF8", "#D5F5E3", "#FDEBD0", "#F5B7B1", "#E5E7E9"],
-            ),
-            "Opened At": st.column_config.DatetimeColumn("Opened At", format="DD/MM/YY hh:mm:ss"),
-            "Closed At": st.column_config.DatetimeColumn("Closed At", format="DD/MM/YY hh:mm:ss"),
-            "Funded At": st.column_config.DatetimeColumn("Funded At", format="DD/MM/YY hh:mm:ss"),
-        },
-    )
+    df = query_frame(ACCOUNTS_FRAME_SQL, {"user_id": user_id, "plan_id": plan_id, "limit": limit})
+    df["status"] = derive_status_frame(df)
+    return ACCOUNTS_SCHEMA.apply(df)
 
-    selected_rows = table.selection.get("rows", [])
-    current_is_selected = bool(selected_rows)
 
-    selected_ids = df.iloc[selected_rows]["Account ID"].tolist() if selected_rows else []
+def accounts_kpis(timeframe: str) -> dict:
+    """
+    Accounts page headline numbers: total accounts, accounts opened in
+    the timeframe and funded capital (balances of open funded accounts)
+    at the end of the timeframe -- live for periods running to now, from
+    the daily balance snapshots for past ones -- plus funded capital at
+    its start (None for All Time or without snapshots).
+    """
+    from veilon_core.balances import funded_capital_at
 
-    # ---- Sync + force rerun once on change ----
-    state_changed = (
-        current_is_selected != st.session_state.get("has_accounts_selection", False)
-        or selected_ids != st.session_state.get("selected_account_ids", [])
+    bounds = timeframe_bounds(timeframe)
+    rows = execute_query(
+        """
+        SELECT
+            COUNT(*) AS total_accounts,
+            COUNT(*) FILTER (
+                WHERE (%(start)s::timestamptz IS NULL OR created_at >= %(start)s)
+                  AND created_at < %(end)s
+            ) AS new_accounts,
+            COALESCE(SUM(balance) FILTER (
+                WHERE (COALESCE(is_funded, FALSE) OR funded_at IS NOT NULL)
+                  AND closed_at IS NULL
+            ), 0)::float8 AS total_funded_capital
+        FROM accounts;
+        """,
+        {"start": bounds.start, "end": bounds.end},
     )
+    kpis = dict(rows[0]) if rows else {"total_accounts": 0, "new_accounts": 0, "total_funded_capital": 0}
 
-    if state_changed:
-        st.session_state["has_accounts_selection"] = current_is_selected
-        st.session_state["selected_account_ids"] = selected_ids
-        st.rerun()
+    # Snapshot days are UTC days; day D holds the state at the end of D.
+    if bounds.end.date() < datetime.now(timezone.utc).date():
+        kpis["total_funded_capital"] = funded_capital_at(bounds.end.date() - timedelta(days=1))
+    kpis["funded_capital_start"] = (
+        funded_capital_at(bounds.start.date() - timedelta(days=1)) if bounds.start is not None else None
+    )
+    return kpis
 
 
 def _one(rows: Sequence[dict], err: str) -> dict:
@@ -207,10 +187,74 @@ def account_create(
             "initial_phase": account["phase"],
         },
     )
+    equity_record_point(account["id"], float(account["balance"]))
 
     return account
 
 
+# One account per paid order; accounts.order_id is unique (see
+# stripe_events.STRIPE_DDL), so concurrent callers cannot double-create.
+CREATE_ACCOUNTS_FOR_ORDERS_SQL = """
+    WITH created AS (
+        INSERT INTO accounts (user_id, plan_id, order_id, is_enabled, balance, phase)
+        SELECT o.user_id, p.id, o.id, TRUE, p.account_size, 1
+        FROM orders o
+        JOIN plans p ON p.id = o.plan_id
+        WHERE o.id = ANY(%s)
+        ON CONFLICT (order_id) DO NOTHING
+        RETURNING id, user_id, plan_id, order_id, is_enabled, balance, phase
+    ),
+    logged AS (
+        INSERT INTO account_events (account_id, event_type, actor_type, actor_id, payload)
+        SELECT
+            id, 'account.created', %s, %s,
+            jsonb_build_object(
+                'user_id', user_id,
+                'plan_id', plan_id,
+                'order_id', order_id,
+                'is_enabled', is_enabled,
+                'initial_balance', balance::text,
+                'initial_phase', phase
+            )
+        FROM created
+    )
+    SELECT * FROM created;
+"""
+
+
+def accounts_create_for_orders(
+    order_ids: Sequence[int],
+    *,
+    actor_type: str = "system",
+    actor_id: Optional[int] = None,
+    cursor=None,
+) -> list[dict]:
+    """
+    Set-based account_create for paid orders: one account per order that
+    does not have one yet, with the same account.created event. Safe to
+    call repeatedly with the same orders. Errors are raised so ingestion
+    can retry.
+
+    With `cursor` the accounts are created inside the caller's transaction
+    and the initial equity points are left to the caller (record them with
+    equity_record_points once it commits).
+    """
+    if not order_ids:
+        return []
+
+    if cursor is not None:
+        cursor.execute(CREATE_ACCOUNTS_FOR_ORDERS_SQL, (list(order_ids), actor_type, actor_id))
+        return cursor.fetchall()
+
+    with transaction() as cursor:
+        cursor.execute(CREATE_ACCOUNTS_FOR_ORDERS_SQL, (list(order_ids), actor_type, actor_id))
+        rows = cursor.fetchall()
+
+    if rows:
+        equity_record_points([r["id"] for r in rows], [float(r["balance"]) for r in rows])
+    return rows
+
+
 def account_toggle_active(account_id: int) -> dict:
     """
     Toggle an account's is_enabled flag atomically in SQL.
@@ -284,6 +328,7 @@ def account_set_balance(account_id: int, new_balance: float) -> dict:
         actor_id=None,
         payload={"new_balance": new_balance},
     )
+    equity_record_point(account_id, float(account["balance"]))
 
     return account
 
@@ -311,6 +356,7 @@ def account_adjust_balance(account_id: int, delta: float) -> dict:
         actor_id=None,
         payload={"delta": delta, "new_balance": float(account["balance"])},
     )
+    equity_record_point(account_id, float(account["balance"]))
 
     return account
 
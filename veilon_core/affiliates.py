@@ -0,0 +1,393 @@
+from __future__ import annotations
+import time
+from typing import Optional
+import pandas as pd
+from veilon_core.db import execute_command, execute_query, query_frame, transaction
+from veilon_core.orders import REFUND_EXPR, SETTLED_ORDER_STATUSES, ensure_orders_columns
+from veilon_core.timeframes import timeframe_bounds
+
+# -------------------------------------------------------------------
+# Affiliate commissions.
+#
+# Orders are attributed to an affiliate by coupon code (an affiliate's
+# code used at checkout) or, failing that, by the affiliate that referred
+# the buyer. Settled orders earn a commission at the affiliate's tier rate,
+# where the tier is set by how many commissioned orders the affiliate had
+# before this one (or a per-affiliate override rate).
+#
+# run_commissions() only looks at orders past a persisted id watermark.
+# The watermark never passes an order that is still pending within
+# PENDING_GRACE, so orders that settle shortly after checkout are picked
+# up on a later run. Older pending orders it does pass (async payment
+# methods can take days) are parked in affiliate_pending_orders and
+# commissioned once they settle.
+#
+# Refunds claw back the refunded share of the commission. Clawbacks are
+# driven by orders.refunded_at past a second watermark (re-reading
+# REFUND_OVERLAP before it, for refunds whose transaction committed
+# late), plus the orders commissioned in the same run, which may already
+# have been refunded -- never by rescanning history.
+# -------------------------------------------------------------------
+
+AFFILIATES_DDL = """
+    CREATE TABLE IF NOT EXISTS affiliates (
+        id                 BIGSERIAL     PRIMARY KEY,
+        user_id            BIGINT,
+        code               TEXT          NOT NULL UNIQUE,
+        name               TEXT          NOT NULL,
+        email              TEXT,
+        rate_override_pct  NUMERIC(6, 3),
+        lifetime_orders    INTEGER       NOT NULL DEFAULT 0,
+        is_active          BOOLEAN       NOT NULL DEFAULT TRUE,
+        created_at         TIMESTAMPTZ   NOT NULL DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS affiliate_tiers (
+        min_orders  INTEGER        PRIMARY KEY,
+        rate_pct    NUMERIC(6, 3)  NOT NULL
+    );
+
+    INSERT INTO affiliate_tiers (min_orders, rate_pct)
+    VALUES (1, 10), (25, 12.5), (100, 15)
+    ON CONFLICT DO NOTHING;
+
+    CREATE TABLE IF NOT EXISTS affiliate_ledger (
+        id            BIGSERIAL       PRIMARY KEY,
+        affiliate_id  BIGINT          NOT NULL,
+        order_id      BIGINT          NOT NULL,
+        kind          TEXT            NOT NULL,   -- commission | clawback
+        rate_pct      NUMERIC(6, 3)   NOT NULL,
+        amount        NUMERIC(18, 2)  NOT NULL,   -- clawbacks are negative
+        created_at    TIMESTAMPTZ     NOT NULL DEFAULT NOW(),
+        updated_at    TIMESTAMPTZ     NOT NULL DEFAULT NOW(),
+        UNIQUE (order_id, kind)
+    );
+
+    CREATE INDEX IF NOT EXISTS affiliate_ledger_affiliate_idx
+        ON affiliate_ledger (affiliate_id, created_at);
+
+    CREATE TABLE IF NOT EXISTS affiliate_payouts (
+        id            BIGSERIAL       PRIMARY KEY,
+        affiliate_id  BIGINT          NOT NULL,
+        amount        NUMERIC(18, 2)  NOT NULL,
+        status        TEXT            NOT NULL DEFAULT 'pending',
+        created_at    TIMESTAMPTZ     NOT NULL DEFAULT NOW(),
+        paid_at       TIMESTAMPTZ
+    );
+
+    CREATE TABLE IF NOT EXISTS affiliate_pending_orders (
+        order_id    BIGINT       PRIMARY KEY,
+        parked_at   TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS affiliate_watermarks (
+        name           TEXT         PRIMARY KEY,
+        last_order_id  BIGINT       NOT NULL,
+        updated_at     TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+
+    ALTER TABLE affiliate_watermarks ADD COLUMN IF NOT EXISTS last_at TIMESTAMPTZ;
+
+    ALTER TABLE orders ADD COLUMN IF NOT EXISTS affiliate_id BIGINT;
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS referred_by_affiliate_id BIGINT;
+
+    CREATE INDEX IF NOT EXISTS orders_affiliate_idx ON orders (affiliate_id) WHERE affiliate_id IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS orders_refunded_idx ON orders (id)
+        WHERE affiliate_id IS NOT NULL AND (refunded_amount > 0 OR status = 'refunded');
+    CREATE INDEX IF NOT EXISTS orders_affiliate_refunded_at_idx ON orders (refunded_at)
+        WHERE affiliate_id IS NOT NULL AND refunded_at IS NOT NULL;
+
+    -- Refunds recorded before orders.refunded_at existed.
+    UPDATE orders SET refunded_at = created_at
+    WHERE affiliate_id IS NOT NULL AND (refunded_amount > 0 OR status = 'refunded')
+      AND refunded_at IS NULL;
+"""
+
+# Refunds are re-read this far behind the clawback watermark.
+REFUND_OVERLAP = "10 minutes"
+
+# Pending orders older than this no longer hold the watermark back; they
+# are parked (PARK_PENDING_SQL) until they settle or fail.
+PENDING_GRACE = "1 day"
+
+# Highest id that is safe to process: never past a recent pending order.
+UPPER_BOUND_SQL = """
+    SELECT LEAST(
+        (SELECT COALESCE(MAX(id), 0) FROM orders),
+        (SELECT MIN(id) - 1 FROM orders
+         WHERE id > %(after)s AND status = 'pending' AND created_at > NOW() - %(grace)s::interval),
+        %(after)s + %(chunk)s
+    ) AS upper;
+"""
+
+# Orders in the current id chunk, or parked orders that are no longer pending.
+_CHUNK_FILTER = "{o}.id > %(after)s AND {o}.id <= %(upper)s"
+_SETTLED_LATE_FILTER = "{o}.id = ANY(%(ids)s)"
+
+_ATTRIBUTE = """
+    UPDATE orders o
+    SET affiliate_id = COALESCE(by_code.id, u.referred_by_affiliate_id)
+    FROM orders src
+    LEFT JOIN affiliates by_code ON by_code.code = src.coupon_code AND by_code.is_active
+    LEFT JOIN users u ON u.id = src.user_id
+    WHERE o.id = src.id
+      AND {filter}
+      AND src.affiliate_id IS NULL
+      AND COALESCE(by_code.id, u.referred_by_affiliate_id) IS NOT NULL;
+"""
+
+_COMMISSION = """
+    WITH new_orders AS (
+        SELECT
+            o.id, o.affiliate_id, o.amount, a.rate_override_pct,
+            a.lifetime_orders + ROW_NUMBER() OVER (PARTITION BY o.affiliate_id ORDER BY o.id) AS ordinal
+        FROM orders o
+        JOIN affiliates a ON a.id = o.affiliate_id
+        WHERE {filter}
+          AND o.status = ANY(%(settled)s)
+          AND NOT EXISTS (
+              SELECT 1 FROM affiliate_ledger l WHERE l.order_id = o.id AND l.kind = 'commission'
+          )
+    ),
+    rated AS (
+        SELECT n.*, COALESCE(n.rate_override_pct, t.rate_pct, 0) AS rate_pct
+        FROM new_orders n
+        LEFT JOIN LATERAL (
+            SELECT rate_pct FROM affiliate_tiers
+            WHERE min_orders <= n.ordinal
+            ORDER BY min_orders DESC
+            LIMIT 1
+        ) t ON TRUE
+    ),
+    inserted AS (
+        INSERT INTO affiliate_ledger (affiliate_id, order_id, kind, rate_pct, amount)
+        SELECT affiliate_id, id, 'commission', rate_pct, ROUND(amount * rate_pct / 100, 2)
+        FROM rated
+        ON CONFLICT (order_id, kind) DO NOTHING
+        RETURNING affiliate_id, order_id
+    ),
+    counted AS (
+        UPDATE affiliates a
+        SET lifetime_orders = a.lifetime_orders + c.n
+        FROM (SELECT affiliate_id, COUNT(*) AS n FROM inserted GROUP BY affiliate_id) c
+        WHERE a.id = c.affiliate_id
+    )
+    SELECT order_id FROM inserted;
+"""
+
+ATTRIBUTE_SQL = _ATTRIBUTE.format(filter=_CHUNK_FILTER.format(o="src"))
+COMMISSION_SQL = _COMMISSION.format(filter=_CHUNK_FILTER.format(o="o"))
+ATTRIBUTE_LATE_SQL = _ATTRIBUTE.format(filter=_SETTLED_LATE_FILTER.format(o="src"))
+COMMISSION_LATE_SQL = _COMMISSION.format(filter=_SETTLED_LATE_FILTER.format(o="o"))
+
+# Pending orders the watermark is about to pass.
+PARK_PENDING_SQL = """
+    INSERT INTO affiliate_pending_orders (order_id)
+    SELECT id FROM orders
+    WHERE id > %(after)s AND id <= %(upper)s AND status = 'pending'
+    ON CONFLICT (order_id) DO NOTHING;
+"""
+
+# Parked orders that settled or failed since; failed ones are just dropped.
+UNPARK_SQL = """
+    DELETE FROM affiliate_pending_orders p
+    USING orders o
+    WHERE o.id = p.order_id AND o.status <> 'pending'
+    RETURNING p.order_id;
+"""
+
+# Clawback = refunded share of the commission; grows with partial refunds.
+_CLAWBACK = f"""
+    INSERT INTO affiliate_ledger (affiliate_id, order_id, kind, rate_pct, amount)
+    SELECT
+        l.affiliate_id, r.id, 'clawback', l.rate_pct,
+        -ROUND(l.amount * LEAST(1, r.refunded / NULLIF(r.amount, 0)), 2)
+    FROM (
+        SELECT id, amount, {REFUND_EXPR} AS refunded
+        FROM orders
+        WHERE affiliate_id IS NOT NULL
+          AND (refunded_amount > 0 OR status = 'refunded')
+          AND {{filter}}
+    ) r
+    JOIN affiliate_ledger l ON l.order_id = r.id AND l.kind = 'commission'
+    ON CONFLICT (order_id, kind) DO UPDATE
+    SET amount = EXCLUDED.amount, updated_at = NOW()
+    WHERE affiliate_ledger.amount <> EXCLUDED.amount;
+"""
+
+# Refunds since the clawback watermark (all of them on the first run).
+CLAWBACK_SQL = _CLAWBACK.format(filter="""refunded_at IS NOT NULL
+          AND refunded_at >= COALESCE(%(since)s::timestamptz - %(overlap)s::interval, '-infinity')""")
+# Orders just commissioned, which may have been refunded already.
+CLAWBACK_ORDERS_SQL = _CLAWBACK.format(filter="id = ANY(%(ids)s)")
+
+CLAWBACK_WATERMARK_SQL = """
+    INSERT INTO affiliate_watermarks (name, last_order_id, last_at)
+    VALUES ('clawbacks', 0, NOW())
+    ON CONFLICT (name) DO UPDATE
+    SET last_at = EXCLUDED.last_at, updated_at = NOW();
+"""
+
+
+def ensure_affiliate_tables() -> None:
+    ensure_orders_columns()
+    execute_command(AFFILIATES_DDL)
+
+
+def commission_watermark() -> int:
+    rows = execute_query("SELECT last_order_id FROM affiliate_watermarks WHERE name = 'commissions';")
+    return rows[0]["last_order_id"] if rows else 0
+
+
+def _clawback_commissioned(cursor, order_ids: list[int]) -> int:
+    if not order_ids:
+        return 0
+    cursor.execute(CLAWBACK_ORDERS_SQL, {"ids": order_ids})
+    return cursor.rowcount
+
+
+def run_commissions(chunk_size: int = 200_000) -> dict:
+    """
+    Attribute and commission orders past the watermark in chunks of
+    `chunk_size` ids (one transaction each), then parked orders that have
+    settled since, then clawbacks for refunds since the last run.
+    """
+    t0 = time.perf_counter()
+    after = commission_watermark()
+    start = after
+    attributed = chunks = clawbacks = 0
+
+    while True:
+        with transaction() as cursor:
+            cursor.execute(UPPER_BOUND_SQL, {"after": after, "chunk": chunk_size, "grace": PENDING_GRACE})
+            upper = cursor.fetchone()["upper"]
+            if upper is None or upper <= after:
+                break
+            params = {"after": after, "upper": upper, "settled": list(SETTLED_ORDER_STATUSES)}
+            cursor.execute(ATTRIBUTE_SQL, params)
+            attributed += cursor.rowcount
+            cursor.execute(COMMISSION_SQL, params)
+            clawbacks += _clawback_commissioned(cursor, [r["order_id"] for r in cursor.fetchall()])
+            cursor.execute(PARK_PENDING_SQL, params)
+            cursor.execute(
+                """
+                INSERT INTO affiliate_watermarks (name, last_order_id)
+                VALUES ('commissions', %s)
+                ON CONFLICT (name) DO UPDATE
+                SET last_order_id = EXCLUDED.last_order_id, updated_at = NOW();
+                """,
+                (upper,),
+            )
+        after = upper
+        chunks += 1
+
+    with transaction() as cursor:
+        cursor.execute(UNPARK_SQL)
+        late = [r["order_id"] for r in cursor.fetchall()]
+        if late:
+            params = {"ids": late, "settled": list(SETTLED_ORDER_STATUSES)}
+            cursor.execute(ATTRIBUTE_LATE_SQL, params)
+            attributed += cursor.rowcount
+            cursor.execute(COMMISSION_LATE_SQL, params)
+            clawbacks += _clawback_commissioned(cursor, [r["order_id"] for r in cursor.fetchall()])
+
+    # The watermark is this transaction's NOW(); refunds committed after it
+    # with an earlier refunded_at are re-read through REFUND_OVERLAP.
+    with transaction() as cursor:
+        cursor.execute("SELECT last_at FROM affiliate_watermarks WHERE name = 'clawbacks';")
+        row = cursor.fetchone()
+        cursor.execute(CLAWBACK_SQL, {"since": row["last_at"] if row else None, "overlap": REFUND_OVERLAP})
+        clawbacks += cursor.rowcount
+        cursor.execute(CLAWBACK_WATERMARK_SQL)
+
+    return {
+        "from_order_id": start,
+        "to_order_id": after,
+        "chunks": chunks,
+        "attributed": attributed,
+        "settled_late": len(late),
+        "clawbacks_changed": clawbacks,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def affiliate_balances(affiliate_id: Optional[int] = None) -> pd.DataFrame:
+    """
+    Per affiliate: commissions, clawbacks, paid/pending payouts and the
+    amount still owed.
+    """
+    return query_frame(
+        """
+        SELECT
+            a.id, a.code, a.name, a.lifetime_orders,
+            COALESCE(l.commissions, 0)::float8 AS commissions,
+            COALESCE(l.clawbacks, 0)::float8 AS clawbacks,
+            COALESCE(p.paid, 0)::float8 AS paid,
+            COALESCE(p.pending, 0)::float8 AS pending,
+            (COALESCE(l.commissions, 0) + COALESCE(l.clawbacks, 0)
+                - COALESCE(p.paid, 0) - COALESCE(p.pending, 0))::float8 AS owed
+        FROM affiliates a
+        LEFT JOIN (
+            SELECT affiliate_id,
+                   SUM(amount) FILTER (WHERE kind = 'commission') AS commissions,
+                   SUM(amount) FILTER (WHERE kind = 'clawback') AS clawbacks
+            FROM affiliate_ledger
+            GROUP BY affiliate_id
+        ) l ON l.affiliate_id = a.id
+        LEFT JOIN (
+            SELECT affiliate_id,
+                   SUM(amount) FILTER (WHERE status = 'paid') AS paid,
+                   SUM(amount) FILTER (WHERE status = 'pending') AS pending
+            FROM affiliate_payouts
+            GROUP BY affiliate_id
+        ) p ON p.affiliate_id = a.id
+        WHERE (%(id)s::bigint IS NULL OR a.id = %(id)s)
+        ORDER BY owed DESC;
+        """,
+        {"id": affiliate_id},
+    )
+
+
+def affiliate_kpis(timeframe: str) -> dict:
+    """
+    Payouts page Affiliates tab: paid in the timeframe, pending payout
+    requests plus unrequested balance, and a 30-day forecast from the
+    trailing 30 days of net commissions.
+    """
+    bounds = timeframe_bounds(timeframe)
+    rows = execute_query(
+        """
+        SELECT
+            (SELECT COALESCE(SUM(amount), 0) FROM affiliate_payouts
+             WHERE status = 'paid'
+               AND (%(start)s::timestamptz IS NULL OR paid_at >= %(start)s)
+               AND paid_at < %(end)s) AS paid,
+            (SELECT COALESCE(SUM(amount), 0) FROM affiliate_ledger) -
+            (SELECT COALESCE(SUM(amount), 0) FROM affiliate_payouts WHERE status = 'paid') AS pending,
+            (SELECT COALESCE(SUM(l.amount), 0) FROM affiliate_ledger l
+             JOIN orders o ON o.id = l.order_id
+             WHERE o.created_at >= NOW() - INTERVAL '30 days') AS forecast;
+        """,
+        {"start": bounds.start, "end": bounds.end},
+    )
+    row = rows[0] if rows else {"paid": 0, "pending": 0, "forecast": 0}
+    return {k: float(v) for k, v in row.items()}
+
+
+def affiliate_ledger(affiliate_id: int, limit: int = 200) -> list[dict]:
+    return execute_query(
+        """
+        SELECT l.order_id, l.kind, l.rate_pct, l.amount, o.amount AS order_amount, o.status, l.created_at
+        FROM affiliate_ledger l
+        JOIN orders o ON o.id = l.order_id
+        WHERE l.affiliate_id = %s
+        ORDER BY l.created_at DESC, l.id DESC
+        LIMIT %s;
+        """,
+        (affiliate_id, limit),
+    )
+
+
+if __name__ == "__main__":
+    ensure_affiliate_tables()
+    print(run_commissions())
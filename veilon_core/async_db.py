@@ -0,0 +1,256 @@
+from __future__ import annotations
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Sequence
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
+from psycopg2.extras import Json
+from veilon_core.db import database_settings, query_stats
+
+# -------------------------------------------------------------------
+# asyncio database API for services (equity tracker, ingestion, bulk
+# writers) that run thousands of small statements concurrently.
+#
+# One psycopg 3 connection pool per event loop, built from the same
+# settings as veilon_core.db. Cursors bind parameters client-side, like
+# psycopg2, so the existing *_SQL constants (including untyped
+# "%s IS NULL" guards) work unchanged, and psycopg2 Json params are
+# converted. Statements are recorded in db.query_stats under the same
+# labels as the sync path. Everything goes to the primary; replica
+# routing is sync-only. Unlike db.execute_query, errors are raised.
+#
+#   python -m veilon_core.async_db --writes 5000   # async vs. threaded sync
+# -------------------------------------------------------------------
+
+POOL_MIN_SIZE = 2
+POOL_MAX_SIZE = 20
+POOL_TIMEOUT_SECONDS = 30.0
+
+_pools: dict = {}  # event loop -> Future[AsyncConnectionPool]
+
+
+def _adapt(params):
+    if isinstance(params, dict):
+        return {k: _adapt_value(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_adapt_value(v) for v in params]
+    return params
+
+
+def _adapt_value(value):
+    if isinstance(value, Json):
+        return Jsonb(value.adapted, dumps=value.dumps)
+    return value
+
+
+class _Cursor(psycopg.AsyncClientCursor):
+    """Client-side binding cursor recording into db.query_stats."""
+
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, _adapt(params), **kwargs)
+        finally:
+            query_stats.record(query, time.perf_counter() - started, self.rowcount)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        rows = [_adapt(p) for p in params_seq]
+        started = time.perf_counter()
+        try:
+            return await super().executemany(query, rows, **kwargs)
+        finally:
+            query_stats.record(query, time.perf_counter() - started, len(rows))
+
+
+async def _configure(conn) -> None:
+    query_stats.connected()
+
+
+async def _open_pool() -> AsyncConnectionPool:
+    s = database_settings()
+    pool = AsyncConnectionPool(
+        kwargs={
+            "host": s["host"],
+            "port": s["port"],
+            "dbname": s["database"],
+            "user": s["user"],
+            "password": s["password"],
+            "cursor_factory": _Cursor,
+            "row_factory": dict_row,
+        },
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        timeout=POOL_TIMEOUT_SECONDS,
+        configure=_configure,
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
+async def get_pool() -> AsyncConnectionPool:
+    """The running loop's pool, opened on first use."""
+    loop = asyncio.get_running_loop()
+    future = _pools.get(loop)
+    if future is None:
+        future = _pools[loop] = asyncio.ensure_future(_open_pool())
+    try:
+        return await asyncio.shield(future)
+    except BaseException:
+        if future.done() and future.exception() is not None:
+            _pools.pop(loop, None)
+        raise
+
+
+async def close_pool() -> None:
+    """Closes the running loop's pool; call before the loop ends."""
+    future = _pools.pop(asyncio.get_running_loop(), None)
+    if future is not None:
+        await (await future).close()
+
+
+async def execute_query(query, params=None, fetch_results=True) -> Optional[list[dict]]:
+    """Runs one statement in its own transaction; returns a list of dicts (possibly empty)."""
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            if not fetch_results:
+                return None
+            return await cursor.fetchall() if cursor.description else []
+
+
+async def execute_command(query, params=None) -> int:
+    """Runs one statement and returns the affected row count."""
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            return cursor.rowcount
+
+
+async def execute_batch(query, rows: Sequence) -> int:
+    """
+    Runs `query` once per parameter row in a single transaction. psycopg
+    pipelines executemany, so the batch costs about one round trip rather
+    than one per row. Returns the number of rows sent.
+    """
+    if not rows:
+        return 0
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.executemany(query, rows)
+    return len(rows)
+
+
+async def pipeline(statements: Sequence[tuple]) -> list[list[dict]]:
+    """
+    Sends (query, params) pairs back to back in one transaction without
+    waiting for each result, and returns each statement's rows (an empty
+    list for statements that return none).
+    """
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.pipeline():
+            cursors = []
+            for query, params in statements:
+                cursor = conn.cursor()
+                await cursor.execute(query, params)
+                cursors.append(cursor)
+        return [await c.fetchall() if c.description else [] for c in cursors]
+
+
+@asynccontextmanager
+async def transaction():
+    """
+    Yields a cursor (dict rows) inside one transaction: commits if the
+    block completes, rolls back and re-raises otherwise.
+    """
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            yield cursor
+
+
+BENCH_DDL = """
+    CREATE TABLE IF NOT EXISTS async_db_bench (
+        id       BIGINT PRIMARY KEY,
+        value    NUMERIC(18, 2) NOT NULL,
+        touched  TIMESTAMPTZ    NOT NULL DEFAULT NOW()
+    );
+"""
+
+BENCH_UPSERT_SQL = """
+    INSERT INTO async_db_bench (id, value) VALUES (%s, %s)
+    ON CONFLICT (id) DO UPDATE SET value = EXCLUDED.value, touched = NOW();
+"""
+
+
+def benchmark(writes: int = 5_000, threads: int = 32, batch: int = 500) -> dict:
+    """
+    `writes` single-row upserts three ways: sync execute_command from a
+    thread pool, concurrent async execute_command, and async execute_batch
+    in chunks of `batch`. Uses (and drops) the async_db_bench table.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from veilon_core import db
+
+    db.execute_command(BENCH_DDL)
+    params = [(i, i * 0.01) for i in range(writes)]
+    results = {}
+
+    def timed(name, fn):
+        query_stats.reset()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        stats = query_stats.snapshot()
+        results[name] = {
+            "seconds": round(elapsed, 3),
+            "writes_per_s": round(writes / elapsed),
+            "connections": stats["connections"],
+            "statements": stats["queries"],
+        }
+
+    def sync_threads():
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda p: db.execute_command(BENCH_UPSERT_SQL, p), params))
+
+    async def concurrent():
+        await get_pool()
+        await asyncio.gather(*(execute_command(BENCH_UPSERT_SQL, p) for p in params))
+        await close_pool()
+
+    async def batched():
+        await get_pool()
+        await asyncio.gather(*(execute_batch(BENCH_UPSERT_SQL, params[i:i + batch]) for i in range(0, writes, batch)))
+        await close_pool()
+
+    try:
+        timed(f"sync_{threads}_threads", sync_threads)
+        timed("async_concurrent", lambda: asyncio.run(concurrent()))
+        timed(f"async_batch_{batch}", lambda: asyncio.run(batched()))
+    finally:
+        db.execute_command("DROP TABLE IF EXISTS async_db_bench;")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from veilon_core.config import load_env
+
+    parser = argparse.ArgumentParser(description="Async DB layer benchmark")
+    parser.add_argument("--writes", type=int, default=5_000)
+    parser.add_argument("--threads", type=int, default=32, help="threads for the sync baseline")
+    parser.add_argument("--batch", type=int, default=500, help="rows per execute_batch call")
+    args = parser.parse_args()
+
+    load_env()
+    print(json.dumps(benchmark(args.writes, args.threads, args.batch), indent=2))
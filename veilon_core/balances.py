@@ -0,0 +1,283 @@
+from __future__ import annotations
+import time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Optional
+import pandas as pd
+from veilon_core.db import execute_command, execute_query, query_frame
+
+# -------------------------------------------------------------------
+# Daily account balance snapshots.
+#
+# account_balance_snapshots holds one row per open account per UTC day:
+# the account's state at the end of that day. The nightly job copies the
+# current accounts table in one INSERT ... SELECT shortly after midnight,
+# so a row reflects the state a few minutes into the next day; reruns
+# upsert. The backfill rebuilds past days from account_events instead:
+# every balance write logs the resulting balance (account.created,
+# account.balance.set, account.balance.adjusted), and phase and
+# closed/reopened state come from their own events. Funding has no
+# event, so funded_at is used as of each day.
+#
+# Columns are ordered widest first (8-, 4-, 2-, 1-byte, then NUMERIC) so
+# rows carry no alignment padding. Historical KPIs
+# ("funded capital at month end") are range scans on snapshot_date.
+#
+#   python -m veilon_core.jobs balance-snapshot
+#   python -m veilon_core.jobs balance-backfill --days 365
+#   python -m veilon_core.balances --from 2026-01-01   # daily totals
+# -------------------------------------------------------------------
+
+BALANCE_SNAPSHOTS_DDL = """
+    CREATE TABLE IF NOT EXISTS account_balance_snapshots (
+        account_id     BIGINT          NOT NULL,
+        snapshot_date  DATE            NOT NULL,
+        plan_id        INTEGER,
+        phase          SMALLINT,
+        is_funded      BOOLEAN         NOT NULL,
+        balance        NUMERIC(18, 2)  NOT NULL,
+        PRIMARY KEY (snapshot_date, account_id)
+    );
+
+    -- Funded capital per day is an index-only scan over funded rows.
+    CREATE INDEX IF NOT EXISTS account_balance_snapshots_funded_idx
+        ON account_balance_snapshots (snapshot_date) INCLUDE (balance)
+        WHERE is_funded;
+"""
+
+# State of every account open at the end of %(day)s, taken from the live table.
+SNAPSHOT_BALANCES_SQL = """
+    INSERT INTO account_balance_snapshots (account_id, snapshot_date, plan_id, phase, is_funded, balance)
+    SELECT
+        id,
+        %(day)s,
+        plan_id,
+        phase,
+        COALESCE(is_funded, FALSE) OR funded_at IS NOT NULL,
+        COALESCE(balance, 0)
+    FROM accounts
+    WHERE created_at < %(until)s
+      AND (closed_at IS NULL OR closed_at >= %(until)s)
+    ON CONFLICT (snapshot_date, account_id) DO UPDATE
+    SET plan_id = EXCLUDED.plan_id,
+        phase = EXCLUDED.phase,
+        is_funded = EXCLUDED.is_funded,
+        balance = EXCLUDED.balance;
+"""
+
+# End-of-day state per account and day in [%(first)s, %(last)s], rebuilt
+# from events. Each state-changing event opens an interval [occurred_at,
+# next event) in which balance, phase and closed are carried forward
+# from the latest event that set them (COUNT over the non-NULL values
+# numbers the carry groups). An interval stands for every day D whose end
+# (midnight D+1, UTC) falls inside it, so the intervals of one account
+# yield each day at most once.
+BACKFILL_BALANCES_SQL = """
+    WITH ev AS (
+        SELECT
+            account_id,
+            occurred_at,
+            id,
+            (CASE event_type
+                WHEN 'account.created' THEN payload ->> 'initial_balance'
+                WHEN 'account.balance.set' THEN payload ->> 'new_balance'
+                WHEN 'account.balance.adjusted' THEN payload ->> 'new_balance'
+            END)::numeric AS balance,
+            (CASE event_type
+                WHEN 'account.created' THEN payload ->> 'initial_phase'
+                WHEN 'account.phase.changed' THEN payload ->> 'new_phase'
+            END)::int AS phase,
+            CASE event_type
+                WHEN 'account.created' THEN FALSE
+                WHEN 'account.closed' THEN TRUE
+                WHEN 'account.reopened' THEN FALSE
+            END AS closed
+        FROM account_events
+        WHERE account_id > %(after_id)s AND account_id <= %(upto_id)s
+          AND event_type IN (
+              'account.created', 'account.balance.set', 'account.balance.adjusted',
+              'account.phase.changed', 'account.closed', 'account.reopened'
+          )
+          AND occurred_at < %(until)s
+    ),
+    grouped AS (
+        SELECT
+            *,
+            COUNT(balance) OVER w AS balance_group,
+            COUNT(phase) OVER w AS phase_group,
+            COUNT(closed) OVER w AS closed_group,
+            LEAD(occurred_at) OVER w AS valid_to
+        FROM ev
+        WINDOW w AS (PARTITION BY account_id ORDER BY occurred_at, id)
+    ),
+    states AS (
+        SELECT
+            account_id,
+            occurred_at AS valid_from,
+            COALESCE(valid_to, %(until)s + interval '1 day') AS valid_to,  -- latest state lasts past the range
+            MAX(balance) OVER (PARTITION BY account_id, balance_group) AS balance,
+            MAX(phase) OVER (PARTITION BY account_id, phase_group) AS phase,
+            bool_or(closed) OVER (PARTITION BY account_id, closed_group) AS closed
+        FROM grouped
+    )
+    INSERT INTO account_balance_snapshots (account_id, snapshot_date, plan_id, phase, is_funded, balance)
+    SELECT
+        s.account_id,
+        d.day,
+        a.plan_id,
+        COALESCE(s.phase, a.phase),
+        COALESCE(a.funded_at < (d.day + 1)::timestamp AT TIME ZONE 'UTC', COALESCE(a.is_funded, FALSE)),
+        s.balance
+    FROM states s
+    JOIN accounts a ON a.id = s.account_id
+    -- UTC days. generate_series over dates would pick the timestamptz
+    -- overload (midnight in the session time zone), so step over plain
+    -- timestamps and cast back to date.
+    CROSS JOIN LATERAL (
+        SELECT g::date AS day
+        FROM generate_series(
+            GREATEST(((s.valid_from - interval '1 microsecond') AT TIME ZONE 'UTC')::date, %(first)s::date)::timestamp,
+            LEAST(((s.valid_to - interval '1 microsecond') AT TIME ZONE 'UTC')::date - 1, %(last)s::date)::timestamp,
+            interval '1 day'
+        ) AS g
+    ) d
+    WHERE s.balance IS NOT NULL
+      AND NOT COALESCE(s.closed, FALSE)
+      AND a.created_at < (d.day + 1)::timestamp AT TIME ZONE 'UTC'
+    ON CONFLICT (snapshot_date, account_id) DO UPDATE
+    SET plan_id = EXCLUDED.plan_id,
+        phase = EXCLUDED.phase,
+        is_funded = EXCLUDED.is_funded,
+        balance = EXCLUDED.balance;
+"""
+
+FIRST_EVENT_DAY_SQL = """
+    SELECT (MIN(occurred_at) AT TIME ZONE 'UTC')::date AS day FROM account_events;
+"""
+
+BALANCE_TOTALS_SQL = """
+    SELECT
+        snapshot_date,
+        COUNT(*) AS open_accounts,
+        COUNT(*) FILTER (WHERE is_funded) AS funded_accounts,
+        COALESCE(SUM(balance) FILTER (WHERE is_funded), 0)::float8 AS funded_capital,
+        COALESCE(SUM(balance), 0)::float8 AS total_balance
+    FROM account_balance_snapshots
+    WHERE snapshot_date >= %(first)s AND snapshot_date <= %(last)s
+    GROUP BY snapshot_date
+    ORDER BY snapshot_date;
+"""
+
+FUNDED_CAPITAL_SERIES_SQL = """
+    SELECT snapshot_date, SUM(balance)::float8 AS funded_capital
+    FROM account_balance_snapshots
+    WHERE is_funded AND snapshot_date >= %(first)s AND snapshot_date <= %(last)s
+    GROUP BY snapshot_date
+    ORDER BY snapshot_date;
+"""
+
+# The latest snapshot day on or before %(day)s; the lookback bounds the scan.
+FUNDED_CAPITAL_AT_SQL = """
+    WITH latest AS (
+        SELECT MAX(snapshot_date) AS day
+        FROM account_balance_snapshots
+        WHERE snapshot_date <= %(day)s AND snapshot_date > %(day)s::date - %(lookback)s
+    )
+    SELECT latest.day, COALESCE(SUM(s.balance), 0)::float8 AS funded_capital
+    FROM latest
+    LEFT JOIN account_balance_snapshots s ON s.snapshot_date = latest.day AND s.is_funded
+    WHERE latest.day IS NOT NULL
+    GROUP BY latest.day;
+"""
+
+
+def ensure_balance_snapshots_table() -> None:
+    execute_command(BALANCE_SNAPSHOTS_DDL)
+
+
+def _day_end(day: date) -> datetime:
+    return datetime.combine(day + timedelta(days=1), dtime.min, tzinfo=timezone.utc)
+
+
+def _yesterday() -> date:
+    return datetime.now(timezone.utc).date() - timedelta(days=1)
+
+
+def snapshot_balances(day: Optional[date] = None) -> dict:
+    """
+    Writes the snapshot of `day` (default: yesterday, UTC) from the live
+    accounts table: every account created before the end of the day and
+    not closed by then. Meant to run right after midnight.
+    """
+    day = day or _yesterday()
+    started = time.perf_counter()
+    rows = execute_command(SNAPSHOT_BALANCES_SQL, {"day": day, "until": _day_end(day)})
+    return {"day": day.isoformat(), "accounts": rows, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def backfill_balance_snapshots(
+    account_range: tuple[int, int],
+    days: Optional[int] = None,
+    last_day: Optional[date] = None,
+) -> dict:
+    """
+    Rebuilds snapshots from account_events for accounts in (after_id,
+    upto_id] and the `days` days ending `last_day` (default: yesterday;
+    all days since the first event when `days` is None). Existing rows
+    are overwritten. Run through the chunked balance-backfill job.
+    """
+    last_day = last_day or _yesterday()
+    if days is not None:
+        first_day = last_day - timedelta(days=days - 1)
+    else:
+        rows = execute_query(FIRST_EVENT_DAY_SQL)
+        first_day = rows[0]["day"] if rows and rows[0]["day"] else last_day
+    after_id, upto_id = account_range
+    written = execute_command(BACKFILL_BALANCES_SQL, {
+        "after_id": after_id,
+        "upto_id": upto_id,
+        "first": first_day,
+        "last": last_day,
+        "until": _day_end(last_day),
+    })
+    return {"rows": written, "first_day": first_day.isoformat(), "last_day": last_day.isoformat()}
+
+
+def balance_totals(first: date, last: date) -> pd.DataFrame:
+    """
+    Per snapshot day in [first, last]: open and funded accounts, funded
+    capital and total balance. Reads every row of those days.
+    """
+    return query_frame(BALANCE_TOTALS_SQL, {"first": first, "last": last})
+
+
+def funded_capital_series(first: date, last: date) -> pd.DataFrame:
+    """Funded capital per snapshot day in [first, last]; reads only the funded index."""
+    return query_frame(FUNDED_CAPITAL_SERIES_SQL, {"first": first, "last": last})
+
+
+def funded_capital_at(day: date, lookback_days: int = 7) -> Optional[float]:
+    """
+    Funded capital at the end of `day`, from the latest snapshot at most
+    `lookback_days` earlier; None when there is none.
+    """
+    rows = execute_query(FUNDED_CAPITAL_AT_SQL, {"day": day, "lookback": lookback_days})
+    return rows[0]["funded_capital"] if rows else None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from veilon_core.config import load_env
+
+    parser = argparse.ArgumentParser(description="Daily balance snapshot totals")
+    parser.add_argument("--from", dest="first", type=date.fromisoformat, help="first day (default: 30 days ago)")
+    parser.add_argument("--to", dest="last", type=date.fromisoformat, help="last day (default: yesterday)")
+    args = parser.parse_args()
+
+    load_env()
+    last = args.last or _yesterday()
+    first = args.first or last - timedelta(days=29)
+    started = time.perf_counter()
+    totals = balance_totals(first, last)
+    print(totals.to_string(index=False))
+    print(f"{len(totals)} days in {(time.perf_counter() - started) * 1000:.1f} ms")
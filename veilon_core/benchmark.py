@@ -0,0 +1,225 @@
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+# -------------------------------------------------------------------
+# Page benchmark suite.
+#
+# Drives the real pages with Streamlit's AppTest against the configured
+# database (DB_* in the environment / .env): `sessions` concurrent
+# sessions per scenario, each doing one cold run and `reruns` timed
+# reruns. Every scenario runs in a fresh interpreter so peak RSS and
+# caches are its own. Reported per scenario: rerun latency percentiles,
+# statements and connections per run (db.query_stats, which counts the
+# async path too) and peak RSS.
+#
+# Results are compared to benchmark_thresholds.json under the dataset
+# scale (10k / 100k / 1m accounts); any metric above its ceiling is a
+# regression and the CLI exits 1. A scale with no recorded ceilings
+# fails too, so an unrecorded scale never reads as a pass. Only 10k has
+# ceilings so far; 100k and 1m gate nothing until they are recorded on a
+# generated dataset of that size:
+#
+#   python -m veilon_core.synthetic --dsn "dbname=veilon_bench" --mark-scratch --accounts 100000
+#   DB_NAME=veilon_bench python -m veilon_core.benchmark --scale 100k --update-thresholds
+#
+#   python -m veilon_core.benchmark --scale 100k --sessions 16
+#   python -m veilon_core.benchmark --scale 10k --update-thresholds
+# -------------------------------------------------------------------
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+THRESHOLDS_PATH = BASE_DIR / "benchmark_thresholds.json"
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SCALE_TOLERANCE = 0.5        # accounts may be within +-50% of the scale
+THRESHOLD_HEADROOM = 1.5     # --update-thresholds writes measured * headroom
+CHECKED_METRICS = ("p95_ms", "queries_per_run", "connections_per_run", "peak_rss_mb")
+
+# Pages run as a logged-in user, as they would behind app.py's auth gate.
+_LOGIN = (
+    "from streamlit.runtime.scriptrunner import get_script_run_ctx\n"
+    "get_script_run_ctx().user_info.update(is_logged_in=True, email='bench@example.com', given_name='Bench')\n"
+)
+
+# name -> (script, session_state set before the first run)
+SCENARIOS = {
+    "accounts": ("import pages.accounts as p\np.accounts_page()\n", {}),
+    "orders": ("import pages.orders as p\np.orders_page()\n", {}),
+    "dashboard": ("import pages.dashboard as p\np.dashboard_page()\n", {}),
+    "account_actions": (
+        "import pages.accounts as p\np.account_actions_dialog()\n",
+        {"selected_account_ids": "$account_id"},
+    ),
+}
+
+SAMPLE_ACCOUNT_SQL = """
+    SELECT id FROM accounts
+    WHERE closed_at IS NULL
+    ORDER BY id DESC
+    LIMIT %s;
+"""
+
+ACCOUNT_COUNT_SQL = "SELECT COUNT(*) AS n FROM accounts;"
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run_scenario(name: str, sessions: int = 8, reruns: int = 5, timeout: float = 120.0) -> dict:
+    """Runs one scenario in this process; see the module comment."""
+    import resource
+
+    from streamlit.testing.v1 import AppTest
+    from veilon_core.db import execute_query, query_stats
+
+    script, state = SCENARIOS[name]
+    accounts = [r["id"] for r in execute_query(SAMPLE_ACCOUNT_SQL, (sessions,))] or [None]
+
+    def session(i: int) -> dict:
+        at = AppTest.from_string(_LOGIN + script, default_timeout=timeout)
+        for key, value in state.items():
+            at.session_state[key] = [accounts[i % len(accounts)]] if value == "$account_id" else value
+        times, errors = [], 0
+        for _ in range(reruns + 1):
+            started = time.perf_counter()
+            at.run()
+            times.append((time.perf_counter() - started) * 1000)
+            errors += len(at.exception)
+        return {"first_ms": times[0], "rerun_ms": times[1:], "errors": errors}
+
+    query_stats.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(sessions) as pool:
+        results = list(pool.map(session, range(sessions)))
+    wall = time.perf_counter() - started
+    stats = query_stats.snapshot()
+
+    runs = sessions * (reruns + 1)
+    rerun_ms = [t for r in results for t in r["rerun_ms"]]
+    return {
+        "scenario": name,
+        "sessions": sessions,
+        "reruns": reruns,
+        "errors": sum(r["errors"] for r in results),
+        "first_p50_ms": round(_percentile([r["first_ms"] for r in results], 0.5), 1),
+        "p50_ms": round(_percentile(rerun_ms, 0.5), 1),
+        "p95_ms": round(_percentile(rerun_ms, 0.95), 1),
+        "p99_ms": round(_percentile(rerun_ms, 0.99), 1),
+        "runs_per_s": round(runs / wall, 1),
+        "queries_per_run": round(stats["queries"] / runs, 2),
+        "connections_per_run": round(stats["connections"] / runs, 2),
+        "rows_per_run": round(stats["rows"] / runs, 1),
+        "db_ms_per_run": round(1000 * stats["seconds"] / runs, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "top_queries": list(stats["by_label"].items())[:5],
+    }
+
+
+def _run_isolated(name: str, sessions: int, reruns: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "veilon_core.benchmark", "--scenario", name,
+         "--sessions", str(sessions), "--reruns", str(reruns)],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": str(BASE_DIR)},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Scenario {name!r} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def load_thresholds(path: Path = THRESHOLDS_PATH) -> dict:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def check_thresholds(scale: str, results: list[dict], thresholds: dict) -> list[str]:
+    """Regressions as readable lines; scenarios or metrics without a ceiling are skipped."""
+    if scale not in thresholds:
+        return [
+            f"no ceilings recorded for {scale!r}; record a baseline on a generated {scale} dataset "
+            f"with --update-thresholds first"
+        ]
+    problems = []
+    for result in results:
+        ceilings = thresholds.get(scale, {}).get(result["scenario"], {})
+        if result["errors"]:
+            problems.append(f"{result['scenario']}: {result['errors']} exceptions raised by the page")
+        for metric, ceiling in ceilings.items():
+            if result.get(metric, 0) > ceiling:
+                problems.append(f"{result['scenario']}: {metric} {result[metric]} > {ceiling}")
+    return problems
+
+
+def update_thresholds(scale: str, results: list[dict], path: Path = THRESHOLDS_PATH) -> dict:
+    thresholds = load_thresholds(path)
+    section = thresholds.setdefault(scale, {})
+    for result in results:
+        section[result["scenario"]] = {
+            metric: round(result[metric] * THRESHOLD_HEADROOM, 2) for metric in CHECKED_METRICS
+        }
+    path.write_text(json.dumps(thresholds, indent=2, sort_keys=True) + "\n")
+    return thresholds
+
+
+def run_suite(
+    scale: str,
+    scenarios: Optional[list[str]] = None,
+    sessions: int = 8,
+    reruns: int = 5,
+) -> dict:
+    """Checks the dataset size against `scale`, then runs each scenario isolated."""
+    from veilon_core.db import execute_query
+
+    rows = execute_query(ACCOUNT_COUNT_SQL)
+    accounts = rows[0]["n"] if rows else 0
+    expected = SCALES[scale]
+    if abs(accounts - expected) > expected * SCALE_TOLERANCE:
+        raise RuntimeError(
+            f"Database has {accounts} accounts; scale {scale!r} expects about {expected}. "
+            f"Seed a scratch database with: python -m veilon_core.synthetic --dsn ... --accounts {expected} --truncate"
+        )
+    results = []
+    for name in scenarios or list(SCENARIOS):
+        print(f"[benchmark] {name}: {sessions} sessions x {reruns} reruns", file=sys.stderr, flush=True)
+        results.append(_run_isolated(name, sessions, reruns))
+    return {"scale": scale, "accounts": accounts, "results": results}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from veilon_core.config import load_env
+
+    parser = argparse.ArgumentParser(description="Multi-session page benchmarks")
+    parser.add_argument("--scale", choices=list(SCALES), default="10k")
+    parser.add_argument("--only", nargs="*", choices=list(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions per scenario")
+    parser.add_argument("--reruns", type=int, default=5, help="timed reruns per session")
+    parser.add_argument("--update-thresholds", action="store_true", help="write ceilings from this run")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), help=argparse.SUPPRESS)  # child process
+    args = parser.parse_args()
+
+    load_env()
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.sessions, args.reruns)))
+        sys.exit(0)
+
+    report = run_suite(args.scale, args.only, args.sessions, args.reruns)
+    if args.update_thresholds:
+        update_thresholds(args.scale, report["results"])
+        report["problems"] = []
+    else:
+        report["problems"] = check_thresholds(args.scale, report["results"], load_thresholds())
+    print(json.dumps(report, indent=2, default=str))
+    sys.exit(1 if report["problems"] else 0)
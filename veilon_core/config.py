@@ -1,59 +1,76 @@
 import os
 from pathlib import Path
 
-from dotenv import load_dotenv
-
 # -------------------------------------------------------------------
-# Locate and load .env at project root: veilon/.env
+# Locate .env at project root: veilon/.env
+#
+# Nothing is read at import. The first attribute access loads .env once
+# (module __getattr__), and each section is validated only when one of
+# its names is used, so a process that only needs METAAPI_TOKEN does not
+# fail on missing DB variables and the UI never imports dotenv at all.
 # -------------------------------------------------------------------
 BASE_DIR = Path(__file__).resolve().parent.parent  # .../veilon
 ENV_PATH = BASE_DIR / ".env"
 
-load_dotenv(ENV_PATH)
+_loaded = False
+
+
+def load_env() -> None:
+    global _loaded
+    if not _loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv(ENV_PATH)
+        _loaded = True
 
 
 # -------------------------------------------------------------------
 # DATABASE CONFIG (required)
 # -------------------------------------------------------------------
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-
-_required_db = {
-    "DB_HOST": DB_HOST,
-    "DB_PORT": DB_PORT,
-    "DB_NAME": DB_NAME,
-    "DB_USER": DB_USER,
-    "DB_PASSWORD": DB_PASSWORD,
-}
+_DB_NAMES = ("DB_HOST", "DB_PORT", "DB_NAME", "DB_USER", "DB_PASSWORD")
 
-_missing_db = [k for k, v in _required_db.items() if not v]
-if _missing_db:
-    raise RuntimeError(
-        f"Missing required DB environment variables: {', '.join(_missing_db)}. "
-        "Check your .env file."
-    )
+
+def database_config() -> dict:
+    """DB_* values from the environment; raises if any is missing."""
+    values = {k: os.getenv(k) for k in _DB_NAMES}
+    missing = [k for k, v in values.items() if not v]
+    if missing:
+        raise RuntimeError(
+            f"Missing required DB environment variables: {', '.join(missing)}. "
+            "Check your .env file."
+        )
+    return values
+
+
+# -------------------------------------------------------------------
+# OPTIONAL: read replicas
+# DB_REPLICAS is a ";"-separated list of libpq DSNs; fields left out are
+# taken from the primary (e.g. "host=replica1;host=replica2 port=6432").
+# -------------------------------------------------------------------
+def replica_config() -> dict:
+    return {
+        "DB_REPLICAS": [d.strip() for d in os.getenv("DB_REPLICAS", "").split(";") if d.strip()],
+        "DB_REPLICA_MAX_LAG_SECONDS": os.getenv("DB_REPLICA_MAX_LAG_SECONDS"),
+    }
 
 
 # -------------------------------------------------------------------
 # AUTH / GOOGLE OAUTH CONFIG (optional here)
 # -------------------------------------------------------------------
-AUTH_REDIRECT_URI = os.getenv("AUTH_REDIRECT_URI")
-AUTH_COOKIE_SECRET = os.getenv("AUTH_COOKIE_SECRET")
-AUTH_CLIENT_ID = os.getenv("AUTH_CLIENT_ID")
-AUTH_CLIENT_SECRET = os.getenv("AUTH_CLIENT_SECRET")
-AUTH_SERVER_METADATA_URL = os.getenv("AUTH_SERVER_METADATA_URL")
-
-AUTH_CONFIG = {
-    "redirect_uri": AUTH_REDIRECT_URI,
-    "cookie_secret": AUTH_COOKIE_SECRET,
-    "client_id": AUTH_CLIENT_ID,
-    "client_secret": AUTH_CLIENT_SECRET,
-    "server_metadata_url": AUTH_SERVER_METADATA_URL,
+_AUTH_NAMES = {
+    "AUTH_REDIRECT_URI": "redirect_uri",
+    "AUTH_COOKIE_SECRET": "cookie_secret",
+    "AUTH_CLIENT_ID": "client_id",
+    "AUTH_CLIENT_SECRET": "client_secret",
+    "AUTH_SERVER_METADATA_URL": "server_metadata_url",
 }
 
+
+def _auth():
+    values = {k: os.getenv(k) for k in _AUTH_NAMES}
+    values["AUTH_CONFIG"] = {key: values[name] for name, key in _AUTH_NAMES.items()}
+    return values
+
 # NOTE: no hard failure here. Your auth layer should validate AUTH_CONFIG
 # and raise with a clean error if anything critical is missing.
 
@@ -61,7 +78,34 @@ AUTH_CONFIG = {
 # -------------------------------------------------------------------
 # OPTIONAL: MetaAPI Token
 # -------------------------------------------------------------------
-METAAPI_TOKEN = os.getenv("METAAPI_TOKEN")
+def _metaapi():
+    token = os.getenv("METAAPI_TOKEN")
+    if token is None:
+        print("[WARN] METAAPI_TOKEN not found. Risk/Equity streaming may not work")
+    return {"METAAPI_TOKEN": token}
+
+
+# -------------------------------------------------------------------
+# OPTIONAL: Stripe webhook signing secret
+# -------------------------------------------------------------------
+def _stripe():
+    return {"STRIPE_WEBHOOK_SECRET": os.getenv("STRIPE_WEBHOOK_SECRET")}
+
+
+_SECTIONS = {
+    **dict.fromkeys(_DB_NAMES, database_config),
+    **dict.fromkeys(("DB_REPLICAS", "DB_REPLICA_MAX_LAG_SECONDS"), replica_config),
+    **dict.fromkeys([*_AUTH_NAMES, "AUTH_CONFIG"], _auth),
+    "METAAPI_TOKEN": _metaapi,
+    "STRIPE_WEBHOOK_SECRET": _stripe,
+}
+
 
-if METAAPI_TOKEN is None:
-    print("[WARN] METAAPI_TOKEN not found. Risk/Equity streaming may not work")
\ No newline at end of file
+def __getattr__(name):
+    section = _SECTIONS.get(name)
+    if section is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    load_env()
+    values = section()
+    globals().update(values)  # later lookups skip __getattr__
+    return values[name]
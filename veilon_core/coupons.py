@@ -0,0 +1,516 @@
+from __future__ import annotations
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional, Sequence
+from veilon_core.db import execute_command, execute_query, transaction
+
+# -------------------------------------------------------------------
+# Coupons: checkout-time validation and redemption.
+#
+# Coupon rules (discount, plan restriction, validity window, caps) change
+# rarely and are read on every checkout, so validate_coupon() works on an
+# in-process copy of the table and never touches the database. Writes go
+# through this module and bump coupon_rules_version in the same
+# transaction; the local cache is dropped immediately and other processes
+# pick the change up within VERSION_CHECK_SECONDS.
+#
+# Usage counters are not cached. redeem_coupon() claims a use with one
+# conditional UPDATE (redemptions < max_redemptions) so concurrent
+# checkouts can never push a coupon past its cap, whatever the cache says.
+# Orders paid through Stripe are recorded after the fact by
+# coupon_record_order_redemptions(): the money is taken by then, so the
+# use is counted even past the cap, once per order.
+# -------------------------------------------------------------------
+
+VERSION_CHECK_SECONDS = 5.0
+# Redemptions in flight per process; each holds its own connection, so
+# bursts queue here rather than exhausting max_connections.
+MAX_CONCURRENT_REDEMPTIONS = 32
+
+COUPON_KINDS = ("percent", "fixed")
+
+COUPONS_DDL = """
+    CREATE TABLE IF NOT EXISTS coupons (
+        id                BIGSERIAL       PRIMARY KEY,
+        code              TEXT            NOT NULL UNIQUE,
+        kind              TEXT            NOT NULL DEFAULT 'percent',   -- percent | fixed
+        value             NUMERIC(18, 2)  NOT NULL,
+        plan_ids          BIGINT[],                                     -- NULL: any plan
+        min_amount        NUMERIC(18, 2)  NOT NULL DEFAULT 0,
+        max_redemptions   INTEGER,                                      -- NULL: unlimited
+        per_user_limit    INTEGER,                                      -- NULL: unlimited
+        redemptions       INTEGER         NOT NULL DEFAULT 0,
+        starts_at         TIMESTAMPTZ,
+        expires_at        TIMESTAMPTZ,
+        is_active         BOOLEAN         NOT NULL DEFAULT TRUE,
+        created_at        TIMESTAMPTZ     NOT NULL DEFAULT NOW(),
+        updated_at        TIMESTAMPTZ     NOT NULL DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS coupon_user_redemptions (
+        coupon_id  BIGINT   NOT NULL,
+        user_id    BIGINT   NOT NULL,
+        uses       INTEGER  NOT NULL DEFAULT 0,
+        PRIMARY KEY (coupon_id, user_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS coupon_redemptions (
+        id          BIGSERIAL       PRIMARY KEY,
+        coupon_id   BIGINT          NOT NULL,
+        user_id     BIGINT,
+        order_id    BIGINT,
+        amount_off  NUMERIC(18, 2)  NOT NULL,
+        created_at  TIMESTAMPTZ     NOT NULL DEFAULT NOW()
+    );
+
+    CREATE INDEX IF NOT EXISTS coupon_redemptions_coupon_idx ON coupon_redemptions (coupon_id, created_at DESC);
+    CREATE UNIQUE INDEX IF NOT EXISTS coupon_redemptions_order_key
+        ON coupon_redemptions (order_id) WHERE order_id IS NOT NULL;
+
+    CREATE TABLE IF NOT EXISTS coupon_rules_version (
+        id       BOOLEAN  PRIMARY KEY DEFAULT TRUE CHECK (id),
+        version  BIGINT   NOT NULL
+    );
+
+    INSERT INTO coupon_rules_version (id, version) VALUES (TRUE, 1) ON CONFLICT DO NOTHING;
+"""
+
+COUPON_COLUMNS = (
+    "code", "kind", "value", "plan_ids", "min_amount", "max_redemptions",
+    "per_user_limit", "starts_at", "expires_at", "is_active",
+)
+
+BUMP_VERSION_SQL = "UPDATE coupon_rules_version SET version = version + 1;"
+
+# Per-user claim, then global claim; both are conditional increments on
+# locked rows. No row back means a limit was hit and the caller rolls back.
+REDEEM_SQL = """
+    WITH per_user AS (
+        INSERT INTO coupon_user_redemptions (coupon_id, user_id, uses)
+        SELECT %(coupon_id)s, %(user_id)s, 1
+        WHERE %(user_id)s::bigint IS NOT NULL AND %(per_user_limit)s::int IS NOT NULL
+        ON CONFLICT (coupon_id, user_id) DO UPDATE
+        SET uses = coupon_user_redemptions.uses + 1
+        WHERE coupon_user_redemptions.uses < %(per_user_limit)s
+        RETURNING uses
+    ),
+    claimed AS (
+        UPDATE coupons
+        SET redemptions = redemptions + 1
+        WHERE id = %(coupon_id)s
+          AND is_active
+          AND (max_redemptions IS NULL OR redemptions < max_redemptions)
+          AND (starts_at IS NULL OR starts_at <= NOW())
+          AND (expires_at IS NULL OR expires_at > NOW())
+          AND (
+              %(user_id)s::bigint IS NULL OR %(per_user_limit)s::int IS NULL
+              OR EXISTS (SELECT 1 FROM per_user)
+          )
+        RETURNING id, redemptions
+    )
+    INSERT INTO coupon_redemptions (coupon_id, user_id, order_id, amount_off)
+    SELECT id, %(user_id)s, %(order_id)s, %(amount_off)s
+    FROM claimed
+    RETURNING id, (SELECT redemptions FROM claimed) AS redemptions;
+"""
+
+# One redemption per paid order carrying a known coupon code; orders
+# already recorded are skipped, and only new rows bump the counters.
+RECORD_ORDER_REDEMPTIONS_SQL = """
+    WITH o AS (
+        SELECT c.id AS coupon_id, o.user_id, o.id AS order_id, COALESCE(o.discount_amount, 0) AS amount_off
+        FROM orders o
+        JOIN coupons c ON c.code = UPPER(BTRIM(o.coupon_code))
+        WHERE o.id = ANY(%s)
+    ),
+    recorded AS (
+        INSERT INTO coupon_redemptions (coupon_id, user_id, order_id, amount_off)
+        SELECT coupon_id, user_id, order_id, amount_off FROM o
+        ON CONFLICT (order_id) WHERE order_id IS NOT NULL DO NOTHING
+        RETURNING coupon_id, user_id
+    ),
+    per_user AS (
+        INSERT INTO coupon_user_redemptions (coupon_id, user_id, uses)
+        SELECT coupon_id, user_id, COUNT(*) FROM recorded
+        WHERE user_id IS NOT NULL
+        GROUP BY coupon_id, user_id
+        ON CONFLICT (coupon_id, user_id) DO UPDATE
+        SET uses = coupon_user_redemptions.uses + EXCLUDED.uses
+    )
+    UPDATE coupons c
+    SET redemptions = c.redemptions + r.n
+    FROM (SELECT coupon_id, COUNT(*) AS n FROM recorded GROUP BY coupon_id) r
+    WHERE c.id = r.coupon_id
+    RETURNING c.id, r.n;
+"""
+
+
+@dataclass(frozen=True)
+class Coupon:
+    id: int
+    code: str
+    kind: str
+    value: Decimal
+    plan_ids: Optional[frozenset]
+    min_amount: Decimal
+    max_redemptions: Optional[int]
+    per_user_limit: Optional[int]
+    starts_at: Optional[datetime]
+    expires_at: Optional[datetime]
+    is_active: bool
+
+    def discount(self, amount: Decimal) -> Decimal:
+        if self.kind == "percent":
+            off = amount * self.value / 100
+        else:
+            off = self.value
+        return min(amount, off).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+@dataclass(frozen=True)
+class CouponCheck:
+    ok: bool
+    code: str
+    reason: Optional[str] = None
+    amount: Optional[Decimal] = None
+    discount: Decimal = Decimal("0")
+    final_amount: Optional[Decimal] = None
+    coupon_id: Optional[int] = None
+    redemption_id: Optional[int] = None
+
+
+def normalize_code(code: str) -> str:
+    return code.strip().upper()
+
+
+class CouponCache:
+    """
+    Code -> Coupon map, reloaded whenever coupon_rules_version moves. The
+    version is polled at most once per `check_interval`; invalidate()
+    forces the next lookup to reload.
+    """
+
+    def __init__(self, check_interval: float = VERSION_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._coupons: dict[str, Coupon] = {}
+        self._version: Optional[int] = None
+        self._checked_at = float("-inf")
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version = None
+            self._checked_at = float("-inf")
+
+    def get(self, code: str) -> Optional[Coupon]:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self._refresh()
+        return self._coupons.get(normalize_code(code))
+
+    def _refresh(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return  # another thread refreshed while we waited
+            rows = execute_query("SELECT version FROM coupon_rules_version;")
+            version = rows[0]["version"] if rows else None
+            if version is None or version != self._version:
+                self._coupons = {c.code: c for c in _load_coupons()}
+                self._version = version
+            self._checked_at = time.monotonic()
+
+
+def _load_coupons() -> list[Coupon]:
+    rows = execute_query(
+        f"SELECT id, {', '.join(COUPON_COLUMNS)} FROM coupons;"
+    )
+    return [
+        Coupon(
+            id=r["id"],
+            code=normalize_code(r["code"]),
+            kind=r["kind"],
+            value=r["value"],
+            plan_ids=frozenset(r["plan_ids"]) if r["plan_ids"] is not None else None,
+            min_amount=r["min_amount"],
+            max_redemptions=r["max_redemptions"],
+            per_user_limit=r["per_user_limit"],
+            starts_at=r["starts_at"],
+            expires_at=r["expires_at"],
+            is_active=r["is_active"],
+        )
+        for r in rows
+    ]
+
+
+_cache = CouponCache()
+_redeem_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REDEMPTIONS)
+
+
+def get_coupon_cache() -> CouponCache:
+    return _cache
+
+
+def ensure_coupon_tables() -> None:
+    execute_command(COUPONS_DDL)
+
+
+def _check(code: str, plan_id: Optional[int], amount, now: Optional[datetime]) -> tuple[CouponCheck, Optional[Coupon]]:
+    code = normalize_code(code)
+    amount = Decimal(str(amount))
+    coupon = _cache.get(code)
+    now = now or datetime.now(timezone.utc)
+
+    reason = None
+    if coupon is None:
+        reason = "unknown"
+    elif not coupon.is_active:
+        reason = "inactive"
+    elif coupon.starts_at and now < coupon.starts_at:
+        reason = "not_started"
+    elif coupon.expires_at and now >= coupon.expires_at:
+        reason = "expired"
+    elif coupon.plan_ids is not None and plan_id not in coupon.plan_ids:
+        reason = "plan_not_eligible"
+    elif amount < coupon.min_amount:
+        reason = "below_minimum"
+
+    if reason:
+        return CouponCheck(ok=False, code=code, reason=reason, amount=amount, final_amount=amount), coupon
+
+    discount = coupon.discount(amount)
+    check = CouponCheck(
+        ok=True,
+        code=code,
+        amount=amount,
+        discount=discount,
+        final_amount=amount - discount,
+        coupon_id=coupon.id,
+    )
+    return check, coupon
+
+
+def validate_coupon(
+    code: str,
+    plan_id: Optional[int],
+    amount,
+    now: Optional[datetime] = None,
+) -> CouponCheck:
+    """
+    Checks `code` against the cached rules for a checkout of `amount` on
+    `plan_id`. Caps are only checked by redeem_coupon(), which is the
+    authority; this never hits the database on a warm cache.
+    """
+    return _check(code, plan_id, amount, now)[0]
+
+
+def redeem_coupon(
+    code: str,
+    plan_id: Optional[int],
+    amount,
+    *,
+    user_id: Optional[int] = None,
+    order_id: Optional[int] = None,
+) -> CouponCheck:
+    """
+    Validates from the cache, then claims one use atomically. Returns the
+    check with redemption_id set, or ok=False with reason "exhausted" when
+    a global or per-user cap (or a change not yet in the cache) stopped it.
+    """
+    check, coupon = _check(code, plan_id, amount, None)
+    if not check.ok:
+        return check
+
+    with _redeem_slots, transaction() as cursor:
+        cursor.execute(
+            REDEEM_SQL,
+            {
+                "coupon_id": check.coupon_id,
+                "user_id": user_id,
+                "order_id": order_id,
+                "per_user_limit": coupon.per_user_limit,
+                "amount_off": check.discount,
+            },
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # Undo a per-user claim made before the global cap refused.
+            cursor.connection.rollback()
+            return replace(check, ok=False, reason="exhausted", discount=Decimal("0"), final_amount=check.amount)
+    return replace(check, redemption_id=row["id"])
+
+
+def coupon_record_order_redemptions(order_ids: Sequence[int], *, cursor=None) -> int:
+    """
+    Records the coupon use of paid orders (idempotent per order). With
+    `cursor` it runs in the caller's transaction. Returns how many new
+    redemptions were counted.
+    """
+    if not order_ids:
+        return 0
+    if cursor is not None:
+        cursor.execute(RECORD_ORDER_REDEMPTIONS_SQL, (list(order_ids),))
+        return sum(r["n"] for r in cursor.fetchall())
+    with transaction() as cursor:
+        cursor.execute(RECORD_ORDER_REDEMPTIONS_SQL, (list(order_ids),))
+        return sum(r["n"] for r in cursor.fetchall())
+
+
+def _write(sql: str, params) -> list[dict]:
+    with transaction() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall() if cursor.description else []
+        cursor.execute(BUMP_VERSION_SQL)
+    _cache.invalidate()
+    return rows
+
+
+def coupon_create(code: str, kind: str, value, **fields) -> int:
+    if kind not in COUPON_KINDS:
+        raise ValueError(f"Unknown coupon kind {kind!r}; expected one of {COUPON_KINDS}.")
+    values = {"code": normalize_code(code), "kind": kind, "value": value, **fields}
+    unknown = set(values) - set(COUPON_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown coupon fields: {sorted(unknown)}")
+    columns = list(values)
+    rows = _write(
+        f"INSERT INTO coupons ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) RETURNING id;",
+        [values[c] for c in columns],
+    )
+    return rows[0]["id"]
+
+
+def coupon_update(coupon_id: int, **fields) -> None:
+    unknown = set(fields) - set(COUPON_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown coupon fields: {sorted(unknown)}")
+    if not fields:
+        return
+    if "code" in fields:
+        fields["code"] = normalize_code(fields["code"])
+    assignments = ", ".join(f"{c} = %s" for c in fields)
+    _write(
+        f"UPDATE coupons SET {assignments}, updated_at = NOW() WHERE id = %s;",
+        [*fields.values(), coupon_id],
+    )
+
+
+def coupon_set_active(coupon_id: int, is_active: bool) -> None:
+    coupon_update(coupon_id, is_active=is_active)
+
+
+def coupon_list() -> list[dict]:
+    return execute_query(
+        """
+        SELECT c.id, c.code, c.kind, c.value, c.plan_ids, c.min_amount,
+               c.max_redemptions, c.per_user_limit, c.redemptions,
+               COALESCE(SUM(r.amount_off), 0) AS discount_given,
+               c.starts_at, c.expires_at, c.is_active, c.created_at
+        FROM coupons c
+        LEFT JOIN coupon_redemptions r ON r.coupon_id = c.id
+        GROUP BY c.id
+        ORDER BY c.created_at DESC;
+        """
+    )
+
+
+def benchmark(redemptions: int = 2_000, cap: int = 500, per_user_limit: int = 2, workers: int = 200) -> dict:
+    """
+    Fires `redemptions` concurrent redeem_coupon() calls at a fresh coupon
+    capped at `cap` (and `per_user_limit` per user) and checks that exactly
+    the capped number succeeded. Warm-cache validation is timed from a
+    separate thread while the redemptions run, as checkout sees it.
+    Only runs against a database marked as scratch; the coupon is
+    deactivated afterwards.
+    """
+    from veilon_core.synthetic import require_scratch_database
+
+    require_scratch_database()
+    ensure_coupon_tables()
+    code = f"BENCH{time.time_ns()}"
+    coupon_id = coupon_create(code, "percent", 10, max_redemptions=cap, per_user_limit=per_user_limit)
+    try:
+        return _benchmark(code, coupon_id, redemptions, cap, per_user_limit, workers)
+    finally:
+        coupon_set_active(coupon_id, False)
+
+
+def _benchmark(code: str, coupon_id: int, redemptions: int, cap: int, per_user_limit: int, workers: int) -> dict:
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    users = max(1, redemptions // 4)
+
+    validate_coupon(code, None, 100)  # warm the cache
+    validations = []
+    redeeming = threading.Event()
+
+    def validate_loop() -> None:
+        while redeeming.is_set():
+            t = time.perf_counter()
+            validate_coupon(code, None, 100)
+            if len(validations) < 1_000_000:
+                validations.append(time.perf_counter() - t)
+
+    latencies = []
+
+    def attempt(i: int) -> bool:
+        t = time.perf_counter()
+        result = redeem_coupon(code, None, 100, user_id=i % users)
+        latencies.append(time.perf_counter() - t)
+        return result.ok
+
+    redeeming.set()
+    validator = threading.Thread(target=validate_loop, name="coupon-bench-validate")
+    validator.start()
+    t0 = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            succeeded = sum(pool.map(attempt, range(redemptions)))
+    finally:
+        redeeming.clear()
+        validator.join()
+    elapsed = time.perf_counter() - t0
+
+    counters = execute_query(
+        """
+        SELECT c.redemptions,
+               (SELECT COUNT(*) FROM coupon_redemptions WHERE coupon_id = c.id) AS rows,
+               (SELECT MAX(uses) FROM coupon_user_redemptions WHERE coupon_id = c.id) AS max_user_uses
+        FROM coupons c WHERE c.id = %s;
+        """,
+        (coupon_id,),
+    )[0]
+    latencies.sort()
+    validations.sort()
+    expected = min(cap, redemptions, users * per_user_limit)
+    return {
+        "attempts": redemptions,
+        "succeeded": succeeded,
+        "expected": expected,
+        "counter": counters["redemptions"],
+        "redemption_rows": counters["rows"],
+        "max_uses_per_user": counters["max_user_uses"],
+        "correct": succeeded == counters["redemptions"] == counters["rows"] == expected
+        and counters["max_user_uses"] <= per_user_limit,
+        "validations": len(validations),
+        "validate_p50_us": round(validations[len(validations) // 2] * 1e6, 2) if validations else None,
+        "validate_p99_us": round(validations[int(len(validations) * 0.99)] * 1e6, 2) if validations else None,
+        "redeem_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "redeem_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "redemptions_per_s": round(redemptions / elapsed, 1),
+        "seconds": round(elapsed, 3),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Coupon redemption benchmark")
+    parser.add_argument("--redemptions", type=int, default=2_000)
+    parser.add_argument("--cap", type=int, default=500)
+    parser.add_argument("--per-user-limit", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=200)
+    args = parser.parse_args()
+    print(benchmark(args.redemptions, args.cap, args.per_user_limit, args.workers))
@@ -0,0 +1,130 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+from veilon_core.db import execute_command, query_frame
+from veilon_core.orders import PAID_ORDER_STATUSES
+from veilon_core.timeframes import timeframe_bounds
+
+# -------------------------------------------------------------------
+# Dashboard KPIs: New Users, New Accounts, Revenue and Payouts for a
+# timeframe, the same totals for the comparison period, and a per-bucket
+# series for the sparklines -- all from one statement. Each source is a
+# range scan on its timestamp index; buckets come from generate_series so
+# empty days still appear as zeros.
+# -------------------------------------------------------------------
+
+PAID_PAYOUT_STATUSES = ("paid", "completed")
+
+DASHBOARD_METRICS = {
+    "new_users": "New Users",
+    "new_accounts": "New Accounts",
+    "revenue": "Revenue",
+    "payouts": "Payouts",
+}
+
+DASHBOARD_INDEXES_DDL = """
+    CREATE INDEX IF NOT EXISTS users_created_at_idx ON users (created_at);
+    CREATE INDEX IF NOT EXISTS accounts_created_at_idx ON accounts (created_at);
+    CREATE INDEX IF NOT EXISTS orders_created_at_idx ON orders (created_at);
+    CREATE INDEX IF NOT EXISTS payouts_paid_at_idx ON payouts ((COALESCE(paid_at, created_at)));
+"""
+
+# Rows with bucket IS NULL carry the comparison-period totals.
+DASHBOARD_METRICS_SQL = """
+    WITH bounds AS (
+        SELECT
+            COALESCE(
+                %(start)s::timestamptz,
+                date_trunc(%(bucket)s, (SELECT MIN(created_at) FROM users), 'UTC'),
+                date_trunc(%(bucket)s, %(end)s::timestamptz, 'UTC')
+            ) AS start,
+            %(end)s::timestamptz AS end_,
+            COALESCE(%(prev_start)s::timestamptz, %(end)s::timestamptz) AS prev_start,
+            COALESCE(%(prev_end)s::timestamptz, %(end)s::timestamptz) AS prev_end
+    ),
+    buckets AS (
+        SELECT generate_series(
+            date_trunc(%(bucket)s, b.start, 'UTC'),
+            b.end_ - INTERVAL '1 microsecond',
+            ('1 ' || %(bucket)s)::interval
+        ) AS bucket
+        FROM bounds b
+    ),
+    src AS (
+        SELECT 'new_users' AS metric, created_at AS at, 1::numeric AS value
+        FROM users, bounds b
+        WHERE (created_at >= b.start AND created_at < b.end_)
+           OR (created_at >= b.prev_start AND created_at < b.prev_end)
+        UNION ALL
+        SELECT 'new_accounts', created_at, 1
+        FROM accounts, bounds b
+        WHERE (created_at >= b.start AND created_at < b.end_)
+           OR (created_at >= b.prev_start AND created_at < b.prev_end)
+        UNION ALL
+        SELECT 'revenue', created_at, amount
+        FROM orders, bounds b
+        WHERE status = ANY(%(order_statuses)s)
+          AND ((created_at >= b.start AND created_at < b.end_)
+            OR (created_at >= b.prev_start AND created_at < b.prev_end))
+        UNION ALL
+        SELECT 'payouts', COALESCE(paid_at, created_at), amount
+        FROM payouts, bounds b
+        WHERE status = ANY(%(payout_statuses)s)
+          AND ((COALESCE(paid_at, created_at) >= b.start AND COALESCE(paid_at, created_at) < b.end_)
+            OR (COALESCE(paid_at, created_at) >= b.prev_start AND COALESCE(paid_at, created_at) < b.prev_end))
+    ),
+    agg AS (
+        SELECT
+            s.metric,
+            CASE WHEN s.at >= b.start THEN date_trunc(%(bucket)s, s.at, 'UTC') END AS bucket,
+            SUM(s.value) AS value
+        FROM src s, bounds b
+        GROUP BY 1, 2
+    )
+    SELECT m.metric, k.bucket, COALESCE(a.value, 0)::float8 AS value
+    FROM unnest(%(metrics)s::text[]) AS m(metric)
+    CROSS JOIN (SELECT bucket FROM buckets UNION ALL SELECT NULL) k
+    LEFT JOIN agg a ON a.metric = m.metric AND a.bucket IS NOT DISTINCT FROM k.bucket
+    ORDER BY m.metric, k.bucket NULLS FIRST;
+"""
+
+
+def ensure_dashboard_indexes() -> None:
+    execute_command(DASHBOARD_INDEXES_DDL)
+
+
+def dashboard_metrics(timeframe: str, now: Optional[datetime] = None) -> dict:
+    """
+    {metric: {"label", "value", "previous", "delta_pct", "series"}} for a
+    timeframe label. previous/delta_pct are None when there is no
+    comparison period (All Time) or it was empty.
+    """
+    bounds = timeframe_bounds(timeframe, now)
+    df = query_frame(
+        DASHBOARD_METRICS_SQL,
+        {
+            "start": bounds.start,
+            "end": bounds.end,
+            "prev_start": bounds.prev_start,
+            "prev_end": bounds.prev_end,
+            "bucket": bounds.bucket,
+            "order_statuses": list(PAID_ORDER_STATUSES),
+            "payout_statuses": list(PAID_PAYOUT_STATUSES),
+            "metrics": list(DASHBOARD_METRICS),
+        },
+    )
+
+    metrics = {}
+    for metric, label in DASHBOARD_METRICS.items():
+        rows = df[df["metric"] == metric]
+        series = rows.loc[rows["bucket"].notna(), "value"].tolist()
+        previous = float(rows.loc[rows["bucket"].isna(), "value"].sum()) if bounds.prev_start else None
+        value = float(sum(series))
+        metrics[metric] = {
+            "label": label,
+            "value": value,
+            "previous": previous,
+            "delta_pct": (value - previous) / previous * 100 if previous else None,
+            "series": series,
+        }
+    return metrics
@@ -1,46 +1,543 @@
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
 import psycopg2
-from psycopg2.extras import RealDictCursor
-import streamlit as st
+from psycopg2.extensions import parse_dsn
+from psycopg2.extras import RealDictCursor, execute_values
+
+# -------------------------------------------------------------------
+# Connections and read routing.
+#
+# Writes, transactions and anything not recognisably read-only go to the
+# primary. Read-only statements go to a replica (DB_REPLICAS) when one is
+# configured and its replay lag is under DB_REPLICA_MAX_LAG_SECONDS;
+# otherwise they fall back to the primary. A session that has just
+# written reads from the primary for READ_YOUR_WRITES_SECONDS so it
+# always sees its own changes.
+#
+# Every statement and new connection is counted in `query_stats`, keyed
+# by query_label(): the *_SQL / *_DDL constant it came from when there is
+# one. veilon_core.async_db records into the same object.
+# -------------------------------------------------------------------
+
+DEFAULT_REPLICA_MAX_LAG_SECONDS = 5.0
+LAG_CHECK_SECONDS = 2.0          # per replica, cached between checks
+REPLICA_DOWN_SECONDS = 30.0      # back-off after a failed connect
+READ_YOUR_WRITES_SECONDS = 30.0
+
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+    END::float8 AS lag;
+"""
+
+_READ_START = re.compile(r"^\s*(?:--[^\n]*\n\s*|/\*.*?\*/\s*)*\(?\s*(SELECT|WITH|SHOW|EXPLAIN|VALUES|TABLE)\b", re.I | re.S)
+_WRITE_WORDS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE|LOCK|COPY|CALL|"
+    r"NEXTVAL|SETVAL|INTO|FOR\s+(?:NO\s+KEY\s+)?UPDATE|FOR\s+(?:KEY\s+)?SHARE)\b",
+    re.I,
+)
+
+
+def is_read_only(query) -> bool:
+    """
+    Conservative check: True only for statements that start like a read
+    and contain no write keyword. Anything doubtful goes to the primary.
+    """
+    if not isinstance(query, str):
+        query = str(query)
+    return bool(_READ_START.match(query)) and not _WRITE_WORDS.search(query)
 
-db = st.secrets["database"]
-host = db["DB_HOST"]
-port = db["DB_PORT"]
-dbname = db["DB_NAME"]
-user = db["DB_USER"]
-password = db["DB_PASSWORD"]
 
-def execute_query(query, params=None, fetch_results=True):
+def query_label(query) -> str:
+    """
+    "module.CONSTANT" when `query` is one of the *_SQL / *_DDL constants of
+    a loaded veilon_core module, else its first words. Labels are cached
+    per query text; the constant map is rebuilt only when sys.modules grows.
+    """
+    global _labels, _labelled_modules
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    elif not isinstance(query, str):
+        query = str(query)
+    label = _label_cache.get(query)
+    if label is not None:
+        return label
+    if len(sys.modules) != _labelled_modules:
+        labelled_modules = len(sys.modules)
+        labels = {}
+        for module_name, module in list(sys.modules.items()):
+            if not module_name.startswith("veilon_core.") or module is None:
+                continue
+            for name, value in list(vars(module).items()):
+                if name.endswith(("_SQL", "_DDL")) and name.isupper() and isinstance(value, str):
+                    labels[value] = f"{module_name.rpartition('.')[2]}.{name}"
+        _label_cache.clear()
+        _labels, _labelled_modules = labels, labelled_modules
+    label = _labels.get(query)
+    if label is None:
+        label = " ".join(query.split())[:60]
+    if len(_label_cache) < LABEL_CACHE_SIZE:  # dynamic SQL must not grow it without bound
+        _label_cache[query] = label
+    return label
+
+
+LABEL_CACHE_SIZE = 4096
+_labels: dict = {}        # constant text -> label
+_label_cache: dict = {}   # query text -> label, filled on first sight
+_labelled_modules = 0     # len(sys.modules) when _labels was built
+
+
+class QueryStats:
+    """Process-wide counters: connections opened, statements, rows and time per label."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.connections = 0
+            self.queries = 0
+            self.rows = 0
+            self.seconds = 0.0
+            self.by_label: dict = {}
+
+    def connected(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def record(self, query, seconds: float, rows: int = 0) -> None:
+        label = query_label(query)
+        rows = max(rows or 0, 0)
+        with self._lock:
+            self.queries += 1
+            self.rows += rows
+            self.seconds += seconds
+            entry = self.by_label.setdefault(label, [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += rows
+            entry[2] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "queries": self.queries,
+                "rows": self.rows,
+                "seconds": round(self.seconds, 4),
+                "by_label": {
+                    label: {"calls": calls, "rows": rows, "seconds": round(seconds, 4)}
+                    for label, (calls, rows, seconds) in sorted(self.by_label.items(), key=lambda kv: -kv[1][2])
+                },
+            }
+
+
+query_stats = QueryStats()
+
+
+class _Timed:
+    """Cursor mixin recording each execute() in query_stats (under `label` when set)."""
+
+    label = None
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            query_stats.record(self.label or query, time.perf_counter() - started, self.rowcount)
+
+
+class _DictCursor(_Timed, RealDictCursor):
+    pass
+
+
+class _TupleCursor(_Timed, psycopg2.extensions.cursor):
+    pass
+
+
+def _connect(**settings):
+    conn = psycopg2.connect(**settings)
+    query_stats.connected()
+    return conn
+
+
+def _database_source() -> dict:
+    if os.getenv("DB_HOST"):
+        from veilon_core.config import database_config, replica_config
+
+        return {**database_config(), **replica_config()}
+
+    import streamlit as st
+
+    return dict(st.secrets["database"])
+
+
+_target_dsn = None
+
+
+def use_database(dsn: str) -> None:
+    """
+    Points this process at `dsn` (a libpq DSN) instead of the configured
+    database, with no replicas. For tools that must only ever touch the
+    database named on their command line (see veilon_core.synthetic).
+    """
+    global _target_dsn
+    _target_dsn = dsn
+    database_settings.cache_clear()
+    replica_settings.cache_clear()
+    get_router.cache_clear()
+
+
+def _parse_settings(dsn: str) -> dict:
+    parsed = parse_dsn(dsn)
+    if "dbname" in parsed:
+        parsed["database"] = parsed.pop("dbname")
+    return parsed
+
+
+@lru_cache(maxsize=1)
+def database_settings():
+    """
+    Primary connection settings, read on first use rather than at import
+    so importing veilon_core stays cheap. A use_database() target wins;
+    then DB_* environment variables (batch jobs load them from .env, see
+    veilon_core.jobs); otherwise the [database] section of st.secrets.
+    """
+    if _target_dsn is not None:
+        return _parse_settings(_target_dsn)
+    db = _database_source()
+    return {
+        "host": db["DB_HOST"],
+        "port": db["DB_PORT"],
+        "database": db["DB_NAME"],
+        "user": db["DB_USER"],
+        "password": db["DB_PASSWORD"],
+    }
+
+
+@lru_cache(maxsize=1)
+def replica_settings() -> tuple:
+    """
+    Connection settings per replica. Each DB_REPLICAS entry (a list in
+    st.secrets, ";"-separated in the environment) is a libpq DSN such as
+    "host=replica1 port=5432"; unspecified fields come from the primary.
+    """
+    if _target_dsn is not None:
+        return ()
+    primary = database_settings()
+    replicas = _database_source().get("DB_REPLICAS") or []
+    if isinstance(replicas, str):
+        replicas = [d for d in replicas.split(";") if d.strip()]
+    return tuple({**primary, **_parse_settings(dsn)} for dsn in replicas)
+
+
+def _session_key():
+    """Streamlit session id when called from a script run, else None (process)."""
+    runner = sys.modules.get("streamlit.runtime.scriptrunner")
+    if runner is not None:
+        ctx = runner.get_script_run_ctx(suppress_warning=True)
+        if ctx is not None:
+            return ctx.session_id
+    return None
+
+
+class ReplicaRouter:
+    """
+    Picks a replica for a read: round-robin over replicas whose last
+    measured lag is within `max_lag`, re-measuring a replica's lag on the
+    connection about to be used once the cached value is older than
+    LAG_CHECK_SECONDS. Also tracks which sessions wrote recently.
+    """
+
+    def __init__(self, replicas, max_lag: float):
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self._lock = threading.Lock()
+        self._next = 0
+        self._lag = [None] * len(self.replicas)
+        self._checked_at = [float("-inf")] * len(self.replicas)
+        self._down_until = [float("-inf")] * len(self.replicas)
+        self._writes: dict = {}
+        self.stats = {"replica": 0, "primary_fallback": 0, "primary_sticky": 0}
+
+    def mark_write(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._writes[_session_key()] = now
+            if len(self._writes) > 10_000:
+                cutoff = now - READ_YOUR_WRITES_SECONDS
+                self._writes = {k: t for k, t in self._writes.items() if t > cutoff}
+
+    def wrote_recently(self) -> bool:
+        at = self._writes.get(_session_key())
+        return at is not None and time.monotonic() - at < READ_YOUR_WRITES_SECONDS
+
+    def connect(self):
+        """A connection to a usable replica, or None."""
+        if not self.replicas:
+            return None
+        if self.wrote_recently():
+            self.stats["primary_sticky"] += 1
+            return None
+
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+
+        now = time.monotonic()
+        for i in (start + k for k in range(len(self.replicas))):
+            i %= len(self.replicas)
+            if now < self._down_until[i]:
+                continue
+            lag = self._lag[i]
+            if lag is not None and lag > self.max_lag and now - self._checked_at[i] < LAG_CHECK_SECONDS:
+                continue
+            try:
+                conn = _connect(connect_timeout=2, **self.replicas[i])
+            except psycopg2.OperationalError:
+                self._down_until[i] = now + REPLICA_DOWN_SECONDS
+                continue
+            if now - self._checked_at[i] >= LAG_CHECK_SECONDS:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(REPLICA_LAG_SQL)
+                        self._lag[i] = cursor.fetchone()[0]
+                    conn.rollback()
+                except psycopg2.Error:
+                    self._lag[i] = float("inf")
+                self._checked_at[i] = now
+            if self._lag[i] is not None and self._lag[i] <= self.max_lag:
+                self.stats["replica"] += 1
+                return conn
+            conn.close()
+
+        self.stats["primary_fallback"] += 1
+        return None
+
+    def status(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "host": r.get("host"),
+                "port": r.get("port"),
+                "lag_seconds": self._lag[i],
+                "checked_ago": None if self._checked_at[i] == float("-inf") else round(now - self._checked_at[i], 1),
+                "down": now < self._down_until[i],
+            }
+            for i, r in enumerate(self.replicas)
+        ]
+
+
+@lru_cache(maxsize=1)
+def get_router() -> ReplicaRouter:
+    if _target_dsn is not None:
+        return ReplicaRouter((), DEFAULT_REPLICA_MAX_LAG_SECONDS)
+    max_lag = _database_source().get("DB_REPLICA_MAX_LAG_SECONDS")
+    return ReplicaRouter(replica_settings(), float(max_lag) if max_lag else DEFAULT_REPLICA_MAX_LAG_SECONDS)
+
+
+def get_connection(readonly: bool = False):
+    """
+    Opens a new connection using the configured credentials.
+    Callers own the connection (use it as a context manager and close it).
+    With readonly=True the connection may be to a replica.
+    """
+    if readonly:
+        conn = get_router().connect()
+        if conn is not None:
+            return conn
+    return _connect(**database_settings())
+
+
+def _primary_connection():
+    get_router().mark_write()
+    return _connect(**database_settings())
+
+
+def _connection_for(query, replica=None):
+    """
+    replica=None routes by statement (is_read_only); True forces a
+    read-only connection (a replica, or the primary in read-only mode);
+    False forces the primary. Primary writes are recorded for
+    read-your-writes.
+    """
+    readonly = is_read_only(query) if replica is None else replica
+    if not readonly:
+        return _primary_connection()
+    conn = get_router().connect()
+    if conn is None:
+        conn = _connect(**database_settings())
+        if replica:
+            conn.set_session(readonly=True)
+    return conn
+
+
+def execute_query(query, params=None, fetch_results=True, *, replica=None):
     """
     Executes a SQL query and optionally fetches results.
+    Read-only statements may be served by a replica (see _connection_for).
 
     Returns:
       - If fetch_results=True: always returns a list (possibly empty)
       - If fetch_results=False: returns None on success (raises/prints on error)
     """
     try:
-        with psycopg2.connect(
-            host=host,
-            port=port,
-            database=dbname,
-            user=user,
-            password=password,
-        ) as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query, params)
+        conn = _connection_for(query, replica)
+        try:
+            with conn:
+                with conn.cursor(cursor_factory=_DictCursor) as cursor:
+                    cursor.execute(query, params)
 
-                if not fetch_results:
-                    # Using "with conn" commits automatically on normal exit,
-                    # but explicit commit is fine and clear.
-                    conn.commit()
-                    return None
+                    if not fetch_results:
+                        return None
 
-                rows = cursor.fetchall()
-                return rows if rows is not None else []
+                    rows = cursor.fetchall() if cursor.description else []
+                    return rows if rows is not None else []
+        finally:
+            conn.close()
 
+    except psycopg2.errors.ReadOnlySqlTransaction as e:
+        if replica is None:
+            # Read-looking statement with side effects (e.g. a function): retry on the primary.
+            return execute_query(query, params, fetch_results, replica=False)
+        print(f"Database error: {e}")
+        return [] if fetch_results else None
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         # Critical change: never return None for SELECT-style calls
         return [] if fetch_results else None
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-        return [] if fetch_results else None
\ No newline at end of file
+        return [] if fetch_results else None
+
+
+def execute_command(query, params=None):
+    """
+    Runs a statement that must succeed (DDL, maintenance, bulk writes) and
+    returns the affected row count. Unlike execute_query, errors are raised.
+    """
+    conn = _primary_connection()
+    try:
+        with conn:
+            with conn.cursor(cursor_factory=_TupleCursor) as cursor:
+                cursor.execute(query, params)
+                return cursor.rowcount
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction():
+    """
+    Yields a RealDictCursor inside one transaction: commits if the block
+    completes, rolls back and re-raises otherwise. Use for multi-statement
+    bulk writes that must land together.
+    """
+    conn = _primary_connection()
+    try:
+        with conn:
+            with conn.cursor(cursor_factory=_DictCursor) as cursor:
+                yield cursor
+    finally:
+        conn.close()
+
+
+def query_frame(query, params=None, *, replica=None):
+    """
+    Runs a SELECT and returns a pandas DataFrame built straight from tuples,
+    skipping the per-row dicts of execute_query. Use for large result sets.
+    May be served by a replica (see _connection_for). Errors are raised.
+    """
+    import pandas as pd
+
+    conn = _connection_for(query, replica)
+    try:
+        with conn:
+            with conn.cursor(cursor_factory=_TupleCursor) as cursor:
+                cursor.execute(query, params)
+                columns = [c.name for c in cursor.description]
+                return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+    finally:
+        conn.close()
+
+
+def copy_frame(cursor, table, frame, columns=None):
+    """
+    Bulk-loads a DataFrame into `table` with COPY ... FROM STDIN (CSV),
+    on the caller's cursor so it can share a transaction. NaN/None load as NULL.
+    The CSV is written by pyarrow, which is several times faster than pandas.
+    """
+    import io
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    columns = list(columns or frame.columns)
+    buffer = io.BytesIO()
+    pa_csv.write_csv(
+        pa.Table.from_pandas(frame[columns], preserve_index=False),
+        buffer,
+        write_options=pa_csv.WriteOptions(include_header=False),
+    )
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+    return len(frame)
+
+
+def iter_query(query, params=None, chunk_size=50_000):
+    """
+    Streams a SELECT through a server-side cursor, yielding lists of rows
+    (dicts) of at most chunk_size. Use for exports that must not load the
+    whole result into memory. Errors are raised, not swallowed.
+    """
+    conn = _connection_for(query)
+    try:
+        with conn:
+            with conn.cursor(name="veilon_iter", cursor_factory=_DictCursor) as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+    finally:
+        conn.close()
+
+
+def execute_many(query, rows, template=None, page_size=1000, fetch_results=False):
+    """
+    Runs a multi-row statement (INSERT ... VALUES %s / UPDATE ... FROM (VALUES %s))
+    with psycopg2's execute_values in a single transaction.
+    Unlike execute_query, errors are raised so batch callers can retry.
+    """
+    if not rows:
+        return [] if fetch_results else None
+
+    conn = _primary_connection()
+    try:
+        with conn:
+            with conn.cursor(cursor_factory=_DictCursor) as cursor:
+                cursor.label = query  # one record per page, under the template's label
+                result = execute_values(
+                    cursor,
+                    query,
+                    rows,
+                    template=template,
+                    page_size=page_size,
+                    fetch=fetch_results,
+                )
+        return result if fetch_results else None
+    finally:
+        conn.close()
@@ -0,0 +1,312 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import numpy as np
+import pandas as pd
+from veilon_core.db import execute_command, execute_query, query_frame, transaction
+
+# -------------------------------------------------------------------
+# Equity / balance time series.
+#
+# Raw points live in account_equity_snapshots (written by the tracker and
+# by every balance change). rollup_equity() folds complete buckets into
+# 1m -> 1h -> 1d OHLC tables, each advanced by its own watermark.
+# equity_curve() reads the coarsest resolution that still has enough
+# points for the requested pixel budget, appends the not-yet-rolled tail
+# from raw, and downsamples with LTTB.
+# -------------------------------------------------------------------
+
+RESOLUTIONS = {
+    # name: (table, date_trunc unit, seconds, source table)
+    "1m": ("account_equity_1m", "minute", 60, "account_equity_snapshots"),
+    "1h": ("account_equity_1h", "hour", 3_600, "account_equity_1m"),
+    "1d": ("account_equity_1d", "day", 86_400, "account_equity_1h"),
+}
+
+RAW_SECONDS = 1  # nominal spacing of raw points, for resolution choice
+
+# Raw points land late: EquityTracker flushes every second (its
+# flush_interval) and a failed flush is retried. Buckets are rolled only
+# once they ended this long ago, so no point committed after the rollup
+# read can belong to a bucket behind the watermark.
+ROLLUP_LAG = timedelta(seconds=30)
+
+EQUITY_ROLLUPS_DDL = "\n".join(
+    f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        account_id     BIGINT          NOT NULL,
+        bucket         TIMESTAMPTZ     NOT NULL,
+        equity_open    NUMERIC(18, 2)  NOT NULL,
+        equity_high    NUMERIC(18, 2)  NOT NULL,
+        equity_low     NUMERIC(18, 2)  NOT NULL,
+        equity_close   NUMERIC(18, 2)  NOT NULL,
+        balance_close  NUMERIC(18, 2)  NOT NULL,
+        points         INTEGER         NOT NULL,
+        PRIMARY KEY (account_id, bucket)
+    );
+    """
+    for table, _, _, _ in RESOLUTIONS.values()
+) + """
+    CREATE TABLE IF NOT EXISTS equity_rollup_watermarks (
+        resolution    TEXT         PRIMARY KEY,
+        rolled_until  TIMESTAMPTZ  NOT NULL
+    );
+"""
+
+_RAW_ROLLUP_SELECT = """
+    SELECT
+        account_id,
+        date_trunc('{unit}', captured_at) AS bucket,
+        (array_agg(equity ORDER BY captured_at))[1],
+        MAX(equity),
+        MIN(equity),
+        (array_agg(equity ORDER BY captured_at DESC))[1],
+        (array_agg(balance ORDER BY captured_at DESC))[1],
+        COUNT(*)
+    FROM account_equity_snapshots
+    WHERE captured_at >= %(start)s AND captured_at < %(until)s
+    GROUP BY 1, 2
+"""
+
+_BUCKET_ROLLUP_SELECT = """
+    SELECT
+        account_id,
+        date_trunc('{unit}', bucket) AS rolled,
+        (array_agg(equity_open ORDER BY bucket))[1],
+        MAX(equity_high),
+        MIN(equity_low),
+        (array_agg(equity_close ORDER BY bucket DESC))[1],
+        (array_agg(balance_close ORDER BY bucket DESC))[1],
+        SUM(points)
+    FROM {source}
+    WHERE bucket >= %(start)s AND bucket < %(until)s
+    GROUP BY 1, 2
+"""
+
+_UPSERT = """
+    INSERT INTO {table} (
+        account_id, bucket, equity_open, equity_high, equity_low,
+        equity_close, balance_close, points
+    )
+    {select}
+    ON CONFLICT (account_id, bucket) DO UPDATE
+    SET equity_open = EXCLUDED.equity_open,
+        equity_high = EXCLUDED.equity_high,
+        equity_low = EXCLUDED.equity_low,
+        equity_close = EXCLUDED.equity_close,
+        balance_close = EXCLUDED.balance_close,
+        points = EXCLUDED.points;
+"""
+
+
+def ensure_equity_tables() -> None:
+    execute_command(EQUITY_ROLLUPS_DDL)
+
+
+def equity_record_point(account_id: int, balance: float, equity: Optional[float] = None) -> None:
+    """
+    Append a raw point, e.g. after a manual balance change. Equity defaults
+    to the balance when no live equity is known.
+    """
+    execute_query(
+        """
+        INSERT INTO account_equity_snapshots (account_id, captured_at, equity, balance)
+        VALUES (%s, NOW(), %s, %s)
+        ON CONFLICT (account_id, captured_at) DO UPDATE
+        SET equity = EXCLUDED.equity, balance = EXCLUDED.balance;
+        """,
+        (account_id, balance if equity is None else equity, balance),
+        fetch_results=False,
+    )
+
+
+def equity_record_points(account_ids: list[int], balances: list[float]) -> None:
+    """
+    Bulk equity_record_point for newly created accounts (equity = balance).
+    """
+    execute_query(
+        """
+        INSERT INTO account_equity_snapshots (account_id, captured_at, equity, balance)
+        SELECT account_id, NOW(), balance, balance
+        FROM unnest(%s::bigint[], %s::numeric[]) AS t(account_id, balance)
+        ON CONFLICT (account_id, captured_at) DO NOTHING;
+        """,
+        (account_ids, balances),
+        fetch_results=False,
+    )
+
+
+def _watermarks() -> dict[str, datetime]:
+    rows = execute_query("SELECT resolution, rolled_until FROM equity_rollup_watermarks;")
+    return {r["resolution"]: r["rolled_until"] for r in rows}
+
+
+def rollup_equity(now: Optional[datetime] = None, keep_raw_days: Optional[int] = None) -> dict:
+    """
+    Roll complete buckets into 1m, 1h and 1d tables (in that order, each
+    from the one below). Each level recomputes from the bucket containing
+    its watermark up to the last bucket complete ROLLUP_LAG ago, so reruns
+    are idempotent. Optionally prunes raw points older than keep_raw_days once rolled.
+    """
+    now = now or datetime.now(timezone.utc)
+    marks = _watermarks()
+    result = {}
+
+    for name, (table, unit, seconds, source) in RESOLUTIONS.items():
+        # Only buckets that are complete at this level *and* fully rolled below.
+        until = pd.Timestamp(now - ROLLUP_LAG).floor(f"{seconds}s")
+        if source != "account_equity_snapshots":
+            below = marks.get(_level_below(name))
+            if below is None:
+                result[name] = 0
+                continue
+            until = min(until, pd.Timestamp(below).floor(f"{seconds}s"))
+
+        start = marks.get(name)
+        start = pd.Timestamp(start).floor(f"{seconds}s") if start is not None else pd.Timestamp("1970-01-01", tz="UTC")
+        if start >= until:
+            result[name] = 0
+            continue
+
+        template = _RAW_ROLLUP_SELECT if source == "account_equity_snapshots" else _BUCKET_ROLLUP_SELECT
+        select = template.format(unit=unit, source=source)
+        with transaction() as cursor:
+            cursor.execute(_UPSERT.format(table=table, select=select), {"start": start, "until": until})
+            result[name] = cursor.rowcount
+            cursor.execute(
+                """
+                INSERT INTO equity_rollup_watermarks (resolution, rolled_until)
+                VALUES (%s, %s)
+                ON CONFLICT (resolution) DO UPDATE SET rolled_until = EXCLUDED.rolled_until;
+                """,
+                (name, until.to_pydatetime()),
+            )
+        marks[name] = until.to_pydatetime()
+
+    if keep_raw_days is not None and "1m" in marks:
+        cutoff = min(marks["1m"], now - timedelta(days=keep_raw_days))
+        result["raw_pruned"] = execute_command(
+            "DELETE FROM account_equity_snapshots WHERE captured_at < %s;",
+            (cutoff,),
+        )
+
+    return result
+
+
+def _level_below(name: str) -> str:
+    names = list(RESOLUTIONS)
+    return names[names.index(name) - 1]
+
+
+def choose_resolution(start: datetime, end: datetime, max_points: int, oversample: int = 4) -> str:
+    """
+    Coarsest resolution that still yields at least max_points * oversample
+    buckets over the range (so LTTB has detail to choose from), else raw.
+    """
+    span = (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds()
+    wanted = max_points * oversample
+    chosen = "raw"
+    for name, (_, _, seconds, _) in RESOLUTIONS.items():
+        if span / seconds >= wanted:
+            chosen = name
+    if chosen == "raw" and span / RAW_SECONDS > wanted * 60:
+        chosen = "1m"
+    return chosen
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns the indices of
+    the kept points (always including the first and last).
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(float)
+    y = y.astype(float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    # Mean of every bucket up front; bucket i is scored against the mean
+    # of bucket i + 1 (the last bucket against the final point).
+    sizes = np.diff(np.r_[edges, n - 1])
+    avg_x = np.r_[np.add.reduceat(x[:n - 1], edges[:-1]) / sizes[:-1], x[-1]]
+    avg_y = np.r_[np.add.reduceat(y[:n - 1], edges[:-1]) / sizes[:-1], y[-1]]
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return keep
+
+
+def equity_curve(
+    account_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    max_points: int = 800,
+) -> pd.DataFrame:
+    """
+    Chart-ready equity/balance series for one account with at most
+    max_points rows (columns: at, equity, balance).
+    """
+    end = pd.Timestamp(end or datetime.now(timezone.utc))
+    start = pd.Timestamp(start or end - timedelta(days=365))
+    resolution = choose_resolution(start, end, max_points)
+
+    if resolution == "raw":
+        df = query_frame(
+            """
+            SELECT captured_at AS at, equity::float8, balance::float8
+            FROM account_equity_snapshots
+            WHERE account_id = %s AND captured_at >= %s AND captured_at < %s
+            ORDER BY captured_at;
+            """,
+            (account_id, start.to_pydatetime(), end.to_pydatetime()),
+        )
+    else:
+        table, unit, _, _ = RESOLUTIONS[resolution]
+        rolled_until = _watermarks().get(resolution)
+        split = min(end, pd.Timestamp(rolled_until)) if rolled_until else start
+        split = max(split, start)
+        # Rolled buckets, then the unrolled tail aggregated on the fly.
+        df = query_frame(
+            f"""
+            SELECT bucket AS at, equity_close::float8 AS equity, balance_close::float8 AS balance
+            FROM {table}
+            WHERE account_id = %(account_id)s AND bucket >= %(start)s AND bucket < %(split)s
+            UNION ALL
+            SELECT date_trunc('{unit}', captured_at) AS at,
+                   (array_agg(equity ORDER BY captured_at DESC))[1]::float8,
+                   (array_agg(balance ORDER BY captured_at DESC))[1]::float8
+            FROM account_equity_snapshots
+            WHERE account_id = %(account_id)s AND captured_at >= %(split)s AND captured_at < %(end)s
+            GROUP BY 1
+            ORDER BY 1;
+            """,
+            {
+                "account_id": account_id,
+                "start": start.to_pydatetime(),
+                "split": split.to_pydatetime(),
+                "end": end.to_pydatetime(),
+            },
+        )
+
+    if df.empty:
+        return pd.DataFrame(columns=["at", "equity", "balance"])
+
+    df["at"] = pd.to_datetime(df["at"], utc=True)
+    df["equity"] = df["equity"].astype(float)
+    df["balance"] = df["balance"].astype(float)
+
+    keep = lttb(df["at"].astype("int64").to_numpy(), df["equity"].to_numpy(), max_points)
+    return df.iloc[keep].reset_index(drop=True)
@@ -0,0 +1,528 @@
+from __future__ import annotations
+import json
+import re
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Optional, Sequence
+from psycopg2.extras import Json
+from veilon_core.db import execute_command, execute_query, iter_query
+import pandas as pd
+
+# -------------------------------------------------------------------
+# account_events is range-partitioned by month on occurred_at.
+# Partitions are named account_events_yYYYYmMM. Everything older than
+# the hot window is exported to Parquet and detached from the parent.
+# An existing unpartitioned table is converted by `jobs migrate`.
+# -------------------------------------------------------------------
+ARCHIVE_DIR = Path(__file__).resolve().parent.parent / "archive" / "account_events"
+
+PARTITION_PREFIX = "account_events_y"
+REPLAY_PAGE_SIZE = 50_000
+
+EVENT_COLUMNS = [
+    "id",
+    "account_id",
+    "event_type",
+    "event_status",
+    "actor_type",
+    "actor_id",
+    "payload",
+    "occurred_at",
+]
+
+# One-off migration of the legacy (unpartitioned) table. The existing table
+# is kept as the partition for everything before `cutover`, so no rows move;
+# cutover must therefore be later than the newest existing event.
+MIGRATE_TO_PARTITIONED_SQL = """
+    ALTER TABLE account_events RENAME TO account_events_legacy;
+
+    CREATE TABLE account_events (
+        LIKE account_events_legacy INCLUDING DEFAULTS INCLUDING GENERATED
+    ) PARTITION BY RANGE (occurred_at);
+
+    -- Keep the id sequence alive once the legacy partition is archived.
+    DO $$
+    DECLARE
+        seq text := pg_get_serial_sequence('account_events_legacy', 'id');
+    BEGIN
+        IF seq IS NOT NULL THEN
+            EXECUTE format('ALTER SEQUENCE %%s OWNED BY NONE', seq);
+            EXECUTE format('ALTER TABLE account_events ALTER COLUMN id SET DEFAULT nextval(%%L)', seq);
+        END IF;
+    END $$;
+
+    ALTER TABLE account_events ALTER COLUMN occurred_at SET NOT NULL;
+    ALTER TABLE account_events_legacy ALTER COLUMN occurred_at SET NOT NULL;
+    ALTER TABLE account_events_legacy DROP CONSTRAINT IF EXISTS account_events_pkey;
+
+    ALTER TABLE account_events
+        ATTACH PARTITION account_events_legacy
+        FOR VALUES FROM (MINVALUE) TO (%(cutover)s);
+
+    ALTER TABLE account_events ADD PRIMARY KEY (id, occurred_at);
+    CREATE INDEX IF NOT EXISTS account_events_account_occurred_idx
+        ON account_events (account_id, occurred_at DESC);
+"""
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, months: int) -> date:
+    month_index = d.year * 12 + (d.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month.year:04d}m{month.month:02d}"
+
+
+def account_events_is_partitioned() -> bool:
+    rows = execute_query(
+        """
+        SELECT EXISTS (
+            SELECT 1
+            FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = 'account_events'
+        ) AS is_partitioned;
+        """
+    )
+    return bool(rows and rows[0]["is_partitioned"])
+
+
+def account_events_migrate_to_partitioned(cutover: Optional[date] = None) -> None:
+    """
+    Convert account_events into a monthly partitioned table.
+    Existing rows stay in account_events_legacy, attached as the partition
+    for everything before `cutover` (default: start of next month).
+    A no-op once partitioned, or when the table does not exist yet.
+    """
+    if account_events_is_partitioned():
+        return
+    rows = execute_query("SELECT to_regclass('account_events') IS NOT NULL AS found;")
+    if not (rows and rows[0]["found"]):
+        return
+
+    cutover = _month_start(cutover or _add_months(date.today(), 1))
+    execute_command(MIGRATE_TO_PARTITIONED_SQL, {"cutover": cutover})
+    account_events_ensure_partitions(start=cutover)
+
+
+def account_events_ensure_partitions(months_ahead: int = 3, start: Optional[date] = None) -> list[str]:
+    """
+    Create monthly partitions from `start` (default: current month)
+    through `months_ahead` months in the future. Months an existing
+    partition already covers (the legacy partition reaches up to its
+    cutover) are skipped. Idempotent.
+    """
+    if not account_events_is_partitioned():
+        raise RuntimeError(
+            "account_events is not partitioned; run `python -m veilon_core.jobs migrate` first."
+        )
+    first = _month_start(start or date.today())
+    existing = account_events_partitions()
+    created = []
+
+    for offset in range(months_ahead + 1):
+        lower = _add_months(first, offset)
+        upper = _add_months(lower, 1)
+        name = partition_name(lower)
+        if any(
+            p["name"] != name
+            and (p["lower"] is None or p["lower"] < upper)
+            and (p["upper"] is None or p["upper"] > lower)
+            for p in existing
+        ):
+            continue
+
+        # Identifiers can't be parameterised; name is built from dates only.
+        execute_command(
+            f"""
+            CREATE TABLE IF NOT EXISTS {name}
+            PARTITION OF account_events
+            FOR VALUES FROM (%s) TO (%s);
+            """,
+            (lower, upper),
+        )
+        created.append(name)
+
+    return created
+
+
+def account_events_partitions() -> list[dict]:
+    """
+    List attached partitions with their bounds and approximate size,
+    oldest first. The legacy partition has a NULL lower bound.
+    """
+    rows = execute_query(
+        """
+        SELECT
+            c.relname AS name,
+            pg_get_expr(c.relpartbound, c.oid) AS bound,
+            pg_total_relation_size(c.oid) AS total_bytes,
+            c.reltuples::bigint AS approx_rows
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'account_events'
+        ORDER BY c.relname;
+        """
+    )
+
+    partitions = []
+    for row in rows:
+        lower, upper = _parse_bound(row["bound"])
+        partitions.append({**row, "lower": lower, "upper": upper})
+
+    partitions.sort(key=lambda p: p["lower"] or date.min)
+    return partitions
+
+
+def _parse_bound(bound: str) -> tuple[Optional[date], Optional[date]]:
+    # e.g. FOR VALUES FROM ('2026-01-01 00:00:00+00') TO ('2026-02-01 00:00:00+00')
+    def _value(part: str) -> Optional[date]:
+        part = part.strip().strip("()")
+        if part.upper() in ("MINVALUE", "MAXVALUE"):
+            return None
+        return pd.Timestamp(part.strip("'")).date()
+
+    _, _, rest = bound.partition("FROM")
+    lower_raw, _, upper_raw = rest.partition(" TO ")
+    return _value(lower_raw), _value(upper_raw)
+
+
+def account_events_archive(
+    keep_months: int = 6,
+    *,
+    archive_dir: Path = ARCHIVE_DIR,
+    chunk_size: int = 100_000,
+    drop: bool = True,
+) -> list[dict]:
+    """
+    Export every monthly partition that ends before the hot window
+    (current month minus keep_months) to Parquet, then detach it.
+
+    Rows are streamed in chunks so memory stays flat regardless of
+    partition size. A partition is only detached after its file is
+    written and its row count verified. The legacy partition is archived
+    like any other once the cutoff passes its upper bound.
+    """
+    if keep_months < 1:
+        raise ValueError("keep_months must be at least 1; the current month is always hot.")
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("account_id", pa.int64()),
+        ("event_type", pa.string()),
+        ("event_status", pa.string()),
+        ("actor_type", pa.string()),
+        ("actor_id", pa.int64()),
+        ("payload", pa.string()),  # JSON text
+        ("occurred_at", pa.timestamp("us", tz="UTC")),
+    ])
+    select_columns = ", ".join(EVENT_COLUMNS)
+
+    cutoff = _add_months(_month_start(date.today()), -keep_months)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    archived = []
+
+    for part in account_events_partitions():
+        if part["upper"] is None or part["upper"] > cutoff:
+            continue
+
+        name = part["name"]
+        path = archive_dir / f"{name}.parquet"
+        tmp_path = path.with_suffix(".parquet.tmp")
+
+        writer = None
+        written = 0
+        try:
+            query = f"SELECT {select_columns} FROM {name} ORDER BY occurred_at, id;"
+            for rows in iter_query(query, chunk_size=chunk_size):
+                frame = pd.DataFrame(rows, columns=EVENT_COLUMNS)
+                frame["payload"] = frame["payload"].map(_payload_to_json)
+                frame["occurred_at"] = pd.to_datetime(frame["occurred_at"], utc=True)
+                table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, schema, compression="zstd")
+                writer.write_table(table)
+                written += len(frame)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        rows = execute_query(f"SELECT COUNT(*) AS n FROM {name};")
+        expected = rows[0]["n"] if rows else None
+        if expected != written:
+            tmp_path.unlink(missing_ok=True)
+            raise RuntimeError(f"Archive of {name} wrote {written} rows, partition has {expected}.")
+
+        if written:
+            tmp_path.replace(path)
+
+        execute_command(f"ALTER TABLE account_events DETACH PARTITION {name};")
+        if drop:
+            execute_command(f"DROP TABLE {name};")
+
+        archived.append({"partition": name, "rows": written, "path": str(path) if written else None})
+
+    return archived
+
+
+def _payload_to_json(payload: Any) -> str:
+    return json.dumps(payload or {}, default=str)
+
+
+def account_events_range(
+    account_id: Optional[int] = None,
+    *,
+    start: datetime,
+    end: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    after: Optional[tuple[datetime, int]] = None,
+    limit: int = 1000,
+) -> list[dict]:
+    """
+    Read events from the hot table within [start, end), oldest first,
+    continuing after the (occurred_at, id) of the previous page if given.
+    Always bounded on occurred_at so the planner only touches the
+    matching partitions.
+    """
+    after_at, after_id = after or (None, None)
+    return execute_query(
+        """
+        SELECT id, account_id, event_type, event_status, actor_type, actor_id, payload, occurred_at
+        FROM account_events
+        WHERE occurred_at >= %s
+          AND occurred_at < COALESCE(%s, NOW() + INTERVAL '1 day')
+          AND (%s IS NULL OR account_id = %s)
+          AND (%s IS NULL OR event_type = %s)
+          AND (%s::timestamptz IS NULL OR (occurred_at, id) > (%s::timestamptz, %s::bigint))
+        ORDER BY occurred_at, id
+        LIMIT %s;
+        """,
+        (start, end, account_id, account_id, event_type, event_type, after_at, after_at, after_id, limit),
+    )
+
+
+def account_events_replay(
+    account_id: int,
+    *,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    archive_dir: Path = ARCHIVE_DIR,
+) -> pd.DataFrame:
+    """
+    Full ordered event history for one account across the cold tier
+    (Parquet files) and the hot table. Archive files outside [start, end)
+    are skipped by name, and the hot query is range-bounded and read in
+    pages of REPLAY_PAGE_SIZE. Naive datetimes are taken as UTC.
+    """
+    start_ts = _utc(start or datetime(1970, 1, 1))
+    end_ts = _utc(end) if end is not None else None
+
+    frames = []
+    for path in sorted(archive_dir.glob("account_events_*.parquet")):
+        month = _month_from_partition(path.stem)
+        if month is not None:
+            if pd.Timestamp(_add_months(month, 1), tz="UTC") <= start_ts:
+                continue
+            if end_ts is not None and pd.Timestamp(month, tz="UTC") >= end_ts:
+                continue
+        frame = pd.read_parquet(path, filters=[("account_id", "==", account_id)])
+        if not frame.empty:
+            frame["payload"] = frame["payload"].map(json.loads)
+            frames.append(frame)
+
+    after = None
+    while True:
+        hot = account_events_range(
+            account_id,
+            start=start_ts.to_pydatetime(),
+            end=end_ts.to_pydatetime() if end_ts is not None else None,
+            after=after,
+            limit=REPLAY_PAGE_SIZE,
+        )
+        if hot:
+            frames.append(pd.DataFrame(hot))
+        if len(hot) < REPLAY_PAGE_SIZE:
+            break
+        after = (hot[-1]["occurred_at"], hot[-1]["id"])
+
+    if not frames:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+
+    events = pd.concat(frames, ignore_index=True)
+    events["occurred_at"] = pd.to_datetime(events["occurred_at"], utc=True)
+    events = events[events["occurred_at"] >= start_ts]
+    if end_ts is not None:
+        events = events[events["occurred_at"] < end_ts]
+    return events.sort_values(["occurred_at", "id"], kind="stable").reset_index(drop=True)
+
+
+def _utc(value: datetime) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _month_from_partition(name: str) -> Optional[date]:
+    # account_events_y2026m01 -> 2026-01-01; the legacy file has no month
+    # and is always read.
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    year, _, month = name[len(PARTITION_PREFIX):].partition("m")
+    if not (year.isdigit() and month.isdigit()):
+        return None
+    return date(int(year), int(month), 1)
+
+
+# -------------------------------------------------------------------
+# Timeline / audit queries.
+#
+# Newest first, keyset-paginated on (occurred_at, id). Only the filters
+# actually given end up in the WHERE clause so each shape gets its own
+# plan: account, event type and actor each have a composite index ending
+# in (occurred_at DESC, id DESC); payload equality uses the GIN index
+# (payload @> ...), and payload comparisons compare jsonb values so
+# mixed payloads never raise a cast error. Balance adjustments also have
+# an expression index on the delta for "delta < -1000" style scans.
+# -------------------------------------------------------------------
+ACCOUNT_EVENTS_INDEXES_DDL = """
+    CREATE INDEX IF NOT EXISTS account_events_account_timeline_idx
+        ON account_events (account_id, occurred_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS account_events_type_timeline_idx
+        ON account_events (event_type, occurred_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS account_events_actor_timeline_idx
+        ON account_events (actor_type, actor_id, occurred_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS account_events_timeline_idx
+        ON account_events (occurred_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS account_events_payload_idx
+        ON account_events USING GIN (payload jsonb_path_ops);
+    CREATE INDEX IF NOT EXISTS account_events_balance_delta_idx
+        ON account_events ((payload -> 'delta'))
+        WHERE event_type = 'account.balance.adjusted';
+"""
+
+# Loose index scan over the event_type index: one probe per distinct type.
+EVENT_TYPES_SQL = """
+    WITH RECURSIVE t AS (
+        (SELECT event_type FROM account_events ORDER BY event_type LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT e.event_type FROM account_events e
+            WHERE e.event_type > t.event_type
+            ORDER BY e.event_type LIMIT 1
+        )
+        FROM t
+        WHERE t.event_type IS NOT NULL
+    )
+    SELECT event_type FROM t WHERE event_type IS NOT NULL;
+"""
+
+PAYLOAD_OPS = ("=", "!=", "<", "<=", ">", ">=")
+
+_PAYLOAD_KEY = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_PAYLOAD_FILTER = re.compile(r"\s*([A-Za-z_][A-Za-z0-9_]*)\s*(!=|<=|>=|=|<|>)\s*(.+?)\s*")
+
+
+def ensure_account_events_indexes() -> None:
+    execute_command(ACCOUNT_EVENTS_INDEXES_DDL)
+
+
+def account_event_types() -> list[str]:
+    return [r["event_type"] for r in execute_query(EVENT_TYPES_SQL)]
+
+
+def parse_payload_filter(text: str) -> tuple[str, str, Any]:
+    """
+    "delta < -1000" -> ("delta", "<", -1000). The value is read as JSON
+    (numbers, true/false, null, "quoted"), otherwise as a plain string.
+    """
+    match = _PAYLOAD_FILTER.fullmatch(text)
+    if not match:
+        raise ValueError(f"Expected 'key <op> value' with op in {', '.join(PAYLOAD_OPS)}: {text!r}")
+    key, op, raw = match.groups()
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    return key, op, value
+
+
+def _payload_clause(key: str, op: str, value: Any) -> tuple[str, list]:
+    if not _PAYLOAD_KEY.fullmatch(key) or op not in PAYLOAD_OPS:
+        raise ValueError(f"Unsupported payload filter: {key!r} {op!r}")
+    if op == "=":
+        return "payload @> %s::jsonb", [Json({key: value})]
+    if op == "!=":
+        return "payload ? %s AND NOT payload @> %s::jsonb", [key, Json({key: value})]
+    kind = "number" if isinstance(value, (int, float)) and not isinstance(value, bool) else "string"
+    return (
+        f"payload -> %s {op} %s::jsonb AND jsonb_typeof(payload -> %s) = %s",
+        [key, Json(value if kind == "number" else str(value)), key, kind],
+    )
+
+
+def account_events_timeline(
+    *,
+    account_id: Optional[int] = None,
+    event_types: Optional[Sequence[str]] = None,
+    actor_type: Optional[str] = None,
+    actor_id: Optional[int] = None,
+    payload_filters: Sequence[tuple[str, str, Any]] = (),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[tuple[datetime, int]] = None,
+    limit: int = 50,
+) -> tuple[list[dict], Optional[tuple[datetime, int]]]:
+    """
+    One page of events, newest first. `payload_filters` are (key, op,
+    value) triples, e.g. ("delta", "<", -1000); `after` is the
+    (occurred_at, id) of the last row of the previous page. Returns
+    (rows, cursor for the next page or None when this is the last page).
+    """
+    where, params = [], []
+
+    def add(clause: str, *values) -> None:
+        where.append(clause)
+        params.extend(values)
+
+    if account_id is not None:
+        add("account_id = %s", account_id)
+    event_types = list(event_types or [])
+    if len(event_types) == 1:
+        add("event_type = %s", event_types[0])  # lets partial indexes on one type match
+    elif event_types:
+        add("event_type = ANY(%s)", event_types)
+    if actor_type is not None:
+        add("actor_type = %s", actor_type)
+    if actor_id is not None:
+        add("actor_id = %s", actor_id)
+    for key, op, value in payload_filters:
+        clause, values = _payload_clause(key, op, value)
+        add(clause, *values)
+    if start is not None:
+        add("occurred_at >= %s", start)
+    if end is not None:
+        add("occurred_at < %s", end)
+    if after is not None:
+        add("(occurred_at, id) < (%s, %s)", *after)
+
+    rows = execute_query(
+        f"""
+        SELECT id, account_id, event_type, event_status, actor_type, actor_id, payload, occurred_at
+        FROM account_events
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY occurred_at DESC, id DESC
+        LIMIT %s;
+        """,
+        (*params, limit + 1),
+    )
+    page = rows[:limit]
+    cursor = (page[-1]["occurred_at"], page[-1]["id"]) if len(rows) > limit else None
+    return page, cursor
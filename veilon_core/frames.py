@@ -0,0 +1,187 @@
+from __future__ import annotations
+import time
+from dataclasses import dataclass
+from typing import Optional
+import pandas as pd
+from veilon_core.db import query_frame
+
+# -------------------------------------------------------------------
+# Typed frame schemas.
+#
+# query_frame returns what the driver hands back: Python objects for
+# text and NUMERIC and int64 for every id. A FrameSchema converts such
+# a frame column by column, in place: ids and counts are downcast (to
+# nullable Int32/Int64 when they hold NULLs), flags become bool or
+# nullable boolean, low-cardinality text becomes categorical, free text
+# becomes pyarrow-backed strings and timestamps are parsed once as UTC.
+# Queries cast NUMERIC to float8 in SQL so no Decimal objects are built.
+#
+#   python -m veilon_core.frames --rows 1000000   # memory benchmark
+# -------------------------------------------------------------------
+
+KINDS = ("id", "count", "money", "ratio", "flag", "category", "text", "timestamp")
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    kind: str
+    categories: Optional[tuple] = None  # fixed categories, in display order
+
+
+@dataclass(frozen=True)
+class FrameSchema:
+    name: str
+    columns: tuple
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Converts the schema's columns present in `df` in place and returns it."""
+        for column in self.columns:
+            if column.name in df.columns:
+                df[column.name] = _convert(df[column.name], column)
+        return df
+
+    def read(self, query, params=None) -> pd.DataFrame:
+        return self.apply(query_frame(query, params))
+
+
+def _convert(s: pd.Series, column: Column) -> pd.Series:
+    kind = column.kind
+    if kind in ("id", "count"):
+        hi, lo = s.max(), s.min()
+        wide = not pd.isna(hi) and (hi >= 2**31 or lo < -2**31)
+        if s.isna().any():
+            return s.astype("Int64" if wide else "Int32")
+        if kind == "id":  # ids stay at least 32-bit so frames from different filters line up
+            return s.astype("int64" if wide else "int32")
+        return pd.to_numeric(s, downcast="integer")
+    if kind == "money":
+        return s.astype("float64")
+    if kind == "ratio":
+        return s.astype("float32")
+    if kind == "flag":
+        return s.astype("boolean") if s.isna().any() else s.astype(bool)
+    if kind == "category":
+        if column.categories is None:
+            return s.astype("category")
+        extra = [v for v in pd.unique(s.dropna()) if v not in column.categories]
+        return pd.Series(pd.Categorical(s, categories=[*column.categories, *extra]), index=s.index, name=s.name)
+    if kind == "text":
+        return s.astype("string[pyarrow]")
+    if kind == "timestamp":
+        if isinstance(s.dtype, pd.DatetimeTZDtype):
+            return s
+        return pd.to_datetime(s, utc=True)
+    raise ValueError(f"Unknown column kind {kind!r}; expected one of {KINDS}")
+
+
+ACCOUNT_STATUSES = ("Phase 1", "Phase 2", "Funded", "In Review", "Closed", "Disabled")
+
+ACCOUNTS_SCHEMA = FrameSchema("accounts", (
+    Column("id", "id"),
+    Column("user_id", "id"),
+    Column("order_id", "id"),
+    Column("plan_id", "id"),
+    Column("balance", "money"),
+    Column("phase", "count"),
+    Column("is_enabled", "flag"),
+    Column("is_funded", "flag"),
+    Column("in_review", "flag"),
+    Column("status", "category", ACCOUNT_STATUSES),
+    Column("created_at", "timestamp"),
+    Column("funded_at", "timestamp"),
+    Column("closed_at", "timestamp"),
+    Column("notes", "text"),
+))
+
+ORDERS_SCHEMA = FrameSchema("orders", (
+    Column("id", "id"),
+    Column("user_id", "id"),
+    Column("email", "text"),
+    Column("plan_id", "id"),
+    Column("plan_name", "category"),
+    Column("amount", "money"),
+    Column("status", "category"),
+    Column("coupon_code", "category"),
+    Column("refunded_amount", "money"),
+    Column("created_at", "timestamp"),
+))
+
+TRADE_STATS_SCHEMA = FrameSchema("trade_stats", (
+    Column("n_trades", "count"),
+    Column("win_rate", "ratio"),
+    Column("profit_factor", "ratio"),
+    Column("avg_r", "ratio"),
+    Column("max_drawdown", "money"),
+    Column("sharpe", "ratio"),
+    Column("consistency", "ratio"),
+))
+
+
+def _legacy_frames(rows: int) -> dict:
+    """The pre-schema path: rows through execute_query into list-of-dict frames."""
+    from veilon_core.accounts import derive_status
+    from veilon_core.db import execute_query
+
+    accounts = pd.DataFrame(execute_query("SELECT * FROM accounts ORDER BY id LIMIT %s;", (rows,)))
+    accounts["status"] = accounts.apply(derive_status, axis=1)
+    orders = pd.DataFrame(execute_query(
+        """
+        SELECT o.id, o.user_id, u.email, o.plan_id, p.name AS plan_name,
+               o.amount, o.status, o.coupon_code, o.refunded_amount, o.created_at
+        FROM orders o
+        LEFT JOIN users u ON u.id = o.user_id
+        LEFT JOIN plans p ON p.id = o.plan_id
+        ORDER BY o.id
+        LIMIT %s;
+        """,
+        (rows,),
+    ))
+    return {"accounts": accounts, "orders": orders}
+
+
+def benchmark(rows: int = 1_000_000) -> dict:
+    """
+    Builds the accounts and orders frames (up to `rows` rows each) the old
+    way and through the schemas, and reports deep memory and build time.
+    Needs a dataset of that size (python -m veilon_core.synthetic).
+    """
+    from veilon_core.accounts import accounts_frame
+    from veilon_core.orders import orders_frame
+
+    started = time.perf_counter()
+    legacy = _legacy_frames(rows)
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    compact = {"accounts": accounts_frame(limit=rows), "orders": orders_frame(limit=rows)}
+    compact_seconds = time.perf_counter() - started
+
+    def mb(df: pd.DataFrame) -> float:
+        return round(df.memory_usage(deep=True).sum() / 2**20, 1)
+
+    result = {"legacy_seconds": round(legacy_seconds, 2), "compact_seconds": round(compact_seconds, 2)}
+    for name in ("accounts", "orders"):
+        before, after = mb(legacy[name]), mb(compact[name])
+        result[name] = {
+            "rows": len(compact[name]),
+            "legacy_mb": before,
+            "compact_mb": after,
+            "reduction": f"{1 - after / before:.0%}" if before else None,
+            "dtypes": {c: str(t) for c, t in compact[name].dtypes.items()},
+        }
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from veilon_core.config import load_env
+
+    parser = argparse.ArgumentParser(description="Compact frame memory benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    load_env()
+    print(json.dumps(benchmark(args.rows), indent=2))
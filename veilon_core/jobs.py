@@ -0,0 +1,352 @@
+from __future__ import annotations
+import importlib
+import json
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from psycopg2.extras import Json
+from veilon_core.db import execute_command, execute_query, get_connection
+
+# -------------------------------------------------------------------
+# Headless batch jobs.
+#
+#   python -m veilon_core.jobs migrate
+#   python -m veilon_core.jobs rules --chunk-size 50000
+#   python -m veilon_core.jobs nightly
+#   python -m veilon_core.jobs --list
+#
+# Runs outside Streamlit: DB credentials come from DB_* in the
+# environment / .env (veilon_core.config), and nothing here imports
+# streamlit. Every run is recorded in job_runs. A job holds a session
+# advisory lock while it runs, so a second invocation of the same job
+# fails fast instead of processing the same accounts. Account-chunked
+# jobs checkpoint the last account id after each chunk (each chunk is its
+# own transaction); a run that died part-way is continued from that id
+# only when asked with --resume. Otherwise every run starts from the
+# first account.
+#
+# `migrate` runs every module's ensure_* DDL in dependency order; run it
+# on deploy (nightly also starts with it). Each job's own setup only
+# covers the tables that job writes.
+# -------------------------------------------------------------------
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+JOB_RUNS_DDL = """
+    CREATE TABLE IF NOT EXISTS job_runs (
+        id           BIGSERIAL    PRIMARY KEY,
+        job          TEXT         NOT NULL,
+        status       TEXT         NOT NULL DEFAULT 'running',   -- running | done | failed
+        options      JSONB        NOT NULL DEFAULT '{}',
+        cursor       BIGINT,                                     -- last account id completed
+        chunks       INTEGER      NOT NULL DEFAULT 0,
+        result       JSONB        NOT NULL DEFAULT '{}',
+        error        TEXT,
+        started_at   TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+        updated_at   TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+        finished_at  TIMESTAMPTZ
+    );
+
+    CREATE INDEX IF NOT EXISTS job_runs_job_idx ON job_runs (job, id DESC);
+"""
+
+# Session-level, held on a dedicated connection for the whole run.
+JOB_LOCK_SQL = "SELECT pg_try_advisory_lock(hashtext('veilon_core.jobs'), hashtext(%s));"
+
+NEXT_CHUNK_SQL = """
+    SELECT MAX(id) AS upto_id
+    FROM (SELECT id FROM accounts WHERE id > %s ORDER BY id LIMIT %s) chunk;
+"""
+
+
+@dataclass(frozen=True)
+class Job:
+    name: str
+    target: str           # "module:function", imported when the job runs
+    description: str
+    chunked: bool = False  # target takes account_range=(after_id, upto_id)
+    options: tuple = ()    # option names forwarded as keyword arguments
+    setup: tuple = ()      # "module:function"s run first (ensure_* DDL)
+
+    def load(self) -> Callable[..., Any]:
+        return _resolve(self.target)
+
+
+def _resolve(target: str) -> Callable[..., Any]:
+    module, _, attr = target.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+# Schema helpers in dependency order: plan and order columns first (later
+# DDL indexes them), then the tables each feature adds.
+MIGRATIONS = (
+    "veilon_core.plans:ensure_plan_rule_columns",
+    "veilon_core.plans:ensure_plan_payout_columns",
+    "veilon_core.orders:ensure_orders_columns",
+    "veilon_core.stripe_events:ensure_stripe_tables",
+    "veilon_core.affiliates:ensure_affiliate_tables",
+    "veilon_core.coupons:ensure_coupon_tables",
+    "veilon_core.trades:ensure_trades_tables",
+    "veilon_core.stats:ensure_trade_stats_table",
+    "veilon_core.trackers:ensure_equity_snapshots_table",
+    "veilon_core.equity:ensure_equity_tables",
+    "veilon_core.rules:ensure_rule_state_table",
+    "veilon_core.events:account_events_migrate_to_partitioned",
+    "veilon_core.events:ensure_account_events_indexes",
+    "veilon_core.search:ensure_search_columns",
+    "veilon_core.dashboard:ensure_dashboard_indexes",
+    "veilon_core.payouts:ensure_payouts_indexes",
+    "veilon_core.balances:ensure_balance_snapshots_table",
+    "veilon_core.users:ensure_cohort_tables",
+)
+
+
+def migrate() -> dict:
+    """Runs every MIGRATIONS helper in order. All are idempotent."""
+    for target in MIGRATIONS:
+        t0 = time.perf_counter()
+        _resolve(target)()
+        _log("migrate", f"{target.partition(':')[2]} in {time.perf_counter() - t0:.2f}s")
+    return {"migrations": len(MIGRATIONS)}
+
+
+JOBS = {
+    job.name: job
+    for job in (
+        Job("migrate", "veilon_core.jobs:migrate",
+            "Create or update every table, column and index the app and jobs use."),
+        Job("rules", "veilon_core.rules:run_rule_engine",
+            "Phase promotions, breach closes and reviews for active accounts.",
+            chunked=True, options=("dry_run",),
+            setup=("veilon_core.plans:ensure_plan_rule_columns", "veilon_core.rules:ensure_rule_state_table")),
+        Job("equity-rollup", "veilon_core.equity:rollup_equity",
+            "Roll equity snapshots into 1m/1h/1d buckets.", options=("keep_raw_days",),
+            setup=("veilon_core.trackers:ensure_equity_snapshots_table", "veilon_core.equity:ensure_equity_tables")),
+        Job("trade-stats", "veilon_core.stats:refresh_trade_stats",
+            "Fold new closing deals into account_trade_stats.", options=("full",),
+            setup=("veilon_core.trades:ensure_trades_tables",)),
+        Job("events-partitions", "veilon_core.events:account_events_ensure_partitions",
+            "Create upcoming monthly account_events partitions.", options=("months_ahead",),
+            setup=("veilon_core.events:account_events_migrate_to_partitioned",
+                   "veilon_core.events:ensure_account_events_indexes")),
+        Job("events-archive", "veilon_core.events:account_events_archive",
+            "Export old account_events partitions to Parquet and detach them.", options=("keep_months",)),
+        Job("affiliates", "veilon_core.affiliates:run_commissions",
+            "Attribute new orders and compute affiliate commissions and clawbacks.",
+            setup=("veilon_core.affiliates:ensure_affiliate_tables",)),
+        Job("balance-snapshot", "veilon_core.balances:snapshot_balances",
+            "Snapshot yesterday's end-of-day balance of every open account.",
+            setup=("veilon_core.balances:ensure_balance_snapshots_table",)),
+        Job("balance-backfill", "veilon_core.balances:backfill_balance_snapshots",
+            "Rebuild past balance snapshots from account_events.",
+            chunked=True, options=("days",), setup=("veilon_core.balances:ensure_balance_snapshots_table",)),
+        Job("cohorts", "veilon_core.users:refresh_cohorts",
+            "Refresh signup-month funnel cohorts (recent months; --full for all).", options=("full",),
+            setup=("veilon_core.users:ensure_cohort_tables",)),
+        Job("stripe-apply", "veilon_core.stripe_events:apply_pending_events",
+            "Apply stored Stripe webhook events to orders and accounts.",
+            setup=("veilon_core.stripe_events:ensure_stripe_tables",)),
+    )
+}
+
+# Run in order by `nightly`; a failure stops the sequence.
+NIGHTLY = (
+    "migrate", "balance-snapshot", "events-partitions", "trade-stats", "equity-rollup",
+    "rules", "affiliates", "cohorts", "events-archive",
+)
+
+
+def ensure_job_tables() -> None:
+    execute_command(JOB_RUNS_DDL)
+
+
+def _log(job: str, message: str) -> None:
+    print(f"[{time.strftime('%H:%M:%S')}] {job}: {message}", file=sys.stderr, flush=True)
+
+
+def _merge(total: dict, part: Any) -> dict:
+    """Sums numeric fields of chunk results; keeps the last value of others."""
+    if not isinstance(part, dict):
+        return {**total, "result": part}
+    for key, value in part.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+        else:
+            total[key] = value
+    return total
+
+
+@contextmanager
+def _job_lock(name: str):
+    """Holds the job's advisory lock; raises if another process has it."""
+    conn = get_connection()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(JOB_LOCK_SQL, (name,))
+            if not cursor.fetchone()[0]:
+                raise RuntimeError(f"Job {name!r} is already running in another process.")
+        yield
+    finally:
+        conn.close()  # releases the lock
+
+
+def _start_run(job: Job, options: dict, resume: bool) -> dict:
+    # Called under the job lock, so any run still marked running is dead.
+    execute_command(
+        """
+        UPDATE job_runs
+        SET status = 'failed', error = 'abandoned', updated_at = NOW(), finished_at = NOW()
+        WHERE job = %s AND status = 'running';
+        """,
+        (job.name,),
+    )
+    if job.chunked and resume:
+        rows = execute_query(
+            """
+            SELECT id, cursor, chunks, result FROM job_runs
+            WHERE job = %s AND status = 'failed' AND options = %s
+              AND id > COALESCE((SELECT MAX(id) FROM job_runs WHERE job = %s AND status = 'done'), 0)
+            ORDER BY id DESC LIMIT 1;
+            """,
+            (job.name, Json(options), job.name),
+        )
+        if rows:
+            execute_command(
+                "UPDATE job_runs SET status = 'running', error = NULL, finished_at = NULL, updated_at = NOW() WHERE id = %s;",
+                (rows[0]["id"],),
+            )
+            return dict(rows[0])
+        _log(job.name, "no failed run with these options to resume; starting a new one")
+    rows = execute_query(
+        "INSERT INTO job_runs (job, options) VALUES (%s, %s) RETURNING id, cursor, chunks, result;",
+        (job.name, Json(options)),
+    )
+    if not rows:
+        raise RuntimeError("Could not record job run; is the database reachable?")
+    return dict(rows[0])
+
+
+def _checkpoint(run_id: int, cursor: Optional[int], chunks: int, result: dict) -> None:
+    execute_command(
+        "UPDATE job_runs SET cursor = %s, chunks = %s, result = %s, updated_at = NOW() WHERE id = %s;",
+        (cursor, chunks, Json(result, dumps=lambda o: json.dumps(o, default=str)), run_id),
+    )
+
+
+def _finish(run_id: int, status: str, result: dict, error: Optional[str] = None) -> None:
+    execute_command(
+        """
+        UPDATE job_runs
+        SET status = %s, result = %s, error = %s, updated_at = NOW(), finished_at = NOW()
+        WHERE id = %s;
+        """,
+        (status, Json(result, dumps=lambda o: json.dumps(o, default=str)), error, run_id),
+    )
+
+
+def run_job(name: str, *, chunk_size: int = DEFAULT_CHUNK_SIZE, resume: bool = False, **options) -> dict:
+    """
+    Runs one job and returns its result with timing. Unknown options for
+    the job are ignored so a shared CLI can pass everything through.
+    resume=True continues the latest failed run of a chunked job (same
+    options, no successful run since) from its checkpoint.
+    """
+    job = JOBS[name]
+    options = {k: v for k, v in options.items() if k in job.options and v is not None}
+    fn = job.load()
+    with _job_lock(name):
+        for setup in job.setup:
+            _resolve(setup)()
+        run = _start_run(job, options, resume)
+        return _run(job, fn, run, options, chunk_size)
+
+
+def _run(job: Job, fn: Callable[..., Any], run: dict, options: dict, chunk_size: int) -> dict:
+    name = job.name
+    started = time.perf_counter()
+    result = dict(run["result"] or {}) if job.chunked else {}
+
+    try:
+        if not job.chunked:
+            out = fn(**options)
+            result = out if isinstance(out, dict) else {"result": out}
+        else:
+            cursor, chunks = run["cursor"] or 0, run["chunks"]
+            if cursor:
+                _log(name, f"resuming run {run['id']} after account {cursor} ({chunks} chunks done)")
+            while True:
+                upto = execute_query(NEXT_CHUNK_SQL, (cursor, chunk_size))
+                upto = upto[0]["upto_id"] if upto else None
+                if upto is None:
+                    break
+                t0 = time.perf_counter()
+                part = fn(account_range=(cursor, upto), **options)
+                result = _merge(result, part)
+                cursor, chunks = upto, chunks + 1
+                _checkpoint(run["id"], cursor, chunks, result)
+                _log(name, f"chunk {chunks} accounts ..{upto} in {time.perf_counter() - t0:.2f}s")
+            result["chunks"] = chunks
+    except BaseException as e:
+        _finish(run["id"], "failed", result, f"{type(e).__name__}: {e}")
+        _log(name, f"failed after {time.perf_counter() - started:.2f}s: {e}")
+        raise
+
+    result["job_seconds"] = round(time.perf_counter() - started, 3)
+    _finish(run["id"], "done", result)
+    _log(name, f"done in {result['job_seconds']}s")
+    return result
+
+
+def run_nightly(**kwargs) -> dict:
+    results = {}
+    for name in NIGHTLY:
+        results[name] = run_job(name, **kwargs)
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m veilon_core.jobs", description="Run veilon batch jobs")
+    parser.add_argument("job", nargs="?", choices=[*JOBS, "nightly"])
+    parser.add_argument("--list", action="store_true", help="list jobs and exit")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="accounts per chunk")
+    parser.add_argument("--resume", action="store_true", help="continue the last failed run from its checkpoint")
+    parser.add_argument("--dry-run", action="store_true", default=None)
+    parser.add_argument("--full", action="store_true", default=None)
+    parser.add_argument("--keep-months", type=int)
+    parser.add_argument("--keep-raw-days", type=int)
+    parser.add_argument("--months-ahead", type=int)
+    parser.add_argument("--days", type=int, help="balance-backfill: days ending yesterday (default: all)")
+    args = parser.parse_args(argv)
+
+    if args.list or not args.job:
+        for job in JOBS.values():
+            print(f"{job.name:<18} {job.description}")
+        print(f"{'nightly':<18} {', '.join(NIGHTLY)}")
+        return 0
+
+    from veilon_core.config import load_env
+
+    load_env()
+    ensure_job_tables()
+    kwargs = dict(
+        chunk_size=args.chunk_size,
+        resume=args.resume,
+        dry_run=args.dry_run,
+        full=args.full,
+        keep_months=args.keep_months,
+        keep_raw_days=args.keep_raw_days,
+        months_ahead=args.months_ahead,
+        days=args.days,
+    )
+    result = run_nightly(**kwargs) if args.job == "nightly" else run_job(args.job, **kwargs)
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+import pandas as pd
+from veilon_core.db import execute_command, execute_query, query_frame
+from veilon_core.timeframes import timeframe_bounds
+
+# -------------------------------------------------------------------
+# Orders: revenue/refund aggregates and the paginated order ledger.
+#
+# Aggregates for a timeframe come from one GROUPING SETS query (totals,
+# per plan, per coupon) over a created_at range scan. The ledger is
+# keyset-paginated on (created_at, id) so every page is an index range
+# scan, however deep the admin pages.
+# -------------------------------------------------------------------
+
+PAID_ORDER_STATUSES = ("paid", "completed")
+REFUNDED_ORDER_STATUSES = ("refunded", "partially_refunded")
+FAILED_ORDER_STATUSES = ("failed", "declined", "canceled")
+# Charges that went through, whether or not they were refunded later.
+SETTLED_ORDER_STATUSES = PAID_ORDER_STATUSES + REFUNDED_ORDER_STATUSES
+
+ORDER_STATUSES = ("pending",) + SETTLED_ORDER_STATUSES + FAILED_ORDER_STATUSES
+
+ORDERS_DDL = """
+    ALTER TABLE orders
+        ADD COLUMN IF NOT EXISTS coupon_code      TEXT,
+        ADD COLUMN IF NOT EXISTS discount_amount  NUMERIC(18, 2),
+        ADD COLUMN IF NOT EXISTS refunded_amount  NUMERIC(18, 2) NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS refunded_at      TIMESTAMPTZ;   -- last change to the refund
+
+    CREATE INDEX IF NOT EXISTS orders_created_id_idx ON orders (created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS orders_status_created_idx ON orders (status, created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS orders_user_created_idx ON orders (user_id, created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS orders_plan_created_idx ON orders (plan_id, created_at DESC, id DESC);
+"""
+
+# A fully refunded order without an explicit refunded_amount refunds its amount.
+REFUND_EXPR = """
+    CASE WHEN status = 'refunded' THEN GREATEST(refunded_amount, amount) ELSE refunded_amount END
+"""
+
+ORDERS_KPIS_SQL = f"""
+    SELECT
+        GROUPING(o.plan_id) AS by_all_plans,
+        GROUPING(o.coupon_code) AS by_all_coupons,
+        o.plan_id,
+        p.name AS plan_name,
+        o.coupon_code,
+        COUNT(*) AS orders,
+        COUNT(*) FILTER (WHERE o.status = ANY(%(settled)s)) AS settled,
+        COUNT(*) FILTER (WHERE o.status = ANY(%(failed)s)) AS failed,
+        COALESCE(SUM(o.amount) FILTER (WHERE o.status = ANY(%(settled)s)), 0)::float8 AS gross_revenue,
+        COALESCE(SUM({REFUND_EXPR}) FILTER (WHERE o.status = ANY(%(settled)s)), 0)::float8 AS refunds
+    FROM orders o
+    LEFT JOIN plans p ON p.id = o.plan_id
+    WHERE (%(start)s::timestamptz IS NULL OR o.created_at >= %(start)s)
+      AND o.created_at < %(end)s
+    GROUP BY GROUPING SETS ((), (o.plan_id, p.name), (o.coupon_code));
+"""
+
+
+def ensure_orders_columns() -> None:
+    execute_command(ORDERS_DDL)
+
+
+def _with_rates(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df["net_revenue"] = df["gross_revenue"] - df["refunds"]
+    attempts = df["settled"] + df["failed"]
+    df["success_rate"] = (df["settled"] / attempts.where(attempts > 0)).astype(float)
+    return df
+
+
+def orders_kpis(timeframe: str) -> dict:
+    """
+    {"totals": {...}, "by_plan": DataFrame, "by_coupon": DataFrame} for a
+    timeframe. Success rate is settled / (settled + failed); pending
+    orders are left out of it.
+    """
+    bounds = timeframe_bounds(timeframe)
+    df = query_frame(
+        ORDERS_KPIS_SQL,
+        {
+            "start": bounds.start,
+            "end": bounds.end,
+            "settled": list(SETTLED_ORDER_STATUSES),
+            "failed": list(FAILED_ORDER_STATUSES),
+        },
+    )
+    df = _with_rates(df)
+    metrics = ["orders", "settled", "failed", "gross_revenue", "refunds", "net_revenue", "success_rate"]
+
+    totals = df[(df["by_all_plans"] == 1) & (df["by_all_coupons"] == 1)]
+    by_plan = df[(df["by_all_plans"] == 0) & (df["by_all_coupons"] == 1)]
+    by_coupon = df[(df["by_all_plans"] == 1) & (df["by_all_coupons"] == 0)]
+
+    return {
+        "totals": totals[metrics].iloc[0].to_dict() if len(totals) else dict.fromkeys(metrics, 0),
+        "by_plan": by_plan[["plan_id", "plan_name", *metrics]].sort_values("net_revenue", ascending=False).reset_index(drop=True),
+        "by_coupon": by_coupon[["coupon_code", *metrics]].sort_values("net_revenue", ascending=False).reset_index(drop=True),
+    }
+
+
+ORDERS_FRAME_SQL = """
+    SELECT o.id, o.user_id, u.email, o.plan_id, p.name AS plan_name,
+           o.amount::float8 AS amount, o.status, o.coupon_code,
+           o.refunded_amount::float8 AS refunded_amount, o.created_at
+    FROM orders o
+    LEFT JOIN users u ON u.id = o.user_id
+    LEFT JOIN plans p ON p.id = o.plan_id
+    WHERE (%(status)s::text IS NULL OR o.status = %(status)s)
+      AND (%(plan_id)s::bigint IS NULL OR o.plan_id = %(plan_id)s)
+      AND (%(user_id)s::bigint IS NULL OR o.user_id = %(user_id)s)
+      AND (%(created_from)s::timestamptz IS NULL OR o.created_at >= %(created_from)s)
+      AND (%(created_to)s::timestamptz IS NULL OR o.created_at < %(created_to)s)
+    ORDER BY o.id
+    LIMIT %(limit)s;
+"""
+
+
+def orders_frame(
+    *,
+    status: Optional[str] = None,
+    plan_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    limit: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Orders for exports and analysis as a typed frame (frames.ORDERS_SCHEMA):
+    categorical status, plan and coupon, downcast ids.
+    """
+    from veilon_core.frames import ORDERS_SCHEMA
+
+    return ORDERS_SCHEMA.read(ORDERS_FRAME_SQL, {
+        "status": status,
+        "plan_id": plan_id,
+        "user_id": user_id,
+        "created_from": created_from,
+        "created_to": created_to,
+        "limit": limit,
+    })
+
+
+def orders_ledger(
+    *,
+    status: Optional[str] = None,
+    plan_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    email: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    after: Optional[tuple[datetime, int]] = None,
+    limit: int = 50,
+) -> tuple[list[dict], Optional[tuple[datetime, int]]]:
+    """
+    One page of orders, newest first. `after` is the (created_at, id) of
+    the last row of the previous page. Returns (rows, cursor for the next
+    page or None when this is the last page).
+    """
+    after_at, after_id = after if after else (None, None)
+    rows = execute_query(
+        """
+        SELECT o.id, o.user_id, u.email, o.plan_id, p.name AS plan_name,
+               o.amount, o.status, o.coupon_code, o.refunded_amount, o.created_at
+        FROM orders o
+        LEFT JOIN users u ON u.id = o.user_id
+        LEFT JOIN plans p ON p.id = o.plan_id
+        WHERE (%(status)s::text IS NULL OR o.status = %(status)s)
+          AND (%(plan_id)s::bigint IS NULL OR o.plan_id = %(plan_id)s)
+          AND (%(user_id)s::bigint IS NULL OR o.user_id = %(user_id)s)
+          AND (%(email)s::text IS NULL OR o.user_id = (SELECT id FROM users WHERE email = %(email)s))
+          AND (%(created_from)s::timestamptz IS NULL OR o.created_at >= %(created_from)s)
+          AND (%(created_to)s::timestamptz IS NULL OR o.created_at < %(created_to)s)
+          AND (%(after_at)s::timestamptz IS NULL OR (o.created_at, o.id) < (%(after_at)s, %(after_id)s))
+        ORDER BY o.created_at DESC, o.id DESC
+        LIMIT %(limit)s;
+        """,
+        {
+            "status": status,
+            "plan_id": plan_id,
+            "user_id": user_id,
+            "email": email,
+            "created_from": created_from,
+            "created_to": created_to,
+            "after_at": after_at,
+            "after_id": after_id,
+            "limit": limit + 1,
+        },
+    )
+    page = rows[:limit]
+    cursor = (page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+    return page, cursor
@@ -0,0 +1,258 @@
+from __future__ import annotations
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+import numpy as np
+import pandas as pd
+from veilon_core.db import execute_command, execute_query, query_frame
+from veilon_core.equity import ROLLUP_LAG
+
+# -------------------------------------------------------------------
+# Payout liability forecasting.
+#
+# Inputs are one row per open funded account: balance, plan size, profit
+# split, payout cycle and the anchor its current cycle started from (last
+# payout request, else funding date). The balance is the latest equity
+# snapshot (the live tracker's, or the last daily rollup once raw points
+# are pruned); accounts.balance only covers accounts never snapshotted.
+# Inputs are cached in memory and refreshed incrementally: only accounts
+# with new account_events, payout rows or equity snapshots since the last
+# watermarks are re-read.
+#
+# forecast_payouts() is pure NumPy over the cached arrays, so an admin can
+# change the scenario assumptions and get a new forecast without touching
+# the database.
+# -------------------------------------------------------------------
+
+PENDING_PAYOUT_STATUSES = ("pending", "requested", "approved")
+VOID_PAYOUT_STATUSES = ("rejected", "cancelled", "failed")
+
+PAYOUTS_INDEXES_DDL = """
+    CREATE INDEX IF NOT EXISTS payouts_account_id_idx ON payouts (account_id, created_at DESC);
+    CREATE INDEX IF NOT EXISTS payouts_status_idx ON payouts (status);
+    -- Snapshot watermark and "accounts snapshotted since" for incremental refresh.
+    CREATE INDEX IF NOT EXISTS account_equity_snapshots_captured_idx
+        ON account_equity_snapshots (captured_at);
+"""
+
+FORECAST_INPUTS_SQL = """
+    SELECT
+        a.id AS account_id,
+        COALESCE(s.balance, d.balance_close, a.balance, p.account_size)::float8 AS balance,
+        p.account_size::float8 AS account_size,
+        p.profit_split_pct::float8 AS profit_split_pct,
+        p.payout_cycle_days,
+        COALESCE(lp.last_payout_at, a.funded_at, a.created_at) AS cycle_anchor
+    FROM accounts a
+    JOIN plans p ON p.id = a.plan_id
+    LEFT JOIN LATERAL (
+        SELECT balance
+        FROM account_equity_snapshots
+        WHERE account_id = a.id
+        ORDER BY captured_at DESC
+        LIMIT 1
+    ) s ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT balance_close
+        FROM account_equity_1d
+        WHERE account_id = a.id
+        ORDER BY bucket DESC
+        LIMIT 1
+    ) d ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT MAX(created_at) AS last_payout_at
+        FROM payouts
+        WHERE account_id = a.id
+          AND status <> ALL(%(void)s)
+    ) lp ON TRUE
+    WHERE (COALESCE(a.is_funded, FALSE) OR a.funded_at IS NOT NULL)
+      AND a.closed_at IS NULL
+      AND COALESCE(a.is_enabled, TRUE)
+      AND (%(account_ids)s::bigint[] IS NULL OR a.id = ANY(%(account_ids)s))
+    ORDER BY a.id;
+"""
+
+
+def ensure_payouts_indexes() -> None:
+    execute_command(PAYOUTS_INDEXES_DDL)
+
+
+@dataclass(frozen=True)
+class PayoutScenario:
+    horizon_days: int = 30
+    daily_return_pct: float = 0.15     # expected profit per day, % of account size
+    request_rate: float = 0.85         # share of eligible traders who request
+    monthly_breach_rate: float = 0.10  # chance a funded account is lost per 30 days
+    min_payout: float = 100.0          # trader share below this is not paid out
+
+
+class PayoutForecastInputs:
+    """
+    In-memory forecast inputs with incremental refresh. refresh() reloads
+    everything the first time (and every `full_every` calls, to pick up
+    payout status changes), otherwise only accounts touched since the
+    last call.
+    """
+
+    def __init__(self, full_every: int = 60):
+        self.frame: Optional[pd.DataFrame] = None
+        self.event_mark = 0
+        self.payout_mark = 0
+        self.snapshot_mark: Optional[datetime] = None
+        self.full_every = full_every
+        self.refreshes = 0
+        self.last_changed = 0
+        self._lock = threading.Lock()
+
+    def _marks(self) -> tuple[int, int, Optional[datetime]]:
+        rows = execute_query(
+            """
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) FROM account_events) AS event_mark,
+                (SELECT COALESCE(MAX(id), 0) FROM payouts) AS payout_mark,
+                (SELECT MAX(captured_at) FROM account_equity_snapshots) AS snapshot_mark;
+            """
+        )
+        if not rows:
+            return self.event_mark, self.payout_mark, self.snapshot_mark
+        return rows[0]["event_mark"], rows[0]["payout_mark"], rows[0]["snapshot_mark"]
+
+    def _load(self, account_ids: Optional[Sequence[int]] = None) -> pd.DataFrame:
+        df = query_frame(
+            FORECAST_INPUTS_SQL,
+            {"void": list(VOID_PAYOUT_STATUSES), "account_ids": None if account_ids is None else list(account_ids)},
+        )
+        df["cycle_anchor"] = pd.to_datetime(df["cycle_anchor"], utc=True)
+        return df.set_index("account_id")
+
+    def refresh(self, full: bool = False) -> "PayoutForecastInputs":
+        with self._lock:
+            event_mark, payout_mark, snapshot_mark = self._marks()
+            full = full or self.frame is None or self.refreshes % self.full_every == 0
+
+            if full:
+                frame = self._load()
+                self.last_changed = len(frame)
+            else:
+                changed = [
+                    r["account_id"]
+                    for r in execute_query(
+                        """
+                        SELECT account_id FROM account_events WHERE id > %s AND id <= %s
+                        UNION
+                        SELECT account_id FROM payouts WHERE id > %s AND id <= %s
+                        UNION
+                        SELECT account_id FROM account_equity_snapshots
+                        WHERE captured_at > COALESCE(%s::timestamptz, '-infinity') AND captured_at <= %s;
+                        """,
+                        (
+                            self.event_mark, event_mark, self.payout_mark, payout_mark,
+                            # Points land up to ROLLUP_LAG late; re-reading an account twice is harmless.
+                            self.snapshot_mark - ROLLUP_LAG if self.snapshot_mark else None, snapshot_mark,
+                        ),
+                    )
+                    if r["account_id"] is not None
+                ]
+                self.last_changed = len(changed)
+                frame = self.frame
+                if changed:
+                    fresh = self._load(changed)
+                    frame = pd.concat([frame.drop(index=changed, errors="ignore"), fresh]).sort_index()
+
+            # Swap in one assignment so readers never see a half-built frame.
+            self.frame = frame
+            self.event_mark, self.payout_mark, self.snapshot_mark = event_mark, payout_mark, snapshot_mark
+            self.refreshes += 1
+            return self
+
+
+def forecast_payouts(
+    inputs: PayoutForecastInputs,
+    scenario: PayoutScenario = PayoutScenario(),
+    now: Optional[datetime] = None,
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Expected trader payouts over the scenario horizon.
+
+    Each account pays out at the end of its current cycle and every cycle
+    after that within the horizon. The first window pays the accrued
+    profit plus expected growth until then; later windows pay one cycle
+    of growth (the balance resets to account size after a payout). Every
+    window is weighted by the chance the account survives until then and
+    by the request rate, and skipped if below the minimum payout.
+
+    Returns (per-account frame, summary dict with totals and a per-day
+    liability series).
+    """
+    frame = inputs.frame
+    horizon = int(scenario.horizon_days)
+    if frame is None or frame.empty:
+        empty = pd.DataFrame(columns=["next_payout_in_days", "accrued", "next_expected", "expected_total"])
+        return empty, {"accounts": 0, "accrued_liability": 0.0, "forecast_total": 0.0,
+                       "eligible_now": 0, "daily": np.zeros(horizon + 1)}
+
+    now = pd.Timestamp(now or datetime.now(timezone.utc))
+    size = frame["account_size"].to_numpy(dtype=float, copy=True)
+    balance = frame["balance"].to_numpy(dtype=float, copy=True)
+    split = frame["profit_split_pct"].to_numpy(dtype=float, copy=True) / 100
+    cycle = np.maximum(frame["payout_cycle_days"].to_numpy(dtype=np.int64, copy=True), 1)
+    elapsed = ((now - frame["cycle_anchor"]).dt.total_seconds().to_numpy(dtype=float, copy=True) // 86_400).astype(np.int64)
+    days_to_next = np.maximum(cycle - elapsed, 0)
+
+    accrued = np.maximum(balance - size, 0.0)
+    drift = size * scenario.daily_return_pct / 100
+
+    # windows[i, k]: days from now until account i's k-th payout window.
+    n_windows = horizon // int(cycle.min()) + 1
+    k = np.arange(n_windows)
+    windows = days_to_next[:, None] + k[None, :] * cycle[:, None]
+    profit = np.where(k[None, :] == 0, (accrued + drift * days_to_next)[:, None], (drift * cycle)[:, None])
+    share = split[:, None] * profit
+
+    survival = (1 - scenario.monthly_breach_rate) ** (windows / 30)
+    live = (windows <= horizon) & (share >= scenario.min_payout)
+    expected = np.where(live, share * survival * scenario.request_rate, 0.0)
+
+    per_account = pd.DataFrame(
+        {
+            "next_payout_in_days": days_to_next,
+            "accrued": split * accrued,
+            "next_expected": expected[:, 0],
+            "expected_total": expected.sum(axis=1),
+        },
+        index=frame.index,
+    )
+    daily = np.bincount(windows[live], weights=expected[live], minlength=horizon + 1)[: horizon + 1]
+
+    summary = {
+        "accounts": len(frame),
+        "accrued_liability": float((split * accrued).sum()),
+        "forecast_total": float(expected.sum()),
+        "eligible_now": int(((days_to_next == 0) & (split * accrued >= scenario.min_payout)).sum()),
+        "daily": daily,
+    }
+    return per_account, summary
+
+
+def pending_payouts_total() -> float:
+    rows = execute_query(
+        """
+        SELECT COALESCE(SUM(amount), 0) AS pending
+        FROM payouts
+        WHERE status = ANY(%s);
+        """,
+        (list(PENDING_PAYOUT_STATUSES),),
+    )
+    return float(rows[0]["pending"]) if rows else 0.0
+
+
+_forecast_inputs = PayoutForecastInputs()
+
+
+def forecast_inputs() -> PayoutForecastInputs:
+    """
+    Process-wide inputs, refreshed incrementally. Registered with the
+    scheduler so pages only ever read the cached frame.
+    """
+    return _forecast_inputs.refresh()
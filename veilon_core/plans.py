@@ -0,0 +1,70 @@
+from __future__ import annotations
+from typing import Optional
+from veilon_core.db import execute_command, execute_query
+import pandas as pd
+
+# -------------------------------------------------------------------
+# Plan rule columns. Percentages are of the plan's account_size.
+# phase_count is the number of evaluation phases before funding.
+# -------------------------------------------------------------------
+PLAN_RULES_DDL = """
+    ALTER TABLE plans
+        ADD COLUMN IF NOT EXISTS profit_target_pct          NUMERIC(6, 3) NOT NULL DEFAULT 8,
+        ADD COLUMN IF NOT EXISTS max_daily_loss_pct         NUMERIC(6, 3) NOT NULL DEFAULT 5,
+        ADD COLUMN IF NOT EXISTS max_trailing_drawdown_pct  NUMERIC(6, 3) NOT NULL DEFAULT 10,
+        ADD COLUMN IF NOT EXISTS min_trading_days           INTEGER       NOT NULL DEFAULT 4,
+        ADD COLUMN IF NOT EXISTS phase_count                INTEGER       NOT NULL DEFAULT 2;
+"""
+
+# Payout terms: trader share of profit and days between payout windows.
+PLAN_PAYOUT_DDL = """
+    ALTER TABLE plans
+        ADD COLUMN IF NOT EXISTS profit_split_pct   NUMERIC(6, 3) NOT NULL DEFAULT 80,
+        ADD COLUMN IF NOT EXISTS payout_cycle_days  INTEGER       NOT NULL DEFAULT 14;
+"""
+
+PLAN_RULE_COLUMNS = [
+    "account_size",
+    "profit_target_pct",
+    "max_daily_loss_pct",
+    "max_trailing_drawdown_pct",
+    "min_trading_days",
+    "phase_count",
+]
+
+
+def ensure_plan_rule_columns() -> None:
+    execute_command(PLAN_RULES_DDL)
+
+
+def ensure_plan_payout_columns() -> None:
+    execute_command(PLAN_PAYOUT_DDL)
+
+
+def plan_get(plan_id: int) -> Optional[dict]:
+    rows = execute_query(
+        """
+        SELECT *
+        FROM plans
+        WHERE id = %s;
+        """,
+        (plan_id,),
+    )
+    return rows[0] if rows else None
+
+
+def plan_rules(plan_id: Optional[int] = None) -> pd.DataFrame:
+    """
+    Rule columns for one or all plans, indexed by plan id, as floats.
+    """
+    rows = execute_query(
+        f"""
+        SELECT id, {", ".join(PLAN_RULE_COLUMNS)}
+        FROM plans
+        WHERE (%s IS NULL OR id = %s)
+        ORDER BY id;
+        """,
+        (plan_id, plan_id),
+    )
+    df = pd.DataFrame(rows, columns=["id"] + PLAN_RULE_COLUMNS).set_index("id")
+    return df.astype(float)
@@ -0,0 +1,586 @@
+from __future__ import annotations
+import time
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import pandas as pd
+from psycopg2.extras import Json, execute_values
+from veilon_core.db import execute_command, query_frame, transaction
+
+# -------------------------------------------------------------------
+# Plan rule engine.
+#
+# Each run folds the equity snapshots captured since the previous run
+# into a small per-account state (high-water mark, current trading day,
+# trading-day count), evaluates every active account's plan rules on
+# NumPy arrays, and applies the resulting transitions in one statement
+# that also writes the matching account_events rows.
+#
+# Precedence per account: breach-close > phase promotion / review.
+# -------------------------------------------------------------------
+
+ACCOUNT_RULE_STATE_DDL = """
+    CREATE TABLE IF NOT EXISTS account_rule_state (
+        account_id        BIGINT          PRIMARY KEY,
+        phase             INTEGER         NOT NULL,
+        high_water_mark   NUMERIC(18, 2)  NOT NULL,
+        last_equity       NUMERIC(18, 2)  NOT NULL,
+        trading_day       DATE,
+        day_open_equity   NUMERIC(18, 2),
+        day_counted       BOOLEAN         NOT NULL DEFAULT FALSE,
+        trading_days      INTEGER         NOT NULL DEFAULT 0,
+        last_snapshot_at  TIMESTAMPTZ,
+        updated_at        TIMESTAMPTZ     NOT NULL DEFAULT NOW()
+    );
+"""
+
+ACTION_NONE = 0
+ACTION_CLOSE = 1
+ACTION_PROMOTE = 2
+ACTION_REVIEW = 3
+
+ACTION_NAMES = {ACTION_CLOSE: "close", ACTION_PROMOTE: "promote", ACTION_REVIEW: "review"}
+
+REASON_DAILY_LOSS = "max_daily_loss"
+REASON_TRAILING_DRAWDOWN = "max_trailing_drawdown"
+REASON_PROFIT_TARGET = "profit_target"
+
+NO_DAY = -1  # trading_day sentinel (days since epoch)
+
+
+@dataclass
+class RuleBook:
+    """
+    One entry per active account, sorted by account_id. Rule percentages
+    are already resolved to currency amounts of the plan's account size.
+    """
+    account_id: np.ndarray
+    phase: np.ndarray
+    is_funded: np.ndarray
+    start_balance: np.ndarray
+    profit_target: np.ndarray
+    max_daily_loss: np.ndarray
+    max_drawdown: np.ndarray
+    min_trading_days: np.ndarray
+    phase_count: np.ndarray
+    # carried state
+    high_water_mark: np.ndarray
+    last_equity: np.ndarray
+    trading_day: np.ndarray
+    day_open_equity: np.ndarray
+    day_counted: np.ndarray
+    trading_days: np.ndarray
+    last_snapshot_at: np.ndarray
+    state_reset: np.ndarray  # carried state was missing or from an earlier phase
+
+    def __len__(self) -> int:
+        return len(self.account_id)
+
+
+@dataclass
+class Snapshots:
+    """
+    Equity points sorted by (account, time). `account_index` is the row
+    in the RuleBook, `day` is days since epoch (UTC).
+    """
+    account_index: np.ndarray
+    captured_at: np.ndarray
+    day: np.ndarray
+    equity: np.ndarray
+    open_positions: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.account_index)
+
+
+@dataclass
+class Folded:
+    worst_drawdown: np.ndarray
+    worst_daily_loss: np.ndarray
+    touched: np.ndarray  # accounts that received new snapshots
+
+
+def _group_starts(keys_changed: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.r_[True, keys_changed])
+
+
+def fold_snapshots(book: RuleBook, snaps: Snapshots) -> Folded:
+    """
+    Fold new snapshots into `book` in place and return the worst trailing
+    drawdown and worst intraday loss seen per account. Fully vectorized:
+    per-account running maxima use an offset cumulative max, per-group
+    reductions use reduceat over sorted group boundaries.
+    """
+    n = len(book)
+    worst_dd = np.zeros(n)
+    worst_daily = np.zeros(n)
+    touched = np.zeros(n, dtype=bool)
+    if not len(snaps):
+        return Folded(worst_dd, worst_daily, touched)
+
+    g = snaps.account_index
+    eq = snaps.equity
+    day = snaps.day
+
+    # --- per-account groups ---
+    starts = _group_starts(g[1:] != g[:-1])
+    ends = np.r_[starts[1:], len(g)]
+    accounts = g[starts]
+    ordinal = np.repeat(np.arange(len(starts)), ends - starts)
+    touched[accounts] = True
+
+    # Running high-water mark, seeded from carried state. Shifting each
+    # group by ordinal * span makes one global cummax behave per group.
+    seed = book.high_water_mark[g]
+    lo = min(eq.min(), seed.min())
+    span = max(eq.max(), seed.max()) - lo + 1.0
+    shift = ordinal * span
+    running = np.maximum.accumulate((eq - lo) + shift) - shift + lo
+    running = np.maximum(running, seed)
+
+    worst_dd[accounts] = np.maximum.reduceat(running - eq, starts)
+    book.high_water_mark[accounts] = running[ends - 1]
+    book.last_equity[accounts] = eq[ends - 1]
+    book.last_snapshot_at[accounts] = snaps.captured_at[ends - 1]
+
+    # --- per-(account, day) groups ---
+    d_starts = _group_starts((g[1:] != g[:-1]) | (day[1:] != day[:-1]))
+    d_ends = np.r_[d_starts[1:], len(g)]
+    d_acc = g[d_starts]
+    d_day = day[d_starts]
+
+    # A day already in progress keeps the open equity recorded last run.
+    continuing = d_day == book.trading_day[d_acc]
+    d_open = eq[d_starts].copy()
+    d_open[continuing] = book.day_open_equity[d_acc[continuing]]
+
+    d_loss = np.maximum.reduceat(np.repeat(d_open, d_ends - d_starts) - eq, d_starts)
+    d_traded = np.maximum.reduceat(snaps.open_positions, d_starts) > 0
+    d_counted = d_traded | (continuing & book.day_counted[d_acc])
+    d_new = d_counted & ~(continuing & book.day_counted[d_acc])
+
+    a_starts = _group_starts(d_acc[1:] != d_acc[:-1])
+    a_last = np.r_[a_starts[1:], len(d_acc)] - 1
+    a_ids = d_acc[a_starts]
+
+    worst_daily[a_ids] = np.maximum.reduceat(d_loss, a_starts)
+    book.trading_days[a_ids] += np.add.reduceat(d_new.astype(np.int64), a_starts)
+    book.trading_day[a_ids] = d_day[a_last]
+    book.day_open_equity[a_ids] = d_open[a_last]
+    book.day_counted[a_ids] = d_counted[a_last]
+
+    return Folded(worst_dd, worst_daily, touched)
+
+
+def evaluate(book: RuleBook, folded: Folded) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns (action, reason) arrays aligned with `book`. Reasons are
+    object arrays of REASON_* strings (None where action is NONE).
+    """
+    breach_daily = folded.worst_daily_loss >= book.max_daily_loss
+    breach_dd = folded.worst_drawdown >= book.max_drawdown
+    breach = breach_daily | breach_dd
+
+    target_hit = (
+        ~book.is_funded
+        & (book.last_equity >= book.start_balance + book.profit_target)
+        & (book.trading_days >= book.min_trading_days)
+        & ~breach
+    )
+    promote = target_hit & (book.phase < book.phase_count)
+    review = target_hit & (book.phase >= book.phase_count)
+
+    action = np.full(len(book), ACTION_NONE, dtype=np.int8)
+    action[review] = ACTION_REVIEW
+    action[promote] = ACTION_PROMOTE
+    action[breach] = ACTION_CLOSE
+
+    reason = np.full(len(book), None, dtype=object)
+    reason[target_hit] = REASON_PROFIT_TARGET
+    reason[breach_dd] = REASON_TRAILING_DRAWDOWN
+    reason[breach_daily] = REASON_DAILY_LOSS
+
+    return action, reason
+
+
+def ensure_rule_state_table() -> None:
+    execute_command(ACCOUNT_RULE_STATE_DDL)
+
+
+def _days(ts: pd.Series) -> np.ndarray:
+    return pd.to_datetime(ts, utc=True).dt.tz_localize(None).values.astype("datetime64[D]").astype(np.int64)
+
+
+ACCOUNT_RANGE_FILTER = """
+          AND (%(after_id)s::bigint IS NULL OR a.id > %(after_id)s)
+          AND (%(upto_id)s::bigint IS NULL OR a.id <= %(upto_id)s)
+"""
+
+
+def _range_params(account_range: Optional[tuple[int, int]]) -> dict:
+    after_id, upto_id = account_range if account_range else (None, None)
+    return {"after_id": after_id, "upto_id": upto_id}
+
+
+def load_rule_book(account_range: Optional[tuple[int, int]] = None) -> RuleBook:
+    """
+    Active accounts (open, enabled, not in review) with their plan rules
+    and carried rule state. State is reset when the phase has changed.
+    account_range=(after_id, upto_id) limits it to after_id < id <= upto_id.
+    """
+    df = query_frame(
+        """
+        SELECT
+            a.id AS account_id,
+            COALESCE(a.phase, 1) AS phase,
+            (COALESCE(a.is_funded, FALSE) OR a.funded_at IS NOT NULL) AS is_funded,
+            COALESCE(a.balance, p.account_size) AS balance,
+            p.account_size,
+            p.profit_target_pct,
+            p.max_daily_loss_pct,
+            p.max_trailing_drawdown_pct,
+            p.min_trading_days,
+            p.phase_count,
+            s.phase AS state_phase,
+            s.high_water_mark,
+            s.last_equity,
+            s.trading_day,
+            s.day_open_equity,
+            s.day_counted,
+            s.trading_days,
+            s.last_snapshot_at
+        FROM accounts a
+        JOIN plans p ON p.id = a.plan_id
+        LEFT JOIN account_rule_state s ON s.account_id = a.id
+        WHERE a.closed_at IS NULL
+          AND COALESCE(a.is_enabled, TRUE)
+          AND NOT COALESCE(a.in_review, FALSE)
+        """ + ACCOUNT_RANGE_FILTER + """
+        ORDER BY a.id;
+        """,
+        _range_params(account_range),
+    )
+
+    size = df["account_size"].to_numpy(dtype=float, copy=True)
+    reset = (df["state_phase"].isna() | (df["state_phase"] != df["phase"])).to_numpy()
+
+    hwm = df["high_water_mark"].to_numpy(dtype=float, copy=True)
+    last_equity = df["last_equity"].to_numpy(dtype=float, copy=True)
+    balance = df["balance"].to_numpy(dtype=float, copy=True)
+    hwm[reset] = np.maximum(size[reset], balance[reset])
+    last_equity[reset] = balance[reset]
+
+    trading_day = np.full(len(df), NO_DAY, dtype=np.int64)
+    has_day = (df["trading_day"].notna() & ~pd.Series(reset)).to_numpy()
+    if has_day.any():
+        trading_day[has_day] = _days(df.loc[has_day, "trading_day"])
+
+    day_open = df["day_open_equity"].to_numpy(dtype=float, copy=True)
+    day_open[~has_day] = np.nan
+
+    return RuleBook(
+        account_id=df["account_id"].to_numpy(np.int64),
+        phase=df["phase"].to_numpy(np.int64),
+        is_funded=df["is_funded"].to_numpy(bool),
+        start_balance=size,
+        profit_target=size * df["profit_target_pct"].to_numpy(dtype=float, copy=True) / 100,
+        max_daily_loss=size * df["max_daily_loss_pct"].to_numpy(dtype=float, copy=True) / 100,
+        max_drawdown=size * df["max_trailing_drawdown_pct"].to_numpy(dtype=float, copy=True) / 100,
+        min_trading_days=df["min_trading_days"].to_numpy(np.int64),
+        phase_count=df["phase_count"].to_numpy(np.int64),
+        high_water_mark=hwm,
+        last_equity=last_equity,
+        trading_day=trading_day,
+        day_open_equity=day_open,
+        day_counted=~reset & (df["day_counted"] == True).to_numpy(),
+        trading_days=np.where(reset, 0, df["trading_days"].fillna(0).astype(float)).astype(np.int64),
+        last_snapshot_at=pd.to_datetime(df["last_snapshot_at"], utc=True).dt.tz_localize(None).to_numpy("datetime64[ns]", copy=True),
+        state_reset=reset,
+    )
+
+
+def load_new_snapshots(book: RuleBook, account_range: Optional[tuple[int, int]] = None) -> Snapshots:
+    """
+    Snapshots captured since each active account's last folded snapshot.
+    """
+    df = query_frame(
+        """
+        SELECT s.account_id, s.captured_at, s.equity, s.open_positions
+        FROM accounts a
+        LEFT JOIN account_rule_state st ON st.account_id = a.id
+        JOIN account_equity_snapshots s
+          ON s.account_id = a.id
+         AND s.captured_at > COALESCE(st.last_snapshot_at, a.created_at)
+        WHERE a.closed_at IS NULL
+          AND COALESCE(a.is_enabled, TRUE)
+          AND NOT COALESCE(a.in_review, FALSE)
+        """ + ACCOUNT_RANGE_FILTER + """
+        ORDER BY s.account_id, s.captured_at;
+        """,
+        _range_params(account_range),
+    )
+
+    # Drop points for accounts that left the active set between the two reads.
+    ids = df["account_id"].to_numpy(np.int64)
+    if len(book):
+        index = np.clip(np.searchsorted(book.account_id, ids), 0, len(book) - 1)
+        known = book.account_id[index] == ids
+    else:
+        index = np.zeros(len(ids), dtype=np.int64)
+        known = np.zeros(len(ids), dtype=bool)
+    df = df[known]
+
+    return Snapshots(
+        account_index=index[known],
+        captured_at=pd.to_datetime(df["captured_at"], utc=True).dt.tz_localize(None).to_numpy("datetime64[ns]"),
+        day=_days(df["captured_at"]),
+        equity=df["equity"].to_numpy(dtype=float, copy=True),
+        open_positions=df["open_positions"].to_numpy(np.int64),
+    )
+
+
+APPLY_TRANSITIONS_SQL = """
+    WITH t (account_id, action, new_phase, reason, detail) AS (
+        VALUES %s
+    ),
+    closed AS (
+        UPDATE accounts a
+        SET closed_at = NOW()
+        FROM t
+        WHERE a.id = t.account_id AND t.action = 'close' AND a.closed_at IS NULL
+        RETURNING a.id
+    ),
+    promoted AS (
+        UPDATE accounts a
+        SET phase = t.new_phase
+        FROM t
+        WHERE a.id = t.account_id AND t.action = 'promote'
+          AND a.closed_at IS NULL AND COALESCE(a.phase, 1) = t.new_phase - 1
+        RETURNING a.id
+    ),
+    reviewed AS (
+        UPDATE accounts a
+        SET in_review = TRUE
+        FROM t
+        WHERE a.id = t.account_id AND t.action = 'review'
+          AND a.closed_at IS NULL AND NOT COALESCE(a.in_review, FALSE)
+        RETURNING a.id
+    )
+    INSERT INTO account_events (account_id, event_type, actor_type, actor_id, payload)
+    SELECT
+        t.account_id,
+        CASE t.action
+            WHEN 'close' THEN 'account.closed'
+            WHEN 'promote' THEN 'account.phase.changed'
+            ELSE 'account.review.updated'
+        END,
+        'system',
+        NULL,
+        CASE t.action
+            WHEN 'close' THEN jsonb_build_object('close_reason', t.reason)
+            WHEN 'promote' THEN jsonb_build_object('new_phase', t.new_phase)
+            ELSE jsonb_build_object('in_review', TRUE, 'resolution', NULL, 'reason', t.reason)
+        END || jsonb_build_object('source', 'rule_engine', 'rule', t.reason, 'detail', t.detail)
+    FROM t
+    WHERE t.account_id IN (
+        SELECT id FROM closed
+        UNION ALL SELECT id FROM promoted
+        UNION ALL SELECT id FROM reviewed
+    )
+    RETURNING account_id, event_type;
+"""
+
+UPSERT_STATE_SQL = """
+    INSERT INTO account_rule_state (
+        account_id, phase, high_water_mark, last_equity, trading_day,
+        day_open_equity, day_counted, trading_days, last_snapshot_at, updated_at
+    )
+    VALUES %s
+    ON CONFLICT (account_id) DO UPDATE
+    SET phase = EXCLUDED.phase,
+        high_water_mark = EXCLUDED.high_water_mark,
+        last_equity = EXCLUDED.last_equity,
+        trading_day = EXCLUDED.trading_day,
+        day_open_equity = EXCLUDED.day_open_equity,
+        day_counted = EXCLUDED.day_counted,
+        trading_days = EXCLUDED.trading_days,
+        last_snapshot_at = EXCLUDED.last_snapshot_at,
+        updated_at = NOW();
+"""
+
+
+def _state_rows(book: RuleBook, idx: np.ndarray) -> list[tuple]:
+    epoch = pd.Timestamp("1970-01-01").date()
+    rows = []
+    for i in idx.tolist():
+        day = int(book.trading_day[i])
+        at = book.last_snapshot_at[i]
+        rows.append((
+            int(book.account_id[i]),
+            int(book.phase[i]),
+            round(float(book.high_water_mark[i]), 2),
+            round(float(book.last_equity[i]), 2),
+            None if day == NO_DAY else epoch + pd.Timedelta(days=day),
+            None if np.isnan(book.day_open_equity[i]) else round(float(book.day_open_equity[i]), 2),
+            bool(book.day_counted[i]),
+            int(book.trading_days[i]),
+            None if pd.isna(at) else pd.Timestamp(at, tz="UTC").to_pydatetime(),
+        ))
+    return rows
+
+
+def _transition_rows(book: RuleBook, folded: Folded, action: np.ndarray, reason: np.ndarray) -> list[tuple]:
+    rows = []
+    for i in np.flatnonzero(action != ACTION_NONE).tolist():
+        detail = {
+            "equity": round(float(book.last_equity[i]), 2),
+            "high_water_mark": round(float(book.high_water_mark[i]), 2),
+            "worst_drawdown": round(float(folded.worst_drawdown[i]), 2),
+            "worst_daily_loss": round(float(folded.worst_daily_loss[i]), 2),
+            "trading_days": int(book.trading_days[i]),
+        }
+        rows.append((
+            int(book.account_id[i]),
+            ACTION_NAMES[int(action[i])],
+            int(book.phase[i]) + 1,
+            reason[i],
+            Json(detail),
+        ))
+    return rows
+
+
+def run_rule_engine(*, dry_run: bool = False, account_range: Optional[tuple[int, int]] = None) -> dict:
+    """
+    Evaluate plan rules for every active account (or those in
+    account_range, see load_rule_book) and apply the resulting
+    transitions. Transitions, their events and the folded rule state are
+    written in one transaction. With dry_run=True nothing is written and
+    the planned transitions are returned.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    book = load_rule_book(account_range)
+    snaps = load_new_snapshots(book, account_range)
+    timings["load_s"] = time.perf_counter() - started
+
+    t0 = time.perf_counter()
+    folded = fold_snapshots(book, snaps)
+    action, reason = evaluate(book, folded)
+    timings["evaluate_s"] = time.perf_counter() - t0
+
+    transitions = _transition_rows(book, folded, action, reason)
+    summary = {
+        "accounts": len(book),
+        "snapshots": len(snaps),
+        "close": int((action == ACTION_CLOSE).sum()),
+        "promote": int((action == ACTION_PROMOTE).sum()),
+        "review": int((action == ACTION_REVIEW).sum()),
+    }
+
+    if dry_run:
+        summary["transitions"] = transitions
+        return {**summary, **timings}
+
+    t0 = time.perf_counter()
+    changed = np.flatnonzero(folded.touched | book.state_reset)
+    with transaction() as cursor:
+        events = []
+        if transitions:
+            events = execute_values(
+                cursor,
+                APPLY_TRANSITIONS_SQL,
+                transitions,
+                template="(%s::bigint, %s::text, %s::int, %s::text, %s::jsonb)",
+                page_size=len(transitions),
+                fetch=True,
+            )
+        state_rows = _state_rows(book, changed)
+        if state_rows:
+            execute_values(cursor, UPSERT_STATE_SQL, state_rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())", page_size=5_000)
+    timings["write_s"] = time.perf_counter() - t0
+
+    summary["events_written"] = len(events)
+    return {**summary, **{k: round(v, 4) for k, v in timings.items()}}
+
+
+def synthetic_inputs(n_accounts: int = 100_000, snapshots_per_account: int = 20, seed: int = 0) -> tuple[RuleBook, Snapshots]:
+    """
+    Random RuleBook and snapshots for benchmarking evaluate() without a database.
+    """
+    rng = np.random.default_rng(seed)
+    size = rng.choice([10_000.0, 25_000.0, 50_000.0, 100_000.0], n_accounts)
+    book = RuleBook(
+        account_id=np.arange(1, n_accounts + 1, dtype=np.int64),
+        phase=rng.integers(1, 3, n_accounts),
+        is_funded=rng.random(n_accounts) < 0.2,
+        start_balance=size,
+        profit_target=size * 0.08,
+        max_daily_loss=size * 0.05,
+        max_drawdown=size * 0.10,
+        min_trading_days=np.full(n_accounts, 4),
+        phase_count=np.full(n_accounts, 2),
+        high_water_mark=size.copy(),
+        last_equity=size.copy(),
+        trading_day=np.full(n_accounts, NO_DAY, dtype=np.int64),
+        day_open_equity=np.full(n_accounts, np.nan),
+        day_counted=np.zeros(n_accounts, dtype=bool),
+        trading_days=rng.integers(0, 10, n_accounts),
+        last_snapshot_at=np.full(n_accounts, np.datetime64("NaT"), dtype="datetime64[ns]"),
+        state_reset=np.ones(n_accounts, dtype=bool),
+    )
+
+    total = n_accounts * snapshots_per_account
+    account_index = np.repeat(np.arange(n_accounts), snapshots_per_account)
+    steps = rng.normal(0, 0.004, total) * size[account_index]
+    walk = np.cumsum(steps)
+    group_offset = np.repeat(walk[::snapshots_per_account] - steps[::snapshots_per_account], snapshots_per_account)
+    equity = size[account_index] + walk - group_offset
+    day = 20_000 + (np.arange(total) % snapshots_per_account) * 5 // snapshots_per_account
+    captured_at = (day * 86_400).astype("datetime64[s]").astype("datetime64[ns]")
+
+    snaps = Snapshots(
+        account_index=account_index,
+        captured_at=captured_at,
+        day=day,
+        equity=equity,
+        open_positions=rng.integers(0, 3, total),
+    )
+    return book, snaps
+
+
+def benchmark(n_accounts: int = 100_000, snapshots_per_account: int = 20, repeat: int = 5) -> dict:
+    """
+    Time fold_snapshots + evaluate over synthetic inputs (best of `repeat`).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        book, snaps = synthetic_inputs(n_accounts, snapshots_per_account)
+        t0 = time.perf_counter()
+        folded = fold_snapshots(book, snaps)
+        action, _ = evaluate(book, folded)
+        best = min(best, time.perf_counter() - t0)
+
+    return {
+        "accounts": n_accounts,
+        "snapshots": n_accounts * snapshots_per_account,
+        "best_s": round(best, 4),
+        "close": int((action == ACTION_CLOSE).sum()),
+        "promote": int((action == ACTION_PROMOTE).sum()),
+        "review": int((action == ACTION_REVIEW).sum()),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plan rule engine")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--bench", type=int, metavar="ACCOUNTS", help="benchmark on synthetic data instead of running")
+    parser.add_argument("--snapshots", type=int, default=20, help="snapshots per account for --bench")
+    args = parser.parse_args()
+
+    if args.bench:
+        print(benchmark(args.bench, args.snapshots))
+    else:
+        print(run_rule_engine(dry_run=args.dry_run))
@@ -0,0 +1,246 @@
+from __future__ import annotations
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+# -------------------------------------------------------------------
+# Process-wide snapshot scheduler.
+#
+# Expensive, session-independent aggregates (dashboard KPIs, account
+# KPIs, payout forecasts) are registered once per process and refreshed
+# by one background thread on an interval with jitter. Pages read the
+# last result, so database load depends on the number of snapshots, not
+# on the number of admins with the app open.
+#
+# Refreshes are single-flight: a page asking for a snapshot that is
+# already being computed waits for that run instead of starting another.
+# Snapshots nobody has read for `idle_after` seconds stop refreshing
+# until they are read again.
+# -------------------------------------------------------------------
+
+DEFAULT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300"))
+DEFAULT_JITTER = 0.1     # +/- fraction of the interval
+DEFAULT_IDLE_AFTER = 1_800
+REFRESH_WORKERS = 2
+
+
+@dataclass
+class Snapshot:
+    name: str
+    fn: Callable[[], Any]
+    interval: float
+    jitter: float
+    idle_after: float
+    value: Any = None
+    refreshed_at: Optional[float] = None
+    refresh_seconds: Optional[float] = None
+    error: Optional[str] = None
+    next_run: float = 0.0
+    last_read: float = field(default_factory=time.monotonic)
+    refreshes: int = 0
+    idle: bool = False
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _done: threading.Condition = field(default=None, repr=False)
+    _running: bool = False
+
+    def __post_init__(self):
+        self._done = threading.Condition(self._lock)
+
+    def schedule_next(self) -> None:
+        spread = self.interval * self.jitter
+        self.next_run = time.monotonic() + self.interval + random.uniform(-spread, spread)
+
+
+class Scheduler:
+    """
+    Registry of named snapshots plus the background refresher.
+    Use get_scheduler() for the process singleton.
+    """
+
+    def __init__(self, workers: int = REFRESH_WORKERS):
+        self._snapshots: dict[str, Snapshot] = {}
+        self._registry_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="veilon-snapshot")
+        self._thread: Optional[threading.Thread] = None
+
+    def register(
+        self,
+        name: str,
+        fn: Callable[[], Any],
+        *,
+        interval: float = DEFAULT_INTERVAL,
+        jitter: float = DEFAULT_JITTER,
+        idle_after: float = DEFAULT_IDLE_AFTER,
+    ) -> Snapshot:
+        """
+        Registers `fn` under `name` (idempotent: an existing registration
+        is kept). Nothing runs until the snapshot is first read.
+        """
+        with self._registry_lock:
+            snap = self._snapshots.get(name)
+            if snap is None:
+                snap = Snapshot(name, fn, interval, jitter, idle_after, next_run=float("inf"))
+                self._snapshots[name] = snap
+            return snap
+
+    def get(self, name: str) -> Any:
+        """
+        Latest value of a snapshot. The first read computes it in the
+        caller (single-flight); afterwards values are served from memory
+        and refreshed in the background. Raises if the snapshot has
+        never been computed successfully.
+        """
+        snap = self._snapshots[name]
+        snap.last_read = time.monotonic()
+        if snap.refreshed_at is None:
+            self.refresh(name)
+            if snap.refreshed_at is None:
+                raise RuntimeError(f"Snapshot {name!r} failed: {snap.error}")
+        elif snap.idle:
+            # Serve the stale value and refresh soon.
+            snap.idle = False
+            snap.next_run = time.monotonic()
+            self._wake.set()
+        return snap.value
+
+    def refresh(self, name: str) -> None:
+        """
+        Recomputes a snapshot now. If a refresh is already running, waits
+        for it instead of starting a second one. Errors are recorded and
+        the previous value is kept.
+        """
+        snap = self._snapshots[name]
+        with snap._lock:
+            if snap._running:
+                while snap._running:
+                    snap._done.wait()
+                return
+            snap._running = True
+
+        started = time.perf_counter()
+        try:
+            value = snap.fn()
+        except Exception as e:
+            with snap._lock:
+                snap.error = f"{type(e).__name__}: {e}"
+        else:
+            with snap._lock:
+                snap.value = value
+                snap.error = None
+                snap.refreshed_at = time.time()
+                snap.refreshes += 1
+        finally:
+            with snap._lock:
+                snap.refresh_seconds = time.perf_counter() - started
+                snap._running = False
+                snap.idle = time.monotonic() - snap.last_read > snap.idle_after
+                if snap.idle:
+                    snap.next_run = float("inf")
+                else:
+                    snap.schedule_next()
+                snap._done.notify_all()
+            self._wake.set()
+
+    def start(self) -> None:
+        with self._registry_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="veilon-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            now = time.monotonic()
+            next_due = now + 60
+            for snap in list(self._snapshots.values()):
+                if snap._running:
+                    continue
+                if snap.next_run <= now:
+                    snap.next_run = float("inf")  # claimed; refresh() reschedules
+                    self._pool.submit(self.refresh, snap.name)
+                else:
+                    next_due = min(next_due, snap.next_run)
+            self._wake.wait(timeout=max(0.05, next_due - time.monotonic()))
+            self._wake.clear()
+
+    def status(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "name": s.name,
+                "refreshed_at": s.refreshed_at,
+                "refresh_seconds": s.refresh_seconds,
+                "refreshes": s.refreshes,
+                "idle": s.idle,
+                "due_in": None if s.next_run == float("inf") else round(s.next_run - now, 1),
+                "error": s.error,
+            }
+            for s in self._snapshots.values()
+        ]
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """
+    The process-wide scheduler, created, populated with the default
+    snapshots and started on first use. Streamlit runs all sessions in one
+    process, so every admin shares it.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+            register_default_snapshots(_scheduler)
+            _scheduler.start()
+        return _scheduler
+
+
+def lazy(target: str, *args) -> Callable[[], Any]:
+    """
+    "module:function" bound to `args`, imported on first call. Registering
+    every default snapshot must not import every data module: a page pays
+    only for the snapshots it reads.
+    """
+    module, _, attr = target.partition(":")
+
+    def call():
+        import importlib
+
+        return getattr(importlib.import_module(module), attr)(*args)
+
+    call.__qualname__ = f"lazy({target})"
+    return call
+
+
+def register_default_snapshots(scheduler: Scheduler) -> None:
+    from veilon_core.timeframes import TIMEFRAMES
+
+    for timeframe in TIMEFRAMES:
+        scheduler.register(f"dashboard:{timeframe}", lazy("veilon_core.dashboard:dashboard_metrics", timeframe))
+        scheduler.register(f"accounts_kpis:{timeframe}", lazy("veilon_core.accounts:accounts_kpis", timeframe), interval=120)
+        scheduler.register(f"orders_kpis:{timeframe}", lazy("veilon_core.orders:orders_kpis", timeframe), interval=120)
+        scheduler.register(f"affiliates_kpis:{timeframe}", lazy("veilon_core.affiliates:affiliate_kpis", timeframe), interval=120)
+    scheduler.register("payouts:forecast_inputs", lazy("veilon_core.payouts:forecast_inputs"), interval=60)
+    scheduler.register("payouts:pending", lazy("veilon_core.payouts:pending_payouts_total"), interval=120)
+    scheduler.register("plans:trader_model", lazy("veilon_core.simulator:fit_trader_model"), interval=3_600)
+
+
+def snapshot(name: str) -> Any:
+    return get_scheduler().get(name)
@@ -0,0 +1,141 @@
+from __future__ import annotations
+import time
+from typing import Optional
+from veilon_core.db import execute_command, execute_query
+
+# -------------------------------------------------------------------
+# Full-text search over account notes and account event payloads.
+#
+# Both tables carry a stored generated tsvector column, so Postgres
+# keeps it current on every write path (account_set_note, event inserts
+# from the app, the rule engine and COPY loads) with no triggers or
+# application code. Notes are weighted A and event payload strings B,
+# so with ts_rank's default weights a note match outranks an event
+# match. Queries use websearch_to_tsquery: plain words, "quoted
+# phrases", OR and -excluded words.
+#
+# Results are one row per account (its best rank and number of hits),
+# keyset-paginated on (rank, account_id). Only narrow (account, rank)
+# pairs are aggregated; the text of each account's best hit is read for
+# the accounts on the requested page alone.
+#
+#   python -m veilon_core.search --ensure          # add columns + indexes
+#   python -m veilon_core.search chargeback        # time a search
+# -------------------------------------------------------------------
+
+SEARCH_COLUMNS_DDL = """
+    ALTER TABLE accounts ADD COLUMN IF NOT EXISTS notes_tsv tsvector
+        GENERATED ALWAYS AS (setweight(to_tsvector('english', COALESCE(notes, '')), 'A')) STORED;
+    CREATE INDEX IF NOT EXISTS accounts_notes_tsv_idx ON accounts USING GIN (notes_tsv);
+
+    ALTER TABLE account_events ADD COLUMN IF NOT EXISTS payload_tsv tsvector
+        GENERATED ALWAYS AS (setweight(jsonb_to_tsvector('english', payload, '["string"]'), 'B')) STORED;
+    CREATE INDEX IF NOT EXISTS account_events_payload_tsv_idx ON account_events USING GIN (payload_tsv);
+"""
+
+SEARCH_ACCOUNTS_SQL = """
+    WITH q AS (
+        SELECT websearch_to_tsquery('english', %(query)s) AS q
+    ),
+    hits AS (
+        SELECT a.id AS account_id, ts_rank(a.notes_tsv, q.q) AS rank
+        FROM accounts a, q
+        WHERE a.notes_tsv @@ q.q
+        UNION ALL
+        SELECT e.account_id, ts_rank(e.payload_tsv, q.q)
+        FROM account_events e, q
+        WHERE e.payload_tsv @@ q.q
+    ),
+    ranked AS (
+        SELECT account_id, MAX(rank)::float8 AS rank, COUNT(*) AS matches
+        FROM hits
+        GROUP BY account_id
+    ),
+    page AS (
+        SELECT * FROM ranked
+        WHERE %(after_rank)s::float8 IS NULL
+           OR (rank, account_id) < (%(after_rank)s::float8, %(after_id)s::bigint)
+        ORDER BY rank DESC, account_id DESC
+        LIMIT %(limit)s
+    )
+    SELECT p.account_id, a.user_id, a.plan_id, p.rank, p.matches, best.source,
+           ts_headline('english', best.text, q.q, 'StartSel=**, StopSel=**, MaxWords=25, MinWords=8') AS snippet,
+           best.at
+    FROM page p
+    CROSS JOIN q
+    JOIN accounts a ON a.id = p.account_id
+    CROSS JOIN LATERAL (
+        -- the best hit's text, read only for the accounts on this page
+        SELECT 'note' AS source, a.notes AS text, a.notes_updated_at AS at, ts_rank(a.notes_tsv, q.q) AS rank
+        WHERE a.notes_tsv @@ q.q
+        UNION ALL
+        SELECT e.event_type, e.payload::text, e.occurred_at, ts_rank(e.payload_tsv, q.q)
+        FROM account_events e
+        WHERE e.account_id = p.account_id AND e.payload_tsv @@ q.q
+        ORDER BY rank DESC, at DESC NULLS LAST
+        LIMIT 1
+    ) best
+    ORDER BY p.rank DESC, p.account_id DESC;
+"""
+
+
+def ensure_search_columns() -> None:
+    """Adds the tsvector columns and GIN indexes; rewrites both tables the first time."""
+    execute_command(SEARCH_COLUMNS_DDL)
+
+
+def search_accounts(
+    query: str,
+    *,
+    after: Optional[tuple[float, int]] = None,
+    limit: int = 50,
+) -> tuple[list[dict], Optional[tuple[float, int]]]:
+    """
+    One page of accounts matching `query` in their notes or event
+    payloads, best match first. Each row has the account, its best rank,
+    the number of matching notes/events, where the best hit came from
+    ("note" or the event type) and a highlighted snippet. `after` is the
+    (rank, account_id) of the last row of the previous page. Returns
+    (rows, cursor for the next page or None when this is the last page).
+    """
+    if not query.strip():
+        return [], None
+    after_rank, after_id = after if after is not None else (None, None)
+    rows = execute_query(
+        SEARCH_ACCOUNTS_SQL,
+        {"query": query, "after_rank": after_rank, "after_id": after_id, "limit": limit + 1},
+    )
+    page = rows[:limit]
+    cursor = (page[-1]["rank"], page[-1]["account_id"]) if len(rows) > limit else None
+    return page, cursor
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from veilon_core.config import load_env
+
+    parser = argparse.ArgumentParser(description="Account notes / event payload search")
+    parser.add_argument("query", nargs="?", help="websearch-style query to time")
+    parser.add_argument("--ensure", action="store_true", help="add the tsvector columns and indexes first")
+    parser.add_argument("--pages", type=int, default=3, help="pages to fetch")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    load_env()
+    if args.ensure:
+        started = time.perf_counter()
+        ensure_search_columns()
+        print(f"search columns ready in {time.perf_counter() - started:.1f}s")
+    if args.query:
+        cursor = None
+        for page in range(1, args.pages + 1):
+            started = time.perf_counter()
+            rows, cursor = search_accounts(args.query, after=cursor, limit=args.limit)
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"page {page}: {len(rows)} accounts in {elapsed:.1f} ms")
+            if page == 1 and rows:
+                print(json.dumps(rows[0], indent=2, default=str))
+            if cursor is None:
+                break
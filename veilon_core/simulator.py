@@ -0,0 +1,270 @@
+from __future__ import annotations
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from typing import Optional
+import numpy as np
+from veilon_core.db import query_frame
+
+# -------------------------------------------------------------------
+# Monte Carlo plan economics.
+#
+# A TraderModel is a pool of per-trader daily return profiles (mean,
+# volatility, share of days traded, as fractions of account size) fitted
+# from historical trades. simulate_plan() draws traders from the pool,
+# runs them through every evaluation phase of a PlanSpec and then through
+# the funded stage with periodic payouts, and reports pass rates,
+# expected payouts and margin per account sold.
+#
+# Traders are simulated in fixed-size chunks, each with its own child
+# seed, so results depend only on `seed` and not on how many worker
+# processes ran them. Workers are spawned, never forked: the simulator
+# is called from Streamlit, whose process has live threads and database
+# connections a forked child would inherit mid-use.
+# -------------------------------------------------------------------
+
+CHUNK_SIZE = 50_000
+MAX_WORKERS = 4
+MIN_FIT_DAYS = 5
+
+TRADER_PROFILES_SQL = """
+    WITH daily AS (
+        SELECT
+            t.account_id,
+            t.executed_at::date AS day,
+            SUM(t.profit + t.commission + t.swap) / p.account_size AS r
+        FROM trades t
+        JOIN accounts a ON a.id = t.account_id
+        JOIN plans p ON p.id = a.plan_id
+        WHERE t.entry = 'out'
+        GROUP BY t.account_id, t.executed_at::date, p.account_size
+    )
+    SELECT
+        account_id,
+        AVG(r)::float8 AS mu,
+        STDDEV_SAMP(r)::float8 AS sigma,
+        LEAST(1.0, COUNT(*)::float8 / GREATEST(1, (MAX(day) - MIN(day) + 1) * 5 / 7.0)) AS trade_prob
+    FROM daily
+    GROUP BY account_id
+    HAVING COUNT(*) >= %s;
+"""
+
+
+@dataclass(frozen=True)
+class PlanSpec:
+    account_size: float = 50_000.0
+    price: float = 300.0
+    profit_target_pct: float = 8.0
+    max_daily_loss_pct: float = 5.0
+    max_trailing_drawdown_pct: float = 10.0
+    min_trading_days: int = 4
+    phase_count: int = 2
+    profit_split_pct: float = 80.0
+    payout_cycle_days: int = 14
+
+    @classmethod
+    def from_plan(cls, plan: dict) -> "PlanSpec":
+        fields = {k: type(getattr(cls(), k))(plan[k]) for k in asdict(cls()) if plan.get(k) is not None}
+        return cls(**fields)
+
+
+@dataclass(frozen=True)
+class SimulationParams:
+    n_traders: int = 1_000_000
+    seed: int = 0
+    max_phase_days: int = 60    # trading days allowed per evaluation phase
+    funded_days: int = 180      # trading days simulated after funding
+    min_payout: float = 100.0
+
+
+@dataclass
+class TraderModel:
+    mu: np.ndarray
+    sigma: np.ndarray
+    trade_prob: np.ndarray
+    source: str
+    fitted_at: float = field(default_factory=time.time)
+
+    def __len__(self) -> int:
+        return len(self.mu)
+
+
+def default_trader_model(n: int = 10_000, seed: int = 0) -> TraderModel:
+    """
+    Fallback population when there is not enough trade history: slightly
+    negative average edge with wide dispersion in skill and risk.
+    """
+    rng = np.random.default_rng(seed)
+    return TraderModel(
+        mu=rng.normal(-0.0005, 0.002, n),
+        sigma=rng.lognormal(np.log(0.012), 0.5, n),
+        trade_prob=rng.uniform(0.4, 1.0, n),
+        source="default",
+    )
+
+
+def fit_trader_model(min_days: int = MIN_FIT_DAYS, min_traders: int = 50) -> TraderModel:
+    """
+    Per-account daily return profiles from closing deals in `trades`.
+    Falls back to default_trader_model() with fewer than `min_traders`.
+    """
+    df = query_frame(TRADER_PROFILES_SQL, (min_days,)).dropna()
+    if len(df) < min_traders:
+        return default_trader_model()
+    return TraderModel(
+        mu=df["mu"].to_numpy(dtype=float, copy=True),
+        sigma=df["sigma"].to_numpy(dtype=float, copy=True),
+        trade_prob=df["trade_prob"].to_numpy(dtype=float, copy=True),
+        source=f"trades ({len(df)} accounts)",
+    )
+
+
+def _returns(rng: np.random.Generator, mu: np.ndarray, sigma: np.ndarray, prob: np.ndarray, days: int) -> np.ndarray:
+    r = rng.standard_normal((len(mu), days), dtype=np.float32)
+    r *= sigma[:, None].astype(np.float32)
+    r += mu[:, None].astype(np.float32)
+    r *= rng.random((len(mu), days), dtype=np.float32) < prob[:, None]
+    return r
+
+
+def _first(mask: np.ndarray) -> np.ndarray:
+    """Index of the first True per row, or the row length if none."""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), mask.shape[1])
+
+
+def _simulate_chunk(spec: PlanSpec, params: SimulationParams, model: TraderModel, n: int, seed) -> dict:
+    rng = np.random.default_rng(seed)
+    pick = rng.integers(0, len(model), n)
+    mu, sigma, prob = model.mu[pick], model.sigma[pick], model.trade_prob[pick]
+
+    target = spec.profit_target_pct / 100
+    daily_loss = spec.max_daily_loss_pct / 100
+    drawdown = spec.max_trailing_drawdown_pct / 100
+
+    alive = np.ones(n, dtype=bool)
+    passed_phase = np.zeros(spec.phase_count, dtype=np.int64)
+
+    # Evaluation phases: pass on target + min trading days before any breach.
+    for phase in range(spec.phase_count):
+        idx = np.flatnonzero(alive)
+        if not len(idx):
+            break
+        r = _returns(rng, mu[idx], sigma[idx], prob[idx], params.max_phase_days)
+        equity = np.cumsum(r, axis=1)
+        hwm = np.maximum.accumulate(np.maximum(equity, 0), axis=1)
+        breach = _first((r <= -daily_loss) | (hwm - equity >= drawdown))
+        traded = np.cumsum(r != 0, axis=1)
+        hit = _first((equity >= target) & (traded >= spec.min_trading_days))
+        ok = hit < breach
+        alive[idx[~ok]] = False
+        passed_phase[phase] = ok.sum()
+
+    # Funded stage: one payout window per cycle; balance (and drawdown
+    # reference) reset to account size after each payout.
+    idx = np.flatnonzero(alive)
+    payouts = np.zeros(len(idx))
+    funded_alive = np.ones(len(idx), dtype=bool)
+    level = np.zeros(len(idx))
+    peak = np.zeros(len(idx))
+    split = spec.profit_split_pct / 100
+    cycle = max(1, int(spec.payout_cycle_days))
+    for start in range(0, params.funded_days, cycle):
+        live = np.flatnonzero(funded_alive)
+        if not len(live):
+            break
+        days = min(cycle, params.funded_days - start)
+        r = _returns(rng, mu[idx[live]], sigma[idx[live]], prob[idx[live]], days)
+        equity = level[live, None] + np.cumsum(r, axis=1)
+        hwm = np.maximum(np.maximum.accumulate(equity, axis=1), peak[live, None])
+        breached = ((r <= -daily_loss) | (hwm - equity >= drawdown)).any(axis=1)
+        funded_alive[live[breached]] = False
+
+        ok = live[~breached]
+        end = equity[~breached, -1]
+        share = split * np.maximum(end, 0) * spec.account_size
+        pay = (days == cycle) & (share >= params.min_payout)
+        payouts[ok[pay]] += share[pay]
+        level[ok] = np.where(pay, 0.0, end)
+        peak[ok] = np.where(pay, 0.0, hwm[~breached, -1])
+
+    return {
+        "n": n,
+        "passed_phase": passed_phase,
+        "payouts": payouts.astype(np.float32),
+        "survived": int(funded_alive.sum()),
+    }
+
+
+def simulate_plan(
+    spec: PlanSpec,
+    params: SimulationParams = SimulationParams(),
+    model: Optional[TraderModel] = None,
+    workers: Optional[int] = None,
+) -> dict:
+    """
+    Run params.n_traders simulated traders through `spec`. Chunks run in
+    a spawned process pool of `workers` (default: all cores up to
+    MAX_WORKERS; 1 runs in-process).
+    """
+    model = model or default_trader_model()
+    workers = workers or min(MAX_WORKERS, os.cpu_count() or 1)
+    sizes = [min(CHUNK_SIZE, params.n_traders - i) for i in range(0, params.n_traders, CHUNK_SIZE)]
+    seeds = np.random.SeedSequence(params.seed).spawn(len(sizes))
+
+    t0 = time.perf_counter()
+    if workers == 1 or len(sizes) == 1:
+        chunks = [_simulate_chunk(spec, params, model, n, s) for n, s in zip(sizes, seeds)]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(sizes)), mp_context=context) as pool:
+            chunks = list(pool.map(
+                _simulate_chunk,
+                [spec] * len(sizes), [params] * len(sizes), [model] * len(sizes), sizes, seeds,
+            ))
+    elapsed = time.perf_counter() - t0
+
+    n = params.n_traders
+    passed = np.sum([c["passed_phase"] for c in chunks], axis=0)
+    payouts = np.concatenate([c["payouts"] for c in chunks]).astype(float)
+    funded = len(payouts)
+    expected_payout = payouts.sum() / n
+
+    return {
+        "traders": n,
+        "seed": params.seed,
+        "model": model.source,
+        "phase_pass_rate": [float(p / n) for p in passed],
+        "funded_rate": funded / n,
+        "funded_survival_rate": sum(c["survived"] for c in chunks) / funded if funded else 0.0,
+        "paid_rate": float((payouts > 0).sum() / n),
+        "expected_payout": float(expected_payout),
+        "payout_per_funded": float(payouts.mean()) if funded else 0.0,
+        "payout_p50": float(np.percentile(payouts, 50)) if funded else 0.0,
+        "payout_p90": float(np.percentile(payouts, 90)) if funded else 0.0,
+        "payout_p99": float(np.percentile(payouts, 99)) if funded else 0.0,
+        "margin": float(spec.price - expected_payout),
+        "margin_pct": float((spec.price - expected_payout) / spec.price) if spec.price else 0.0,
+        "seconds": round(elapsed, 3),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Monte Carlo plan economics")
+    parser.add_argument("--traders", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--plan-id", type=int, help="simulate an existing plan (default: PlanSpec defaults)")
+    parser.add_argument("--fit", action="store_true", help="fit traders from the trades table")
+    args = parser.parse_args()
+
+    spec = PlanSpec()
+    if args.plan_id:
+        from veilon_core.plans import plan_get
+
+        spec = PlanSpec.from_plan(plan_get(args.plan_id))
+    model = fit_trader_model() if args.fit else default_trader_model()
+    print(simulate_plan(spec, replace(SimulationParams(), n_traders=args.traders, seed=args.seed), model, args.workers))
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Optional
+
+# -------------------------------------------------------------------
+# Cold-start profile.
+#
+# Imports a target (app.py by default: the login screen) in a fresh
+# interpreter under `python -X importtime`, then reports total import
+# time, peak RSS and the slowest top-level packages. check_budget()
+# fails when the target goes over its time budget or pulls in any module
+# from HEAVY_MODULES -- the data stack that should load only once a data
+# page actually runs.
+#
+#   python -m veilon_core.startup                 # app.py, default budget
+#   python -m veilon_core.startup pages.dashboard --budget-ms 1500
+# -------------------------------------------------------------------
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = (
+    "pandas", "numpy", "pyarrow", "psycopg2", "psycopg",
+    "stripe", "metaapi_cloud_sdk", "dotenv", "streamlit_extras",
+)
+
+# Streamlit itself dominates; the budget is for what we add on top of it.
+DEFAULT_BUDGET_MS = {"app": 600.0}
+
+_PROBE = """
+import resource, sys, time
+t0 = time.perf_counter()
+import {target}
+elapsed = time.perf_counter() - t0
+print("__startup__", elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+"""
+
+
+def import_profile(target: str = "app") -> dict:
+    """
+    Imports `target` in a subprocess and parses its -X importtime log.
+    "slowest" sums each module's own (self) time per top-level package,
+    in milliseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(target=target)],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": str(BASE_DIR)},
+    )
+    packages: dict[str, float] = {}
+    modules = set()
+    elapsed = rss_kb = None
+    for line in result.stderr.splitlines():
+        if line.startswith("__startup__"):
+            _, seconds, rss = line.split()
+            elapsed, rss_kb = float(seconds), int(rss)
+            continue
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        module = name.strip()
+        modules.add(module)
+        package = module.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1000
+
+    if elapsed is None:
+        raise RuntimeError(f"Importing {target!r} failed:\n{result.stderr[-2000:]}")
+
+    return {
+        "target": target,
+        "import_ms": round(elapsed * 1000, 1),
+        "max_rss_mb": round(rss_kb / 1024, 1),
+        "heavy_modules": sorted(m for m in HEAVY_MODULES if m in modules),
+        "slowest": [(p, round(ms, 1)) for p, ms in sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:10]],
+    }
+
+
+def check_budget(target: str = "app", budget_ms: Optional[float] = None, allow_heavy: bool = False) -> tuple[bool, dict]:
+    """(ok, profile). Not ok if over budget or, unless allowed, any heavy module was imported."""
+    profile = import_profile(target)
+    budget = budget_ms if budget_ms is not None else DEFAULT_BUDGET_MS.get(target)
+    problems = []
+    if budget is not None and profile["import_ms"] > budget:
+        problems.append(f"import took {profile['import_ms']}ms, budget {budget}ms")
+    if profile["heavy_modules"] and not allow_heavy:
+        problems.append(f"imported heavy modules: {', '.join(profile['heavy_modules'])}")
+    profile["budget_ms"] = budget
+    profile["problems"] = problems
+    return not problems, profile
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cold-start import profile and budget check")
+    parser.add_argument("target", nargs="?", default="app")
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--allow-heavy", action="store_true", help="only enforce the time budget")
+    args = parser.parse_args()
+
+    ok, profile = check_budget(args.target, args.budget_ms, args.allow_heavy)
+    print(json.dumps(profile, indent=2))
+    sys.exit(0 if ok else 1)
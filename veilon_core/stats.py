@@ -0,0 +1,330 @@
+from __future__ import annotations
+import time
+from typing import Optional, Sequence
+import numpy as np
+import pandas as pd
+from veilon_core.db import execute_command, execute_many, execute_query, query_frame, transaction
+
+# -------------------------------------------------------------------
+# Per-account trading statistics.
+#
+# account_trade_stats holds additive aggregates per account, advanced by
+# trades.id watermark: each refresh folds only closing deals ingested
+# since the last one, up to a commit-safe horizon (TRADE_HORIZON_SQL) so
+# ids still held by in-flight ingest transactions are never skipped.
+# Ratios (win rate, profit factor, Sharpe, ...) are derived from the
+# aggregates at read time.
+#
+# Daily P&L for Sharpe/consistency: finished days are folded into
+# n_days / sum / sum of squares / best day; the latest day stays "open"
+# so later trades on it are added before it is folded.
+# -------------------------------------------------------------------
+
+ACCOUNT_TRADE_STATS_DDL = """
+    CREATE TABLE IF NOT EXISTS account_trade_stats (
+        account_id       BIGINT          PRIMARY KEY,
+        last_trade_id    BIGINT          NOT NULL,
+        n_trades         INTEGER         NOT NULL,
+        n_wins           INTEGER         NOT NULL,
+        gross_profit     NUMERIC(18, 2)  NOT NULL,
+        gross_loss       NUMERIC(18, 2)  NOT NULL,
+        sum_r            DOUBLE PRECISION NOT NULL,
+        n_r              INTEGER         NOT NULL,
+        cum_pnl          NUMERIC(18, 2)  NOT NULL,
+        peak_pnl         NUMERIC(18, 2)  NOT NULL,
+        max_drawdown     NUMERIC(18, 2)  NOT NULL,
+        n_days           INTEGER         NOT NULL,
+        sum_day_pnl      DOUBLE PRECISION NOT NULL,
+        sumsq_day_pnl    DOUBLE PRECISION NOT NULL,
+        best_day_pnl     NUMERIC(18, 2)  NOT NULL,
+        open_day         DATE,
+        open_day_pnl     NUMERIC(18, 2)  NOT NULL,
+        updated_at       TIMESTAMPTZ     NOT NULL DEFAULT NOW()
+    );
+"""
+
+AGGREGATE_COLUMNS = [
+    "last_trade_id",
+    "n_trades",
+    "n_wins",
+    "gross_profit",
+    "gross_loss",
+    "sum_r",
+    "n_r",
+    "cum_pnl",
+    "peak_pnl",
+    "max_drawdown",
+    "n_days",
+    "sum_day_pnl",
+    "sumsq_day_pnl",
+    "best_day_pnl",
+    "open_day",
+    "open_day_pnl",
+]
+
+STAT_LABELS = {
+    "win_rate": "Win Rate",
+    "profit_factor": "Profit Factor",
+    "avg_r": "Avg R",
+    "max_drawdown": "Max Drawdown",
+    "sharpe": "Sharpe",
+    "consistency": "Consistency",
+}
+
+TRADING_DAYS_PER_YEAR = 252
+
+# Derived metrics, evaluated in SQL so pages can read them directly.
+# Open day counts as a day for Sharpe/consistency.
+DERIVED_STATS_SELECT = f"""
+    SELECT
+        s.account_id,
+        s.n_trades,
+        s.n_wins::float / NULLIF(s.n_trades, 0) AS win_rate,
+        s.gross_profit / NULLIF(s.gross_loss, 0) AS profit_factor,
+        s.sum_r / NULLIF(s.n_r, 0) AS avg_r,
+        s.max_drawdown,
+        d.mean_day / NULLIF(d.std_day, 0) * SQRT({TRADING_DAYS_PER_YEAR}) AS sharpe,
+        CASE WHEN s.gross_profit > s.gross_loss
+            THEN GREATEST(0, 1 - GREATEST(s.best_day_pnl, s.open_day_pnl) / (s.gross_profit - s.gross_loss))
+        END AS consistency
+    FROM account_trade_stats s
+    CROSS JOIN LATERAL (
+        SELECT
+            (s.sum_day_pnl + s.open_day_pnl) / NULLIF(s.n_days + 1, 0) AS mean_day,
+            SQRT(GREATEST(0,
+                (s.sumsq_day_pnl + s.open_day_pnl ^ 2) / NULLIF(s.n_days, 0)
+                - ((s.sum_day_pnl + s.open_day_pnl) ^ 2) / NULLIF((s.n_days + 1) * s.n_days, 0)
+            )) AS std_day
+    ) d
+"""
+
+
+# Taken after LOCK TABLE trades IN SHARE MODE, which waits for every
+# transaction still inserting into trades and holds off new ones until
+# the SELECT is done: every id up to the horizon is then final.
+TRADE_HORIZON_SQL = "SELECT COALESCE(MAX(id), 0) AS horizon FROM trades;"
+
+HORIZON_LOCK_TIMEOUT = "30s"
+
+
+def ensure_trade_stats_table() -> None:
+    execute_command(ACCOUNT_TRADE_STATS_DDL)
+
+
+def _empty_state(account_ids: np.ndarray) -> pd.DataFrame:
+    state = pd.DataFrame(0.0, index=pd.Index(account_ids, name="account_id"), columns=AGGREGATE_COLUMNS)
+    state["open_day"] = pd.NaT
+    return state
+
+
+def load_state() -> pd.DataFrame:
+    df = query_frame(f"SELECT account_id, {', '.join(AGGREGATE_COLUMNS)} FROM account_trade_stats;")
+    df = df.set_index("account_id")
+    for col in AGGREGATE_COLUMNS:
+        if col != "open_day":
+            df[col] = df[col].astype(float)
+    df["open_day"] = pd.to_datetime(df["open_day"])
+    return df
+
+
+def trade_horizon() -> int:
+    """Highest trades.id below which no ingest transaction is still in flight."""
+    with transaction() as cursor:
+        cursor.execute("SELECT set_config('lock_timeout', %s, TRUE);", (HORIZON_LOCK_TIMEOUT,))
+        cursor.execute("LOCK TABLE trades IN SHARE MODE;")
+        cursor.execute(TRADE_HORIZON_SQL)
+        return int(cursor.fetchone()["horizon"])
+
+
+def load_new_trades(last_trade_id: int = 0, horizon: Optional[int] = None) -> pd.DataFrame:
+    """
+    Closing deals with id above the global stats watermark and at most
+    `horizon` (see trade_horizon), read from the primary so a lagging
+    replica cannot hide any of them. Per-account watermarks filter further
+    in fold_trades.
+    """
+    df = query_frame(
+        """
+        SELECT id, account_id, executed_at,
+               profit + commission + swap AS net,
+               risk_amount
+        FROM trades
+        WHERE entry = 'out'
+          AND id > %s
+          AND (%s::bigint IS NULL OR id <= %s)
+        ORDER BY account_id, executed_at, id;
+        """,
+        (last_trade_id, horizon, horizon),
+        replica=False,
+    )
+    df["net"] = df["net"].astype(float)
+    df["risk_amount"] = df["risk_amount"].astype(float)
+    df["executed_at"] = pd.to_datetime(df["executed_at"], utc=True)
+    return df
+
+
+def fold_trades(state: pd.DataFrame, trades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fold new closing deals into aggregate state, vectorized with pandas
+    groupby. Returns the updated rows (only accounts with new trades).
+    `trades` must be sorted by account_id, executed_at.
+    """
+    if trades.empty:
+        return state.iloc[0:0]
+
+    accounts = trades["account_id"].unique()
+    missing = np.setdiff1d(accounts, state.index.to_numpy())
+    if len(missing):
+        state = pd.concat([state, _empty_state(missing)])
+
+    # Drop deals at or below each account's own watermark.
+    seen = trades["account_id"].map(state["last_trade_id"]).fillna(0)
+    trades = trades[trades["id"] > seen]
+    if trades.empty:
+        return state.iloc[0:0]
+
+    prev = state.loc[trades["account_id"].unique()]
+    by_account = trades.groupby("account_id", sort=False)
+    net = trades["net"]
+
+    out = prev.copy()
+    out["last_trade_id"] = by_account["id"].max()
+    out["n_trades"] += by_account.size()
+    out["n_wins"] += (net > 0).groupby(trades["account_id"], sort=False).sum()
+    out["gross_profit"] += net.clip(lower=0).groupby(trades["account_id"], sort=False).sum()
+    out["gross_loss"] += (-net.clip(upper=0)).groupby(trades["account_id"], sort=False).sum()
+
+    has_r = trades["risk_amount"] > 0
+    r = (net[has_r] / trades.loc[has_r, "risk_amount"]).groupby(trades.loc[has_r, "account_id"]).agg(["sum", "count"])
+    out["sum_r"] = out["sum_r"].add(r["sum"], fill_value=0)
+    out["n_r"] = out["n_r"].add(r["count"], fill_value=0)
+
+    # Equity-curve drawdown continuing from the carried cum/peak.
+    cum = trades["account_id"].map(prev["cum_pnl"]) + by_account["net"].cumsum()
+    peak = np.maximum(cum.groupby(trades["account_id"], sort=False).cummax(), trades["account_id"].map(prev["peak_pnl"]))
+    out["cum_pnl"] = cum.groupby(trades["account_id"], sort=False).last()
+    out["peak_pnl"] = peak.groupby(trades["account_id"], sort=False).last()
+    out["max_drawdown"] = np.maximum(prev["max_drawdown"], (peak - cum).groupby(trades["account_id"], sort=False).max())
+
+    # Daily P&L: merge the carried open day, fold all but the last day.
+    days = (
+        trades.assign(day=trades["executed_at"].dt.tz_localize(None).dt.normalize())
+        .groupby(["account_id", "day"], sort=True)["net"].sum()
+        .reset_index()
+    )
+    carried = days["account_id"].map(prev["open_day"])
+    same_open = days["day"] == carried
+    days.loc[same_open, "net"] += days.loc[same_open, "account_id"].map(prev["open_day_pnl"])
+
+    # Carried open day that is not continued today is now finished.
+    continued = days.loc[same_open, "account_id"].unique()
+    closing_open = prev.index[prev["open_day"].notna() & ~prev.index.isin(continued)]
+
+    last = days.groupby("account_id", sort=False).tail(1).set_index("account_id")
+    finished = days.drop(days.groupby("account_id", sort=False).tail(1).index)
+    finished = pd.concat([
+        finished[["account_id", "net"]],
+        pd.DataFrame({"account_id": closing_open, "net": prev.loc[closing_open, "open_day_pnl"].to_numpy()}),
+    ])
+    finished["sq"] = np.square(finished["net"])
+    fin = finished.groupby("account_id").agg(
+        n=("net", "count"),
+        total=("net", "sum"),
+        sq=("sq", "sum"),
+        best=("net", "max"),
+    )
+
+    out["n_days"] = out["n_days"].add(fin["n"], fill_value=0)
+    out["sum_day_pnl"] = out["sum_day_pnl"].add(fin["total"], fill_value=0)
+    out["sumsq_day_pnl"] = out["sumsq_day_pnl"].add(fin["sq"], fill_value=0)
+    out["best_day_pnl"] = np.fmax(out["best_day_pnl"], fin["best"].reindex(out.index))
+    out["open_day"] = last["day"]
+    out["open_day_pnl"] = last["net"]
+
+    return out
+
+
+def _rows(frame: pd.DataFrame) -> list[tuple]:
+    rows = []
+    for r in frame.reset_index().itertuples(index=False):
+        rows.append((
+            int(r.account_id),
+            int(r.last_trade_id),
+            int(r.n_trades),
+            int(r.n_wins),
+            round(float(r.gross_profit), 2),
+            round(float(r.gross_loss), 2),
+            float(r.sum_r),
+            int(r.n_r),
+            round(float(r.cum_pnl), 2),
+            round(float(r.peak_pnl), 2),
+            round(float(r.max_drawdown), 2),
+            int(r.n_days),
+            float(r.sum_day_pnl),
+            float(r.sumsq_day_pnl),
+            round(float(r.best_day_pnl), 2),
+            None if pd.isna(r.open_day) else r.open_day.date(),
+            round(float(r.open_day_pnl), 2),
+        ))
+    return rows
+
+
+def refresh_trade_stats(*, full: bool = False) -> dict:
+    """
+    Fold newly ingested closing deals into account_trade_stats. With
+    full=True the aggregates are rebuilt from the whole trades history.
+    """
+    started = time.perf_counter()
+    ensure_trade_stats_table()
+    if full:
+        execute_command("TRUNCATE account_trade_stats;")
+
+    # Every refresh folds all trades up to its horizon, and every id below
+    # that horizon was final when it was taken, so the highest per-account
+    # watermark is a safe global lower bound.
+    horizon = trade_horizon()
+    state = load_state()
+    since = int(state["last_trade_id"].max()) if len(state) else 0
+    trades = load_new_trades(since, horizon)
+    updated = fold_trades(state, trades)
+
+    execute_many(
+        f"""
+        INSERT INTO account_trade_stats (account_id, {", ".join(AGGREGATE_COLUMNS)}, updated_at)
+        VALUES %s
+        ON CONFLICT (account_id) DO UPDATE
+        SET {", ".join(f"{c} = EXCLUDED.{c}" for c in AGGREGATE_COLUMNS)},
+            updated_at = NOW();
+        """,
+        _rows(updated),
+        template=f"({', '.join(['%s'] * (len(AGGREGATE_COLUMNS) + 1))}, NOW())",
+        page_size=5_000,
+    )
+
+    return {
+        "trades": len(trades),
+        "accounts_updated": len(updated),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def trade_stats(account_ids: Optional[Sequence[int]] = None) -> pd.DataFrame:
+    """
+    Derived statistics per account, indexed by account_id. Empty (with the
+    stat columns) if the stats table has not been built yet.
+    """
+    rows = execute_query(
+        DERIVED_STATS_SELECT + " WHERE (%s IS NULL OR s.account_id = ANY(%s));",
+        (list(account_ids) if account_ids is not None else None,) * 2,
+    )
+    from veilon_core.frames import TRADE_STATS_SCHEMA
+
+    df = pd.DataFrame(rows, columns=["account_id", "n_trades", *STAT_LABELS])
+    return TRADE_STATS_SCHEMA.apply(df.set_index("account_id").astype(float))
+
+
+def account_trade_stats(account_id: int) -> dict:
+    df = trade_stats([account_id])
+    if df.empty:
+        return {}
+    return df.iloc[0].to_dict()
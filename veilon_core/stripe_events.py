@@ -0,0 +1,673 @@
+from __future__ import annotations
+import hashlib
+import hmac
+import json
+import queue
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+import psycopg2
+from veilon_core.accounts import accounts_create_for_orders
+from veilon_core.coupons import coupon_record_order_redemptions, ensure_coupon_tables
+from veilon_core.db import execute_command, execute_many, transaction
+from veilon_core.equity import equity_record_points
+from veilon_core.orders import ensure_orders_columns
+
+# -------------------------------------------------------------------
+# Stripe webhook ingestion.
+#
+# receive() verifies the signature, queues the raw event and waits until
+# it is stored; only then is the webhook acked, so an event Stripe has
+# seen acknowledged is always in the database. Two workers:
+#   1. store: drains whatever is queued into one multi-row INSERT into
+#      stripe_events ON CONFLICT (id) DO NOTHING (group commit) --
+#      redelivered events are dropped here -- and releases the waiting
+#      requests, or fails them so Stripe redelivers;
+#   2. apply: asynchronously claim unprocessed events oldest-first (SKIP LOCKED) and
+#      apply them to `orders` with one set-based statement per kind
+#      (checkout upsert, refunds, disputes), straight from the JSONB;
+#   3. create accounts for orders that became paid, and record their
+#      coupon redemptions, in the same transaction, so a claimed event is
+#      never marked processed without its account or its coupon use.
+#
+# Out-of-order delivery: checkout and dispute updates only win if their
+# event is newer than what the order already reflects, and refunded
+# amounts only grow. A refund/dispute event whose order does not exist
+# yet is not a failure: it stays pending and is retried with a delay that
+# grows with its age, for as long as Stripe itself would redeliver
+# (ORDER_WAIT). A batch that fails to apply is retried one event per
+# transaction; an event that fails on its own counts an attempt, backs
+# off, and is set aside (failed_at, last_error) after MAX_ATTEMPTS.
+# -------------------------------------------------------------------
+
+CHECKOUT_EVENTS = (
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+    "checkout.session.async_payment_failed",
+    "checkout.session.expired",
+)
+REFUND_EVENTS = ("charge.refunded",)
+DISPUTE_EVENTS = ("charge.dispute.created", "charge.dispute.updated", "charge.dispute.closed")
+HANDLED_EVENTS = CHECKOUT_EVENTS + REFUND_EVENTS + DISPUTE_EVENTS
+
+MAX_ATTEMPTS = 20
+ORDER_WAIT = "3 days"  # Stripe's redelivery window
+SIGNATURE_TOLERANCE = 300  # seconds
+
+STRIPE_DDL = """
+    CREATE TABLE IF NOT EXISTS stripe_events (
+        id            TEXT         PRIMARY KEY,
+        type          TEXT         NOT NULL,
+        created_at    TIMESTAMPTZ  NOT NULL,
+        payload       JSONB        NOT NULL,
+        received_at   TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+        processed_at  TIMESTAMPTZ,
+        attempts      INTEGER      NOT NULL DEFAULT 0
+    );
+
+    ALTER TABLE stripe_events
+        ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        ADD COLUMN IF NOT EXISTS failed_at       TIMESTAMPTZ,
+        ADD COLUMN IF NOT EXISTS last_error      TEXT;
+
+    CREATE INDEX IF NOT EXISTS stripe_events_pending_idx
+        ON stripe_events (created_at) WHERE processed_at IS NULL;
+
+    ALTER TABLE orders
+        ADD COLUMN IF NOT EXISTS stripe_session_id    TEXT,
+        ADD COLUMN IF NOT EXISTS stripe_payment_intent TEXT,
+        ADD COLUMN IF NOT EXISTS stripe_event_at      TIMESTAMPTZ,
+        ADD COLUMN IF NOT EXISTS dispute_status       TEXT,
+        ADD COLUMN IF NOT EXISTS disputed_amount      NUMERIC(18, 2),
+        ADD COLUMN IF NOT EXISTS dispute_event_at     TIMESTAMPTZ;
+
+    CREATE UNIQUE INDEX IF NOT EXISTS orders_stripe_session_idx ON orders (stripe_session_id);
+    CREATE INDEX IF NOT EXISTS orders_stripe_payment_intent_idx ON orders (stripe_payment_intent);
+    CREATE UNIQUE INDEX IF NOT EXISTS accounts_order_id_key ON accounts (order_id);
+    DROP INDEX IF EXISTS accounts_order_id_idx;
+"""
+
+_CLAIM = """
+    SELECT id
+    FROM stripe_events
+    WHERE processed_at IS NULL
+      AND failed_at IS NULL
+      AND next_attempt_at <= NOW()
+      {filter}
+    ORDER BY created_at
+    LIMIT %s
+    {lock};
+"""
+CLAIM_SQL = _CLAIM.format(filter="", lock="FOR UPDATE SKIP LOCKED")
+CLAIM_ONE_SQL = _CLAIM.format(filter="AND id = %s", lock="FOR UPDATE SKIP LOCKED")
+DUE_EVENTS_SQL = _CLAIM.format(filter="", lock="")
+
+# Latest event per session; amounts are in cents.
+APPLY_CHECKOUT_SQL = """
+    WITH ev AS (
+        SELECT DISTINCT ON (payload->'data'->'object'->>'id')
+            payload->'data'->'object' AS obj, type, created_at
+        FROM stripe_events
+        WHERE id = ANY(%(ids)s) AND type = ANY(%(types)s)
+        ORDER BY payload->'data'->'object'->>'id', created_at DESC
+    )
+    INSERT INTO orders (
+        user_id, plan_id, amount, status, coupon_code, discount_amount,
+        stripe_session_id, stripe_payment_intent, stripe_event_at, created_at
+    )
+    SELECT
+        (obj->'metadata'->>'user_id')::bigint,
+        (obj->'metadata'->>'plan_id')::bigint,
+        (obj->>'amount_total')::numeric / 100,
+        CASE
+            WHEN type = 'checkout.session.async_payment_failed' THEN 'failed'
+            WHEN type = 'checkout.session.expired' THEN 'canceled'
+            WHEN obj->>'payment_status' IN ('paid', 'no_payment_required') THEN 'paid'
+            ELSE 'pending'
+        END,
+        obj->'metadata'->>'coupon_code',
+        (obj->'total_details'->>'amount_discount')::numeric / 100,
+        obj->>'id',
+        obj->>'payment_intent',
+        created_at,
+        to_timestamp((obj->>'created')::bigint)
+    FROM ev
+    ON CONFLICT (stripe_session_id) DO UPDATE
+    SET status = EXCLUDED.status,
+        amount = EXCLUDED.amount,
+        discount_amount = COALESCE(EXCLUDED.discount_amount, orders.discount_amount),
+        stripe_payment_intent = COALESCE(EXCLUDED.stripe_payment_intent, orders.stripe_payment_intent),
+        stripe_event_at = EXCLUDED.stripe_event_at
+    WHERE orders.stripe_event_at <= EXCLUDED.stripe_event_at
+      AND orders.status NOT IN ('refunded', 'partially_refunded')
+    RETURNING id, status;
+"""
+
+# amount_refunded is cumulative, so the largest one is the latest state.
+APPLY_REFUNDS_SQL = """
+    WITH ev AS (
+        SELECT DISTINCT ON (obj->>'payment_intent')
+            obj->>'payment_intent' AS payment_intent,
+            (obj->>'amount_refunded')::numeric / 100 AS refunded,
+            created_at
+        FROM (
+            SELECT payload->'data'->'object' AS obj, created_at
+            FROM stripe_events
+            WHERE id = ANY(%(ids)s) AND type = ANY(%(types)s)
+        ) e
+        ORDER BY obj->>'payment_intent', (obj->>'amount_refunded')::bigint DESC
+    )
+    UPDATE orders o
+    SET refunded_amount = GREATEST(o.refunded_amount, ev.refunded),
+        status = CASE WHEN GREATEST(o.refunded_amount, ev.refunded) >= o.amount
+                      THEN 'refunded' ELSE 'partially_refunded' END,
+        refunded_at = CASE WHEN ev.refunded > o.refunded_amount THEN NOW() ELSE o.refunded_at END,
+        stripe_event_at = GREATEST(o.stripe_event_at, ev.created_at)
+    FROM ev
+    WHERE o.stripe_payment_intent = ev.payment_intent;
+"""
+
+APPLY_DISPUTES_SQL = """
+    WITH ev AS (
+        SELECT DISTINCT ON (obj->>'payment_intent')
+            obj->>'payment_intent' AS payment_intent,
+            obj->>'status' AS dispute_status,
+            (obj->>'amount')::numeric / 100 AS amount,
+            created_at
+        FROM (
+            SELECT payload->'data'->'object' AS obj, created_at
+            FROM stripe_events
+            WHERE id = ANY(%(ids)s) AND type = ANY(%(types)s)
+        ) e
+        ORDER BY obj->>'payment_intent', created_at DESC
+    )
+    UPDATE orders o
+    SET dispute_status = ev.dispute_status,
+        disputed_amount = ev.amount,
+        dispute_event_at = ev.created_at
+    FROM ev
+    WHERE o.stripe_payment_intent = ev.payment_intent
+      AND (o.dispute_event_at IS NULL OR o.dispute_event_at <= ev.created_at);
+"""
+
+# Refund/dispute events for orders we have not seen yet stay pending
+# without counting an attempt; the wait before the next try is a quarter
+# of their age (1s to 1h), and they are set aside after ORDER_WAIT.
+MARK_PROCESSED_SQL = """
+    UPDATE stripe_events e
+    SET processed_at = NOW(),
+        attempts = e.attempts + 1
+    WHERE e.id = ANY(%(ids)s)
+      AND (
+          e.type <> ALL(%(order_bound)s)
+          OR EXISTS (
+              SELECT 1 FROM orders o
+              WHERE o.stripe_payment_intent = e.payload->'data'->'object'->>'payment_intent'
+          )
+      );
+
+    UPDATE stripe_events
+    SET next_attempt_at = NOW() + LEAST(INTERVAL '1 hour', GREATEST(INTERVAL '1 second', (NOW() - received_at) / 4)),
+        failed_at = CASE WHEN created_at < NOW() - %(order_wait)s::interval THEN NOW() END,
+        last_error = 'order not found'
+    WHERE id = ANY(%(ids)s) AND processed_at IS NULL;
+"""
+
+# An event that failed to apply on its own: exponential backoff capped at
+# an hour, set aside after MAX_ATTEMPTS.
+FAIL_EVENT_SQL = """
+    UPDATE stripe_events
+    SET attempts = attempts + 1,
+        last_error = %(error)s,
+        next_attempt_at = NOW() + LEAST(INTERVAL '1 hour', INTERVAL '1 second' * 2 ^ attempts),
+        failed_at = CASE WHEN attempts + 1 >= %(max_attempts)s THEN NOW() END
+    WHERE id = %(id)s;
+"""
+
+
+def ensure_stripe_tables() -> None:
+    ensure_orders_columns()
+    ensure_coupon_tables()
+    execute_command(STRIPE_DDL)
+
+
+def sign_payload(payload: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """Stripe-Signature header value for `payload` (used by the local stub)."""
+    timestamp = int(timestamp or time.time())
+    mac = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={mac}"
+
+
+def verify_event(payload: bytes, signature: str, secret: str) -> dict:
+    """
+    Checks the Stripe-Signature header and returns the parsed event.
+    Raises stripe.error.SignatureVerificationError or ValueError.
+    """
+    import stripe
+
+    stripe.WebhookSignature.verify_header(payload.decode("utf-8"), signature, secret, SIGNATURE_TOLERANCE)
+    return json.loads(payload)
+
+
+def store_events(events: list[dict]) -> int:
+    """Inserts raw events, skipping ids already stored. Returns how many were new."""
+    rows = execute_many(
+        """
+        INSERT INTO stripe_events (id, type, created_at, payload)
+        VALUES %s
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id;
+        """,
+        [(e["id"], e["type"], e["created"], json.dumps(e)) for e in events],
+        template="(%s, %s, to_timestamp(%s), %s::jsonb)",
+        fetch_results=True,
+    )
+    return len(rows)
+
+
+def apply_pending_events(limit: int = 5_000) -> dict:
+    """
+    Applies up to `limit` due events and creates accounts for orders that
+    are now paid, in one transaction. If the batch fails (one malformed
+    event rolls back all of them), the due events are applied one per
+    transaction instead, and the ones that still fail count an attempt.
+    """
+    try:
+        return _apply_claimed(CLAIM_SQL, (limit,))
+    except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+        print(f"Stripe batch failed, applying events one by one: {e}")
+
+    with transaction() as cursor:
+        cursor.execute(DUE_EVENTS_SQL, (limit,))
+        ids = [r["id"] for r in cursor.fetchall()]
+    total = {"claimed": 0, "orders": 0, "pending": 0, "accounts_created": 0, "coupons_redeemed": 0, "failed": 0}
+    for event_id in ids:
+        try:
+            result = _apply_claimed(CLAIM_ONE_SQL, (event_id, 1))
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            execute_command(FAIL_EVENT_SQL, {"id": event_id, "error": str(e).strip(), "max_attempts": MAX_ATTEMPTS})
+            result = {"claimed": 1, "pending": 1, "failed": 1}
+        for key, value in result.items():
+            total[key] += value
+    return total
+
+
+def _apply_claimed(claim_sql: str, params: tuple) -> dict:
+    with transaction() as cursor:
+        cursor.execute(claim_sql, params)
+        ids = [r["id"] for r in cursor.fetchall()]
+        if not ids:
+            return {"claimed": 0, "orders": 0, "pending": 0, "accounts_created": 0, "coupons_redeemed": 0, "failed": 0}
+
+        cursor.execute(APPLY_CHECKOUT_SQL, {"ids": ids, "types": list(CHECKOUT_EVENTS)})
+        upserted = cursor.fetchall()
+        cursor.execute(APPLY_REFUNDS_SQL, {"ids": ids, "types": list(REFUND_EVENTS)})
+        cursor.execute(APPLY_DISPUTES_SQL, {"ids": ids, "types": list(DISPUTE_EVENTS)})
+        cursor.execute(MARK_PROCESSED_SQL, {
+            "ids": ids, "order_bound": list(REFUND_EVENTS + DISPUTE_EVENTS), "order_wait": ORDER_WAIT,
+        })
+        pending = cursor.rowcount
+
+        paid = [r["id"] for r in upserted if r["status"] == "paid"]
+        created = accounts_create_for_orders(paid, actor_type="stripe", cursor=cursor)
+        redeemed = coupon_record_order_redemptions(paid, cursor=cursor)
+
+    if created:
+        equity_record_points([r["id"] for r in created], [float(r["balance"]) for r in created])
+    return {"claimed": len(ids), "orders": len(upserted), "pending": pending,
+            "accounts_created": len(created), "coupons_redeemed": redeemed, "failed": 0}
+
+
+class StripeIngestor:
+    """
+    Verifies webhook events and persists them before acking: receive()
+    returns once the store worker has written the event (batched with
+    whatever else arrived meanwhile, up to `batch_size`). A second worker
+    applies stored events every `flush_interval` seconds, or sooner when
+    new ones arrive. Run one ingestor per database.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[str] = None,
+        batch_size: int = 1_000,
+        flush_interval: float = 0.2,
+        store_timeout: float = 10.0,
+    ):
+        if secret is None:
+            from veilon_core.config import STRIPE_WEBHOOK_SECRET
+            secret = STRIPE_WEBHOOK_SECRET
+        if not secret:
+            raise RuntimeError("STRIPE_WEBHOOK_SECRET is not set. Cannot verify Stripe webhooks.")
+        self.secret = secret
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.store_timeout = store_timeout
+        self.queue: queue.Queue = queue.Queue(maxsize=100_000)
+        self.stats = {"received": 0, "rejected": 0, "stored": 0, "duplicates": 0,
+                      "applied": 0, "accounts_created": 0, "coupons_redeemed": 0, "failed": 0, "batches": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._stored = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def verify(self, payload: bytes, signature: str) -> dict:
+        try:
+            return verify_event(payload, signature, self.secret)
+        except Exception:
+            self._count(rejected=1)
+            raise
+
+    def persist(self, event: dict) -> None:
+        """
+        Queues a verified event and blocks until it is stored. Raises
+        queue.Full, TimeoutError or the storage error; the caller must
+        then not ack, so Stripe redelivers.
+        """
+        waiter = _Waiter()
+        self.queue.put((event, waiter), timeout=self.store_timeout)
+        if not waiter.done.wait(self.store_timeout):
+            raise TimeoutError(f"Stripe event {event['id']} was not stored within {self.store_timeout}s.")
+        if waiter.error is not None:
+            raise waiter.error
+        self._count(received=1)
+
+    def receive(self, payload: bytes, signature: str) -> str:
+        event = self.verify(payload, signature)
+        self.persist(event)
+        return event["id"]
+
+    def start(self) -> None:
+        if not any(t.is_alive() for t in self._threads):
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._store_loop, name="stripe-store", daemon=True),
+                threading.Thread(target=self._apply_loop, name="stripe-apply", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self) -> None:
+        """Stores what is queued, runs a last apply pass and stops both workers."""
+        self._stop.set()
+        self._stored.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _drain(self) -> list[tuple[dict, "_Waiter"]]:
+        # Wait for the first event only; then take whatever else is queued.
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def store(self, batch: list[tuple[dict, "_Waiter"]]) -> None:
+        error = None
+        try:
+            stored = store_events([event for event, _ in batch])
+        except Exception as e:
+            error = e
+            self._count(errors=1)
+            print(f"Stripe ingestion error: {e}")
+        else:
+            self._count(stored=stored, duplicates=len(batch) - stored)
+            self._stored.set()
+        for _, waiter in batch:
+            waiter.error = error
+            waiter.done.set()
+
+    def apply(self) -> None:
+        # Also retries events left pending by earlier batches.
+        result = apply_pending_events(limit=max(self.batch_size * 2, 1_000))
+        self._count(
+            applied=result["claimed"] - result["pending"],
+            accounts_created=result["accounts_created"],
+            coupons_redeemed=result["coupons_redeemed"],
+            failed=result["failed"],
+            batches=1,
+        )
+
+    def _store_loop(self) -> None:
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._drain()
+            if batch:
+                self.store(batch)
+
+    def _apply_loop(self) -> None:
+        while True:
+            self._stored.wait(self.flush_interval)
+            self._stored.clear()
+            # Checked before applying, so the last pass sees every stored event.
+            last = self._stop.is_set() and not self._threads[0].is_alive()
+            try:
+                self.apply()
+            except Exception as e:
+                # Stored events stay unprocessed; the next pass retries them.
+                self._count(errors=1)
+                print(f"Stripe apply error: {e}")
+                if not last:
+                    time.sleep(1.0)
+            if last:
+                return
+
+
+class _Waiter:
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+def serve(ingestor: StripeIngestor, host: str = "0.0.0.0", port: int = 8502, path: str = "/stripe/webhook") -> None:
+    """
+    Minimal webhook endpoint: 200 once the event is verified and stored,
+    400 on a bad signature or body, 503 when it could not be stored (Stripe
+    then redelivers).
+    """
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path:
+                self.send_response(404)
+                self.end_headers()
+                return
+            payload = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                event = ingestor.verify(payload, self.headers.get("Stripe-Signature", ""))
+            except Exception:
+                self.send_response(400)
+                self.end_headers()
+                return
+            try:
+                ingestor.persist(event)
+            except Exception:
+                self.send_response(503)
+            else:
+                self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    ingestor.start()
+    ThreadingHTTPServer((host, port), _Handler).serve_forever()
+
+
+def stub_events(
+    n_sessions: int,
+    user_ids: list[int],
+    plan_ids: list[int],
+    *,
+    duplicate_rate: float = 0.1,
+    shuffle_window: int = 50,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Synthetic event stream for load tests: checkouts (some async, some
+    failing), partial and full refunds and disputes, with duplicate
+    deliveries and local reordering.
+    """
+    rng = random.Random(seed)
+    base = int(time.time()) - 3_600
+    events = []
+
+    def event(kind: str, obj: dict, at: int) -> None:
+        events.append({"id": f"evt_{seed}_{len(events)}", "type": kind, "created": at, "data": {"object": obj}})
+
+    for i in range(n_sessions):
+        at = base + i // 10
+        session = {
+            "id": f"cs_{seed}_{i}",
+            "payment_intent": f"pi_{seed}_{i}",
+            "amount_total": rng.choice([9_900, 19_900, 29_900, 49_900]),
+            "created": at,
+            "metadata": {
+                "user_id": str(rng.choice(user_ids)),
+                "plan_id": str(rng.choice(plan_ids)),
+                "coupon_code": rng.choice([None, None, None, "SAVE10"]),
+            },
+        }
+        roll = rng.random()
+        if roll < 0.1:
+            event("checkout.session.completed", {**session, "payment_status": "unpaid"}, at)
+            outcome = "checkout.session.async_payment_succeeded" if rng.random() < 0.7 else "checkout.session.async_payment_failed"
+            event(outcome, {**session, "payment_status": "paid" if outcome.endswith("succeeded") else "unpaid"}, at + 5)
+        elif roll < 0.15:
+            event("checkout.session.expired", {**session, "payment_status": "unpaid"}, at)
+            continue
+        else:
+            event("checkout.session.completed", {**session, "payment_status": "paid"}, at)
+
+        charge = {"id": f"ch_{seed}_{i}", "payment_intent": session["payment_intent"], "amount": session["amount_total"]}
+        if rng.random() < 0.08:
+            event("charge.refunded", {**charge, "amount_refunded": session["amount_total"] // 2}, at + 20)
+            event("charge.refunded", {**charge, "amount_refunded": session["amount_total"]}, at + 40)
+        if rng.random() < 0.02:
+            dispute = {"id": f"dp_{seed}_{i}", "payment_intent": session["payment_intent"], "amount": session["amount_total"]}
+            event("charge.dispute.created", {**dispute, "status": "needs_response"}, at + 30)
+            event("charge.dispute.closed", {**dispute, "status": rng.choice(["won", "lost"])}, at + 60)
+
+    events += [dict(e) for e in rng.sample(events, int(len(events) * duplicate_rate))]
+    for start in range(0, len(events), shuffle_window):
+        window = events[start:start + shuffle_window]
+        rng.shuffle(window)
+        events[start:start + shuffle_window] = window
+    return events
+
+
+def load_test(n_sessions: int = 20_000, rate: float = 5_000.0, seed: int = 0, concurrency: int = 256) -> dict:
+    """
+    Feeds signed stub events through receive() at `rate` events/s from
+    `concurrency` threads (receive() blocks until the event is stored, like
+    concurrent webhook requests) and waits until everything is applied.
+    Reports throughput and checks one order per session and one account
+    per paid order. Only runs against a database marked as scratch: it
+    creates paid orders and trading accounts for existing users.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from veilon_core.db import execute_query
+    from veilon_core.synthetic import require_scratch_database
+
+    require_scratch_database()
+    ensure_stripe_tables()
+    users = [r["id"] for r in execute_query("SELECT id FROM users ORDER BY id LIMIT 1000;")]
+    plans = [r["id"] for r in execute_query("SELECT id FROM plans ORDER BY id;")]
+    if not users or not plans:
+        raise RuntimeError("load_test needs at least one user and one plan.")
+
+    secret = "whsec_stub"
+    events = stub_events(n_sessions, users, plans, seed=seed)
+    ingestor = StripeIngestor(secret=secret)
+    ingestor.start()
+
+    def send(event: dict) -> str:
+        payload = json.dumps(event).encode()
+        return ingestor.receive(payload, sign_payload(payload, secret))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        acks = []
+        for i, event in enumerate(events):
+            acks.append(pool.submit(send, event))
+            ahead = i / rate - (time.perf_counter() - t0)
+            if ahead > 0:
+                time.sleep(ahead)
+        for ack in acks:
+            ack.result()
+    sent = time.perf_counter() - t0
+
+    ingestor.stop()  # every event is stored by now; runs a last apply pass
+    # Refunds that arrived before their checkout wait out a short backoff.
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        apply_pending_events()
+        waiting = execute_query(
+            "SELECT COUNT(*) AS n FROM stripe_events WHERE processed_at IS NULL AND failed_at IS NULL AND id LIKE %s;",
+            (f"evt_{seed}_%",),
+        )
+        if not (waiting and waiting[0]["n"]):
+            break
+        time.sleep(0.5)
+    elapsed = time.perf_counter() - t0
+
+    check = execute_query(
+        """
+        SELECT
+            COUNT(*) AS orders,
+            COUNT(DISTINCT stripe_session_id) AS sessions,
+            COUNT(*) FILTER (WHERE status = 'paid') AS paid,
+            (SELECT COUNT(*) FROM accounts a JOIN orders o ON o.id = a.order_id
+             WHERE o.stripe_session_id LIKE %(prefix)s) AS accounts,
+            (SELECT COUNT(*) FROM (
+                SELECT a.order_id FROM accounts a JOIN orders o ON o.id = a.order_id
+                WHERE o.stripe_session_id LIKE %(prefix)s
+                GROUP BY a.order_id HAVING COUNT(*) > 1) d) AS duplicate_accounts
+        FROM orders
+        WHERE stripe_session_id LIKE %(prefix)s;
+        """,
+        {"prefix": f"cs_{seed}_%"},
+    )[0]
+
+    return {
+        "events": len(events),
+        "send_seconds": round(sent, 2),
+        "total_seconds": round(elapsed, 2),
+        "events_per_second": round(len(events) / elapsed, 1),
+        **ingestor.stats,
+        **check,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stripe webhook ingestion")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="run the webhook endpoint")
+    serve_parser.add_argument("--port", type=int, default=8502)
+    stub_parser = sub.add_parser("stub", help="load test against the local stub")
+    stub_parser.add_argument("--sessions", type=int, default=20_000)
+    stub_parser.add_argument("--rate", type=float, default=5_000.0)
+    stub_parser.add_argument("--seed", type=int, default=0)
+    stub_parser.add_argument("--concurrency", type=int, default=256)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        ensure_stripe_tables()
+        serve(StripeIngestor(), port=args.port)
+    else:
+        print(load_test(args.sessions, args.rate, args.seed, args.concurrency))
@@ -0,0 +1,647 @@
+from __future__ import annotations
+import json
+import math
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import numpy as np
+import pandas as pd
+from veilon_core.db import copy_frame, execute_command, execute_query, transaction, use_database
+
+# -------------------------------------------------------------------
+# Synthetic prop-firm dataset.
+#
+# Generates users, orders, accounts, account_events, payouts and trades
+# shaped like the real firm: buyers signing up at a growing rate and
+# buying one or more challenges, a phase funnel with per-phase pass
+# rates and a long tail of breaches, in-review and funded accounts,
+# payout cycles on funded accounts, and trades whose drift follows each
+# account's outcome. Rows are built with NumPy in chunks of accounts
+# and loaded with COPY (db.copy_frame), one transaction per chunk.
+#
+# Each chunk has its own child seed, so a dataset depends only on
+# `seed` and the parameters. New rows take ids after the current maxima,
+# so a generator run appends; --truncate empties the tables first.
+#
+# The target is always an explicit --dsn, never the DB_*/.env config, and
+# it must be marked as a scratch database (the veilon_scratch_database
+# table). --mark-scratch marks a database that has no users yet.
+#
+#   python -m veilon_core.synthetic --dsn "dbname=veilon_bench" --mark-scratch --accounts 100000
+#   python -m veilon_core.synthetic --dsn "dbname=veilon_bench" --accounts 100000 --truncate
+#   python -m veilon_core.synthetic --dsn "dbname=veilon_bench" --accounts 1000000 --no-trades
+# -------------------------------------------------------------------
+
+CHUNK_ACCOUNTS = 100_000
+
+# Base tables for an empty database; later columns come from the
+# modules' own ensure_* helpers (see ensure_synthetic_schema).
+BASE_DDL = """
+    CREATE TABLE IF NOT EXISTS users (
+        id          BIGSERIAL    PRIMARY KEY,
+        email       TEXT         NOT NULL UNIQUE,
+        created_at  TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS plans (
+        id            BIGSERIAL    PRIMARY KEY,
+        name          TEXT         NOT NULL,
+        account_size  NUMERIC      NOT NULL,
+        price         NUMERIC      NOT NULL DEFAULT 0,
+        created_at    TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS orders (
+        id          BIGSERIAL    PRIMARY KEY,
+        user_id     BIGINT,
+        plan_id     BIGINT,
+        amount      NUMERIC,
+        status      TEXT,
+        created_at  TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS accounts (
+        id                        BIGSERIAL    PRIMARY KEY,
+        user_id                   BIGINT,
+        order_id                  BIGINT,
+        plan_id                   BIGINT,
+        balance                   NUMERIC,
+        phase                     INTEGER,
+        is_enabled                BOOLEAN      DEFAULT TRUE,
+        is_funded                 BOOLEAN      DEFAULT FALSE,
+        in_review                 BOOLEAN      DEFAULT FALSE,
+        created_at                TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+        funded_at                 TIMESTAMPTZ,
+        closed_at                 TIMESTAMPTZ,
+        notes                     TEXT,
+        notes_updated_at          TIMESTAMPTZ,
+        notes_updated_by_user_id  BIGINT,
+        metaapi_account_id        TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS payouts (
+        id          BIGSERIAL    PRIMARY KEY,
+        account_id  BIGINT,
+        user_id     BIGINT,
+        amount      NUMERIC,
+        status      TEXT,
+        created_at  TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+        paid_at     TIMESTAMPTZ
+    );
+
+    CREATE TABLE IF NOT EXISTS account_events (
+        id           BIGSERIAL    PRIMARY KEY,
+        account_id   BIGINT       NOT NULL,
+        event_type   TEXT         NOT NULL,
+        event_status TEXT,
+        actor_type   TEXT,
+        actor_id     BIGINT,
+        payload      JSONB        NOT NULL DEFAULT '{}',
+        occurred_at  TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+"""
+
+DEFAULT_PLANS = (
+    # name, account_size, price, phase_count
+    ("10k", 10_000, 99, 2),
+    ("25k", 25_000, 199, 2),
+    ("50k", 50_000, 299, 2),
+    ("100k", 100_000, 499, 2),
+    ("200k", 200_000, 999, 2),
+    ("50k Instant", 50_000, 549, 1),
+)
+
+PLANS_SQL = """
+    SELECT id, account_size::float8 AS account_size, price::float8 AS price,
+           phase_count, profit_split_pct::float8 AS profit_split_pct,
+           payout_cycle_days, max_trailing_drawdown_pct::float8 AS max_dd_pct,
+           min_trading_days
+    FROM plans
+    ORDER BY id;
+"""
+
+MAX_IDS_SQL = """
+    SELECT
+        (SELECT COALESCE(MAX(id), 0) FROM users)    AS users,
+        (SELECT COALESCE(MAX(id), 0) FROM orders)   AS orders,
+        (SELECT COALESCE(MAX(id), 0) FROM accounts) AS accounts,
+        (SELECT COALESCE(MAX(id), 0) FROM trades)   AS trades;
+"""
+
+# Rows inserted with explicit ids leave the serial sequences behind.
+SYNC_SEQUENCES_SQL = """
+    SELECT setval(pg_get_serial_sequence('users', 'id'), GREATEST((SELECT MAX(id) FROM users), 1));
+    SELECT setval(pg_get_serial_sequence('orders', 'id'), GREATEST((SELECT MAX(id) FROM orders), 1));
+    SELECT setval(pg_get_serial_sequence('accounts', 'id'), GREATEST((SELECT MAX(id) FROM accounts), 1));
+"""
+
+SCRATCH_MARKER_DDL = """
+    CREATE TABLE IF NOT EXISTS veilon_scratch_database (
+        marked_at  TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+"""
+
+IS_SCRATCH_SQL = "SELECT to_regclass('public.veilon_scratch_database') IS NOT NULL AS scratch;"
+
+SYNTHETIC_TABLES = ("users", "orders", "accounts", "payouts", "account_events", "trades")
+
+# Derived from the tables above; emptied with them so jobs rebuild from scratch.
+DERIVED_TABLES = (
+    "account_trade_stats", "trade_ingest_watermarks", "account_rule_state",
+    "account_equity_snapshots", "equity_rollup_watermarks", "account_balance_snapshots",
+    "affiliate_ledger", "affiliate_watermarks", "affiliate_pending_orders",
+    "coupon_redemptions", "coupon_user_redemptions",
+)
+
+SYMBOLS = ("EURUSD", "GBPUSD", "XAUUSD", "US30", "NAS100", "USDJPY", "BTCUSD")
+SYMBOL_WEIGHTS = (0.22, 0.12, 0.24, 0.1, 0.18, 0.08, 0.06)
+
+COUPON_CODES = ("SAVE10", "SAVE20", "WELCOME15")
+COUPON_DISCOUNTS = (0.10, 0.20, 0.15)
+
+
+@dataclass(frozen=True)
+class FirmProfile:
+    """Funnel and behaviour rates. Durations are in days."""
+    accounts_per_user: float = 2.2
+    signup_growth: float = 0.75          # <1: sign-ups skew towards the recent end
+    first_purchase_days: float = 20.0    # mean delay from sign-up to a purchase
+    unconverted_order_rate: float = 0.12  # failed / canceled / pending per paid order
+    coupon_rate: float = 0.15
+    refund_rate: float = 0.025
+    partial_refund_rate: float = 0.01
+    phase_pass_rates: tuple = (0.25, 0.55, 0.65)
+    phase_days_shape: float = 2.0
+    phase_days_scale: float = 6.0
+    review_days: float = 2.0             # last phase passed -> funded
+    review_reject_rate: float = 0.08
+    funded_life_days: float = 70.0       # mean time to breach once funded
+    disabled_rate: float = 0.005
+    payout_request_rate: float = 0.5     # share of cycles with a payout
+    payout_profit_pct: float = 2.5       # median profit per cycle, % of size
+    payout_reject_rate: float = 0.07
+    positions_per_day: float = 0.6
+    max_positions: int = 250
+
+
+def is_scratch_database() -> bool:
+    rows = execute_query(IS_SCRATCH_SQL)
+    return bool(rows and rows[0]["scratch"])
+
+
+def mark_scratch_database() -> None:
+    """
+    Marks the current database as scratch. Only allowed while it has no
+    users; mark a populated copy by creating veilon_scratch_database by hand.
+    """
+    if is_scratch_database():
+        return
+    rows = execute_query("SELECT to_regclass('public.users') IS NOT NULL AS found;")
+    if rows and rows[0]["found"] and execute_query("SELECT 1 FROM users LIMIT 1;"):
+        raise RuntimeError("Refusing to mark a database that already has users as scratch.")
+    execute_command(SCRATCH_MARKER_DDL)
+
+
+def require_scratch_database() -> None:
+    if not is_scratch_database():
+        raise RuntimeError(
+            "Refusing to write synthetic data: the target database is not marked as scratch "
+            "(no veilon_scratch_database table). Seed an empty scratch database once with "
+            "`python -m veilon_core.synthetic --dsn ... --mark-scratch`."
+        )
+
+
+def ensure_synthetic_schema() -> None:
+    from veilon_core.events import ensure_account_events_indexes
+    from veilon_core.orders import ensure_orders_columns
+    from veilon_core.plans import ensure_plan_payout_columns, ensure_plan_rule_columns
+    from veilon_core.search import ensure_search_columns
+    from veilon_core.trades import ensure_trades_tables
+
+    execute_command(BASE_DDL)
+    ensure_plan_rule_columns()
+    ensure_plan_payout_columns()
+    ensure_orders_columns()
+    ensure_trades_tables()
+    ensure_account_events_indexes()
+    ensure_search_columns()
+
+
+def ensure_default_plans() -> pd.DataFrame:
+    """The plan catalogue, seeding DEFAULT_PLANS into an empty plans table."""
+    if not execute_query("SELECT 1 FROM plans LIMIT 1;"):
+        for name, size, price, phases in DEFAULT_PLANS:
+            execute_command(
+                "INSERT INTO plans (name, account_size, price, phase_count) VALUES (%s, %s, %s, %s);",
+                (name, size, price, phases),
+            )
+    plans = pd.DataFrame(execute_query(PLANS_SQL))
+    return plans.astype({"phase_count": int, "payout_cycle_days": int, "min_trading_days": int})
+
+
+def truncate_synthetic_tables() -> None:
+    require_scratch_database()
+    existing = {
+        r["table_name"] for r in execute_query(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public';"
+        )
+    }
+    tables = [t for t in SYNTHETIC_TABLES + DERIVED_TABLES if t in existing]
+    execute_command(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY;")
+
+
+def _ts(start: np.datetime64, days: np.ndarray) -> np.ndarray:
+    return start + (days * 86_400e6).astype("timedelta64[us]")
+
+
+def _frame_ts(values: np.ndarray) -> pd.Series:
+    return pd.Series(pd.to_datetime(values).tz_localize("UTC"))
+
+
+def _payloads(template: str, **columns) -> list[str]:
+    keys = list(columns)
+    return [template % dict(zip(keys, row)) for row in zip(*columns.values())]
+
+
+def generate_chunk(
+    n_accounts: int,
+    plans: pd.DataFrame,
+    ids: dict,
+    start: datetime,
+    end: datetime,
+    profile: FirmProfile,
+    rng: np.random.Generator,
+    trades: bool = True,
+) -> dict[str, pd.DataFrame]:
+    """
+    One self-contained slice of the firm: the users, their orders,
+    accounts, events, payouts and trades. `ids` holds the last id used
+    per table and is advanced.
+    """
+    p = profile
+    t0 = np.datetime64(start.replace(tzinfo=None), "us")
+    span = (end - start).total_seconds() / 86_400
+
+    # ---- users: sign-ups grow over the period ----
+    n_users = max(1, math.ceil(n_accounts / p.accounts_per_user))
+    user_days = np.sort(span * rng.random(n_users) ** p.signup_growth)
+    user_ids = ids["users"] + 1 + np.arange(n_users)
+    ids["users"] += n_users
+    users = pd.DataFrame({
+        "id": user_ids,
+        "email": [f"user{i}@synthetic.veilon.test" for i in user_ids],
+        "created_at": _frame_ts(_ts(t0, user_days)),
+    })
+
+    # ---- paid orders -> accounts ----
+    owner = rng.integers(0, n_users, n_accounts)
+    acc_days = user_days[owner] + rng.exponential(p.first_purchase_days, n_accounts)
+    late = acc_days >= span
+    acc_days[late] = user_days[owner[late]] + rng.random(late.sum()) * (span - user_days[owner[late]])
+    order_of = np.argsort(acc_days, kind="stable")
+    owner, acc_days = owner[order_of], acc_days[order_of]
+
+    weights = 1 / np.sqrt(plans["price"].to_numpy())
+    plan_idx = rng.choice(len(plans), n_accounts, p=weights / weights.sum())
+    size = plans["account_size"].to_numpy()[plan_idx]
+    price = plans["price"].to_numpy()[plan_idx]
+    phase_count = plans["phase_count"].to_numpy()[plan_idx]
+
+    coupon = np.where(rng.random(n_accounts) < p.coupon_rate, rng.integers(0, len(COUPON_CODES), n_accounts), -1)
+    discount = np.where(coupon >= 0, np.take(COUPON_DISCOUNTS, np.maximum(coupon, 0)), 0.0)
+    amount = np.round(price * (1 - discount), 2)
+    roll = rng.random(n_accounts)
+    refunded = roll < p.refund_rate
+    partial = ~refunded & (roll < p.refund_rate + p.partial_refund_rate)
+    paid_status = np.where(refunded, "refunded", np.where(partial, "partially_refunded", "paid"))
+    refunded_amount = np.where(refunded, amount, np.where(partial, np.round(amount * rng.uniform(0.2, 0.6, n_accounts), 2), 0.0))
+    refund_days = np.where(refunded | partial, np.minimum(acc_days + rng.uniform(1, 14, n_accounts), span), np.nan)
+
+    # Unconverted checkouts: failed / declined / canceled, pending only if recent.
+    n_other = int(n_accounts * p.unconverted_order_rate)
+    other_owner = rng.integers(0, n_users, n_other)
+    other_days = user_days[other_owner] + rng.random(n_other) * (span - user_days[other_owner])
+    other_plan = rng.choice(len(plans), n_other, p=weights / weights.sum())
+    other_status = rng.choice(["failed", "declined", "canceled"], n_other, p=[0.6, 0.25, 0.15])
+    other_status = np.where(span - other_days < 1, "pending", other_status)
+
+    order_days = np.concatenate([acc_days - rng.uniform(1, 15, n_accounts) / 1440, other_days])
+    rank = np.empty(len(order_days), dtype=np.int64)
+    rank[np.argsort(order_days, kind="stable")] = np.arange(len(order_days))
+    order_ids = ids["orders"] + 1 + rank
+    ids["orders"] += len(order_days)
+    orders = pd.DataFrame({
+        "id": order_ids,
+        "user_id": user_ids[np.concatenate([owner, other_owner])],
+        "plan_id": plans["id"].to_numpy()[np.concatenate([plan_idx, other_plan])],
+        "amount": np.concatenate([amount, plans["price"].to_numpy()[other_plan]]),
+        "status": np.concatenate([paid_status, other_status]),
+        "created_at": _frame_ts(_ts(t0, np.maximum(order_days, 0))),
+        "coupon_code": pd.array(np.concatenate([
+            np.where(coupon >= 0, np.take(COUPON_CODES, np.maximum(coupon, 0)), None),
+            np.full(n_other, None),
+        ]), dtype="string"),
+        "refunded_amount": np.concatenate([refunded_amount, np.zeros(n_other)]),
+        "refunded_at": _frame_ts(_ts(t0, np.concatenate([refund_days, np.full(n_other, np.nan)]))),
+    }).sort_values("id")
+
+    # ---- phase funnel ----
+    age = span - acc_days
+    account_ids = ids["accounts"] + 1 + np.arange(n_accounts)
+    ids["accounts"] += n_accounts
+    phase = np.ones(n_accounts, dtype=np.int64)
+    t = np.zeros(n_accounts)
+    open_ = np.ones(n_accounts, dtype=bool)      # still being decided
+    closed_day = np.full(n_accounts, np.nan)
+    close_reason = np.full(n_accounts, None, dtype=object)
+    passed_all = np.zeros(n_accounts, dtype=bool)
+    ev_acc, ev_day, ev_type, ev_payload = [], [], [], []
+
+    for k in range(1, int(phase_count.max()) + 1):
+        in_k = open_ & (phase_count >= k)
+        min_days = plans["min_trading_days"].to_numpy()[plan_idx]
+        dur = min_days + rng.gamma(p.phase_days_shape, p.phase_days_scale, n_accounts)
+        rate = p.phase_pass_rates[min(k, len(p.phase_pass_rates)) - 1]
+        passes = rng.random(n_accounts) < rate
+        decided = in_k & (t + dur <= age)
+        still = in_k & ~decided
+        open_ &= ~still                            # undecided: active in phase k
+
+        breach = decided & ~passes
+        closed_day[breach] = acc_days[breach] + t[breach] + dur[breach]
+        close_reason[breach] = "max_drawdown"
+        open_ &= ~breach
+
+        promote = decided & passes
+        t = np.where(promote, t + dur, t)
+        last = promote & (phase_count == k)
+        passed_all |= last
+        next_phase = promote & ~last
+        phase[next_phase] = k + 1
+        ev_acc.append(account_ids[next_phase])
+        ev_day.append(acc_days[next_phase] + t[next_phase])
+        ev_type.append(np.full(next_phase.sum(), "account.phase.changed"))
+        ev_payload += _payloads('{"new_phase": %(p)d, "source": "rule_engine"}', p=np.full(next_phase.sum(), k + 1))
+        open_ &= ~last
+
+    # Final phase passed: review, then funded or rejected.
+    review_dur = rng.exponential(p.review_days, n_accounts)
+    in_review = passed_all & (t + review_dur > age)
+    reviewed = passed_all & ~in_review
+    rejected = reviewed & (rng.random(n_accounts) < p.review_reject_rate)
+    funded = reviewed & ~rejected
+    closed_day[rejected] = acc_days[rejected] + t[rejected] + review_dur[rejected]
+    close_reason[rejected] = "review_rejected"
+    funded_day = np.where(funded, acc_days + t + review_dur, np.nan)
+    funded_life = rng.exponential(p.funded_life_days, n_accounts)
+    funded_breach = funded & (funded_day + funded_life < span)
+    closed_day[funded_breach] = funded_day[funded_breach] + funded_life[funded_breach]
+    close_reason[funded_breach] = "max_drawdown"
+
+    for mask, resolution in ((passed_all, None), (reviewed & ~rejected, "approved"), (rejected, "rejected")):
+        days = acc_days + t if resolution is None else acc_days + t + review_dur
+        ev_acc.append(account_ids[mask])
+        ev_day.append(days[mask])
+        ev_type.append(np.full(mask.sum(), "account.review.updated"))
+        ev_payload += [
+            json.dumps({"in_review": resolution is None, "resolution": resolution, "reason": "profit_target"})
+        ] * int(mask.sum())
+
+    # Refunds close the account at the refund.
+    refund_close = refunded & np.isnan(closed_day)
+    closed_day[refund_close] = np.minimum(acc_days[refund_close] + rng.uniform(0.5, 5, refund_close.sum()), span)
+    close_reason[refund_close] = "refunded"
+
+    is_closed = ~np.isnan(closed_day) & (closed_day <= span)
+    ev_acc.append(account_ids[is_closed])
+    ev_day.append(closed_day[is_closed])
+    ev_type.append(np.full(is_closed.sum(), "account.closed"))
+    ev_payload += _payloads('{"close_reason": "%(r)s"}', r=close_reason[is_closed])
+
+    ev_acc.insert(0, account_ids)
+    ev_day.insert(0, acc_days)
+    ev_type.insert(0, np.full(n_accounts, "account.created"))
+    ev_payload[:0] = _payloads(
+        '{"user_id": %(u)d, "plan_id": %(p)d, "is_enabled": true, "initial_balance": "%(b).2f", "initial_phase": 1}',
+        u=user_ids[owner], p=plans["id"].to_numpy()[plan_idx], b=size,
+    )
+
+    dd = plans["max_dd_pct"].to_numpy()[plan_idx] / 100
+    balance = np.where(
+        is_closed & (close_reason == "max_drawdown"),
+        size * (1 - dd * rng.uniform(0.9, 1.0, n_accounts)),
+        size * (1 + np.where(funded, np.abs(rng.normal(0.02, 0.03, n_accounts)), rng.normal(0.01, 0.025, n_accounts))),
+    )
+    accounts = pd.DataFrame({
+        "id": account_ids,
+        "user_id": user_ids[owner],
+        "order_id": order_ids[:n_accounts],
+        "plan_id": plans["id"].to_numpy()[plan_idx],
+        "balance": np.round(balance, 2),
+        "phase": phase,
+        "is_enabled": rng.random(n_accounts) >= p.disabled_rate,
+        "is_funded": funded,
+        "in_review": in_review & ~is_closed,
+        "created_at": _frame_ts(_ts(t0, acc_days)),
+        "funded_at": _frame_ts(_ts(t0, np.nan_to_num(funded_day))).where(funded),
+        "closed_at": _frame_ts(_ts(t0, np.nan_to_num(closed_day))).where(is_closed),
+    })
+
+    ev_days = np.concatenate(ev_day)
+    events = pd.DataFrame({
+        "account_id": np.concatenate(ev_acc),
+        "event_type": np.concatenate(ev_type),
+        "actor_type": "system",
+        "payload": ev_payload,
+        "occurred_at": _frame_ts(_ts(t0, ev_days)),
+    })
+    events = events[ev_days <= span].sort_values("occurred_at", kind="stable")
+
+    # ---- payouts: one candidate per completed cycle while funded ----
+    cycle = plans["payout_cycle_days"].to_numpy()[plan_idx]
+    funded_until = np.where(is_closed, closed_day, span)
+    n_cycles = np.where(funded, np.floor((funded_until - np.nan_to_num(funded_day)) / cycle), 0).astype(np.int64)
+    n_cycles = np.maximum(n_cycles, 0)
+    pay_acc = np.repeat(np.arange(n_accounts), n_cycles)
+    pay_k = np.arange(len(pay_acc)) - np.repeat(np.cumsum(n_cycles) - n_cycles, n_cycles) + 1
+    keep = rng.random(len(pay_acc)) < p.payout_request_rate
+    pay_acc, pay_k = pay_acc[keep], pay_k[keep]
+    pay_day = funded_day[pay_acc] + pay_k * cycle[pay_acc] + rng.uniform(0, 2, len(pay_acc))
+    keep = pay_day <= span
+    pay_acc, pay_day = pay_acc[keep], pay_day[keep]
+    split = plans["profit_split_pct"].to_numpy()[plan_idx][pay_acc] / 100
+    pay_amount = size[pay_acc] * p.payout_profit_pct / 100 * rng.lognormal(0, 0.7, len(pay_acc)) * split
+    recent = span - pay_day < 3
+    pay_status = np.where(
+        recent,
+        rng.choice(["pending", "requested", "approved"], len(pay_acc)),
+        np.where(rng.random(len(pay_acc)) < p.payout_reject_rate, "rejected", "paid"),
+    )
+    paid_day = pay_day + rng.uniform(0.5, 3, len(pay_acc))
+    payouts = pd.DataFrame({
+        "account_id": account_ids[pay_acc],
+        "user_id": user_ids[owner][pay_acc],
+        "amount": np.round(pay_amount, 2),
+        "status": pay_status,
+        "created_at": _frame_ts(_ts(t0, pay_day)),
+        "paid_at": _frame_ts(_ts(t0, np.minimum(paid_day, span))).where(pay_status == "paid"),
+    }).sort_values("created_at", kind="stable")
+
+    frames = {"users": users, "orders": orders, "accounts": accounts, "account_events": events, "payouts": payouts}
+    if trades:
+        live_until = np.where(is_closed, closed_day, span)
+        active = np.maximum(live_until - acc_days, 0)
+        n_pos = np.minimum(rng.poisson(p.positions_per_day * active), p.max_positions)
+        # Drift by outcome: breached accounts lose, funded and passing ones win.
+        drift = np.where(close_reason == "max_drawdown", -0.0015, np.where(funded | passed_all, 0.0012, 0.0002)) * size
+        pos_acc = np.repeat(np.arange(n_accounts), n_pos)
+        n = len(pos_acc)
+        opened = acc_days[pos_acc] + rng.random(n) * active[pos_acc]
+        held = np.minimum(rng.exponential(0.15, n), np.maximum(live_until[pos_acc] - opened, 0))
+        profit = np.round(rng.normal(drift[pos_acc], 0.004 * size[pos_acc]), 2)
+        deal = ids["trades"] + 1 + np.arange(2 * n)
+        ids["trades"] += 2 * n
+        symbol = rng.choice(SYMBOLS, n, p=SYMBOL_WEIGHTS)
+        side = rng.choice(["buy", "sell"], n)
+        volume = np.round(rng.lognormal(np.log(size[pos_acc] / 50_000), 0.6), 2).clip(0.01)
+        price = np.round(rng.uniform(1, 2_000, n), 5)
+        frames["trades"] = pd.DataFrame({
+            "account_id": np.concatenate([account_ids[pos_acc]] * 2),
+            "deal_id": np.char.add("S", deal.astype(str)),
+            "position_id": np.char.add("SP", np.concatenate([deal[:n]] * 2).astype(str)),
+            "symbol": np.concatenate([symbol] * 2),
+            "side": np.concatenate([side, np.where(side == "buy", "sell", "buy")]),
+            "entry": np.repeat(["in", "out"], n),
+            "volume": np.concatenate([volume] * 2),
+            "price": np.concatenate([price, np.round(price * (1 + rng.normal(0, 0.002, n)), 5)]),
+            "profit": np.concatenate([np.zeros(n), profit]),
+            "commission": np.concatenate([np.round(-volume * 1.75, 2)] * 2),
+            "swap": 0.0,
+            "risk_amount": np.concatenate([np.full(n, np.nan), np.round(0.005 * size[pos_acc], 2)]),
+            "executed_at": _frame_ts(_ts(t0, np.concatenate([opened, opened + held]))),
+        })
+    return frames
+
+
+def _ensure_event_partitions(start: datetime) -> None:
+    from veilon_core.events import account_events_ensure_partitions, account_events_is_partitioned
+
+    if account_events_is_partitioned():
+        today = datetime.now(timezone.utc)
+        months = (today.year - start.year) * 12 + today.month - start.month
+        account_events_ensure_partitions(months_ahead=months + 3, start=start.date())
+
+
+def generate(
+    accounts: int,
+    *,
+    dsn: str,
+    mark_scratch: bool = False,
+    days: int = 365,
+    seed: int = 0,
+    trades: bool = True,
+    truncate: bool = False,
+    chunk_accounts: int = CHUNK_ACCOUNTS,
+    profile: Optional[FirmProfile] = None,
+    end: Optional[datetime] = None,
+) -> dict:
+    """
+    Generates and COPYs a dataset of about `accounts` accounts created
+    over the last `days` days into the scratch database at `dsn` (see
+    require_scratch_database). Returns row counts and throughput.
+    """
+    profile = profile or FirmProfile()
+    use_database(dsn)
+    if mark_scratch:
+        mark_scratch_database()
+    require_scratch_database()
+    ensure_synthetic_schema()
+    if truncate:
+        truncate_synthetic_tables()
+    plans = ensure_default_plans()
+    end = end or datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    _ensure_event_partitions(start)
+
+    ids = {k: int(v) for k, v in execute_query(MAX_IDS_SQL)[0].items()}
+    seeds = np.random.SeedSequence(seed).spawn(math.ceil(accounts / chunk_accounts))
+    counts: dict[str, int] = {}
+    gen_seconds = load_seconds = 0.0
+    started = time.perf_counter()
+
+    for i, child in enumerate(seeds):
+        n = min(chunk_accounts, accounts - i * chunk_accounts)
+        t0 = time.perf_counter()
+        frames = generate_chunk(n, plans, ids, start, end, profile, np.random.default_rng(child), trades)
+        t1 = time.perf_counter()
+        with transaction() as cursor:
+            for table, frame in frames.items():
+                counts[table] = counts.get(table, 0) + copy_frame(cursor, table, frame)
+        load_seconds += time.perf_counter() - t1
+        gen_seconds += t1 - t0
+        print(f"[synthetic] chunk {i + 1}/{len(seeds)}: {n} accounts, {sum(len(f) for f in frames.values())} rows",
+              file=sys.stderr, flush=True)
+
+    execute_command(SYNC_SEQUENCES_SQL)
+    for table in counts:
+        execute_command(f"ANALYZE {table};")
+
+    elapsed = time.perf_counter() - started
+    rows = sum(counts.values())
+    return {
+        "rows": counts,
+        "total_rows": rows,
+        "generate_seconds": round(gen_seconds, 2),
+        "load_seconds": round(load_seconds, 2),
+        "seconds": round(elapsed, 2),
+        "rows_per_minute": round(rows / elapsed * 60),
+        "profile": asdict(profile),
+    }
+
+
+def dataset_summary() -> dict:
+    """Funnel shape of what is in the database, to sanity-check a generated set."""
+    rows = execute_query(
+        """
+        SELECT
+            COUNT(*)                                                  AS accounts,
+            COUNT(*) FILTER (WHERE closed_at IS NULL AND NOT COALESCE(is_funded, FALSE)) AS in_evaluation,
+            COUNT(*) FILTER (WHERE phase >= 2)                        AS reached_phase_2,
+            COUNT(*) FILTER (WHERE in_review AND closed_at IS NULL)   AS in_review,
+            COUNT(*) FILTER (WHERE is_funded)                         AS funded,
+            COUNT(*) FILTER (WHERE is_funded AND closed_at IS NULL)   AS funded_active,
+            COUNT(*) FILTER (WHERE closed_at IS NOT NULL)             AS closed
+        FROM accounts;
+        """
+    )
+    return dict(rows[0]) if rows else {}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic prop-firm dataset")
+    parser.add_argument("--dsn", required=True, help="libpq DSN of the scratch database to write to")
+    parser.add_argument("--mark-scratch", action="store_true", help="mark the target (which must have no users) as scratch")
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=365, help="history length")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-accounts", type=int, default=CHUNK_ACCOUNTS)
+    parser.add_argument("--no-trades", action="store_true", help="skip the trades table")
+    parser.add_argument("--truncate", action="store_true", help="empty the synthetic and derived tables first")
+    args = parser.parse_args()
+
+    result = generate(
+        args.accounts,
+        dsn=args.dsn,
+        mark_scratch=args.mark_scratch,
+        days=args.days,
+        seed=args.seed,
+        trades=not args.no_trades,
+        truncate=args.truncate,
+        chunk_accounts=args.chunk_accounts,
+    )
+    result["summary"] = dataset_summary()
+    print(json.dumps(result, indent=2, default=str))
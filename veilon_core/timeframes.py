@@ -0,0 +1,66 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# -------------------------------------------------------------------
+# Timeframe selector options shared by the page headers, resolved to
+# UTC bounds so aggregates can be range scans with bound parameters.
+# -------------------------------------------------------------------
+
+TIMEFRAMES = ("This Month", "Last Month", "Today", "This Week", "This Quarter", "This Year", "All Time")
+
+
+@dataclass(frozen=True)
+class Bounds:
+    start: Optional[datetime]       # None for All Time
+    end: datetime
+    prev_start: Optional[datetime]  # comparison period, if any
+    prev_end: Optional[datetime]
+    bucket: str                     # date_trunc unit for series
+
+
+def _month_start(dt: datetime, months_back: int = 0) -> datetime:
+    month = dt.month - 1 - months_back
+    return dt.replace(year=dt.year + month // 12, month=month % 12 + 1, day=1,
+                      hour=0, minute=0, second=0, microsecond=0)
+
+
+def _open(start: datetime, now: datetime, prev_start: datetime, bucket: str) -> Bounds:
+    return Bounds(start, now, prev_start, min(start, prev_start + (now - start)), bucket)
+
+
+def timeframe_bounds(timeframe: str, now: Optional[datetime] = None) -> Bounds:
+    """
+    [start, end) for a timeframe label plus the comparison period before it.
+    Open periods (This Month, ...) compare against the same elapsed length
+    of the previous period; Last Month compares against the whole month before.
+    """
+    now = now or datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if timeframe == "Today":
+        return _open(today, now, today - timedelta(days=1), "hour")
+
+    if timeframe == "This Week":
+        start = today - timedelta(days=today.weekday())
+        return _open(start, now, start - timedelta(days=7), "day")
+
+    if timeframe == "This Month":
+        start = _month_start(now)
+        return _open(start, now, _month_start(now, 1), "day")
+
+    if timeframe == "Last Month":
+        start = _month_start(now, 1)
+        return Bounds(start, _month_start(now), _month_start(now, 2), start, "day")
+
+    if timeframe == "This Quarter":
+        start = _month_start(now, (now.month - 1) % 3)
+        return _open(start, now, _month_start(start, 3), "day")
+
+    if timeframe == "This Year":
+        start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        return _open(start, now, start.replace(year=start.year - 1), "week")
+
+    # All Time
+    return Bounds(None, now, None, None, "month")
@@ -0,0 +1,521 @@
+from __future__ import annotations
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional, Sequence
+from veilon_core.db import execute_command, execute_query, execute_many
+
+# -------------------------------------------------------------------
+# Equity / risk streaming tracker.
+#
+# Feeds push updates into the tracker; the tracker keeps only the latest
+# update per account (coalescing) and a flusher writes that set to
+# account_equity_snapshots in one batched INSERT every flush interval.
+# Accounts are sharded over at most `max_connections` feed streams; how
+# many upstream connections a stream holds is up to the feed (MetaApi
+# streams one connection per account).
+#
+#   python -m veilon_core.trackers serve
+#   python -m veilon_core.trackers load-test --accounts 50000 --rate 100000
+# -------------------------------------------------------------------
+
+ACCOUNT_REFRESH_INTERVAL = 300  # seconds between re-reads of the tracked account set
+
+ACCOUNT_EQUITY_SNAPSHOTS_DDL = """
+    CREATE TABLE IF NOT EXISTS account_equity_snapshots (
+        account_id      BIGINT          NOT NULL,
+        captured_at     TIMESTAMPTZ     NOT NULL,
+        equity          NUMERIC(18, 2)  NOT NULL,
+        balance         NUMERIC(18, 2)  NOT NULL,
+        margin          NUMERIC(18, 2),
+        open_positions  INTEGER         NOT NULL DEFAULT 0,
+        PRIMARY KEY (account_id, captured_at)
+    );
+    -- MetaApi account each trading account streams from (see metaapi_account_map).
+    ALTER TABLE accounts ADD COLUMN IF NOT EXISTS metaapi_account_id TEXT;
+"""
+
+# One statement per flush whatever its size: columns travel as arrays.
+UPSERT_SNAPSHOTS_SQL = """
+    INSERT INTO account_equity_snapshots
+        (account_id, captured_at, equity, balance, margin, open_positions)
+    SELECT * FROM unnest(
+        %s::bigint[], %s::timestamptz[], %s::numeric[], %s::numeric[], %s::numeric[], %s::integer[]
+    )
+    ON CONFLICT (account_id, captured_at) DO UPDATE
+    SET equity = EXCLUDED.equity,
+        balance = EXCLUDED.balance,
+        margin = EXCLUDED.margin,
+        open_positions = EXCLUDED.open_positions;
+"""
+
+
+@dataclass(slots=True)
+class EquityUpdate:
+    account_id: int
+    equity: float
+    balance: float
+    margin: Optional[float] = None
+    open_positions: int = 0
+    captured_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+Publish = Callable[[EquityUpdate], None]
+
+
+class EquityFeed(ABC):
+    """
+    Source of equity updates. One `stream` call serves a whole shard of
+    accounts; it runs until cancelled and calls `publish` for every update
+    received. How many upstream connections a shard needs is up to the
+    feed.
+    """
+
+    @abstractmethod
+    async def stream(self, account_ids: Sequence[int], publish: Publish) -> None:
+        ...
+
+
+class SyntheticFeed(EquityFeed):
+    """
+    Offline random-walk feed for load testing. `rate` is updates per
+    second per stream, emitted in ticks of `tick` seconds.
+    """
+
+    def __init__(self, rate: float = 2_000, tick: float = 0.01, seed: int = 0, start_equity: float = 100_000.0):
+        self.rate = rate
+        self.tick = tick
+        self.seed = seed
+        self.start_equity = start_equity
+
+    async def stream(self, account_ids: Sequence[int], publish: Publish) -> None:
+        import numpy as np
+
+        if not account_ids:
+            return
+
+        rng = np.random.default_rng([self.seed, int(account_ids[0])])
+        ids = np.asarray(account_ids, dtype=np.int64)
+        balance = np.full(len(ids), self.start_equity)
+        equity = balance.copy()
+        per_tick = max(1, int(self.rate * self.tick))
+
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            idx = rng.integers(0, len(ids), per_tick)
+            equity[idx] += rng.normal(0.0, 25.0, per_tick)
+            now = datetime.now(timezone.utc)
+
+            for i in idx.tolist():
+                publish(EquityUpdate(int(ids[i]), float(equity[i]), float(balance[i]), captured_at=now))
+
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+
+class MetaApiFeed(EquityFeed):
+    """
+    MetaApi streaming feed. `account_map` maps our account id to the
+    MetaApi account id. The SDK streams per account, so a shard holds one
+    streaming connection per account; they share the shard's MetaApi
+    client and are opened `connect_concurrency` at a time. Sharding bounds
+    clients and tasks, not upstream connections.
+    """
+
+    def __init__(self, account_map: dict[int, str], token: Optional[str] = None, connect_concurrency: int = 10):
+        self.account_map = account_map
+        self.token = token
+        self.connect_concurrency = connect_concurrency
+
+    async def stream(self, account_ids: Sequence[int], publish: Publish) -> None:
+        from metaapi_cloud_sdk import MetaApi, SynchronizationListener
+
+        token = self.token
+        if token is None:
+            from veilon_core.config import METAAPI_TOKEN
+            token = METAAPI_TOKEN
+        if not token:
+            raise RuntimeError("METAAPI_TOKEN is not set. Cannot start MetaApi equity stream.")
+
+        class _Listener(SynchronizationListener):
+            def __init__(self, account_id: int):
+                super().__init__()
+                self.account_id = account_id
+                self.open_positions = 0
+
+            async def on_account_information_updated(self, instance_index, account_information):
+                publish(EquityUpdate(
+                    self.account_id,
+                    float(account_information.get("equity", 0.0)),
+                    float(account_information.get("balance", 0.0)),
+                    margin=account_information.get("margin"),
+                    open_positions=self.open_positions,
+                ))
+
+            async def on_positions_replaced(self, instance_index, positions):
+                self.open_positions = len(positions)
+
+        api = MetaApi(token)
+        gate = asyncio.Semaphore(self.connect_concurrency)
+        connections = []
+
+        async def _open(account_id: int):
+            metaapi_id = self.account_map.get(account_id)
+            if metaapi_id is None:
+                return
+            async with gate:
+                account = await api.metatrader_account_api.get_account(metaapi_id)
+                connection = account.get_streaming_connection()
+                connection.add_synchronization_listener(_Listener(account_id))
+                await connection.connect()
+                connections.append(connection)
+
+        try:
+            await asyncio.gather(*(_open(a) for a in account_ids))
+            await asyncio.Event().wait()  # updates arrive via listeners
+        finally:
+            for connection in connections:
+                try:
+                    await connection.close()
+                except Exception as e:
+                    print(f"[WARN] Failed to close MetaApi connection: {e}")
+
+
+class SnapshotSink(ABC):
+    @abstractmethod
+    async def write(self, updates: list[EquityUpdate]) -> None:
+        ...
+
+    async def close(self) -> None:
+        """Called once when the tracker stops, after the final flush."""
+
+
+class PostgresSnapshotSink(SnapshotSink):
+    """
+    Writes one row per update in a single execute_values INSERT,
+    off the event loop.
+    """
+
+    def __init__(self, page_size: int = 5_000):
+        self.page_size = page_size
+
+    async def write(self, updates: list[EquityUpdate]) -> None:
+        rows = [
+            (u.account_id, u.captured_at, u.equity, u.balance, u.margin, u.open_positions)
+            for u in updates
+        ]
+        await asyncio.to_thread(
+            execute_many,
+            """
+            INSERT INTO account_equity_snapshots
+                (account_id, captured_at, equity, balance, margin, open_positions)
+            VALUES %s
+            ON CONFLICT (account_id, captured_at) DO UPDATE
+            SET equity = EXCLUDED.equity,
+                balance = EXCLUDED.balance,
+                margin = EXCLUDED.margin,
+                open_positions = EXCLUDED.open_positions;
+            """,
+            rows,
+            page_size=self.page_size,
+        )
+
+
+class AsyncPostgresSnapshotSink(SnapshotSink):
+    """
+    Writes updates through veilon_core.async_db on the tracker's own event
+    loop: one UPSERT_SNAPSHOTS_SQL per `page_size` rows, pages pipelined
+    on one pooled connection, no threads.
+    """
+
+    def __init__(self, page_size: int = 5_000):
+        self.page_size = page_size
+
+    async def write(self, updates: list[EquityUpdate]) -> None:
+        from veilon_core import async_db
+
+        pages = [updates[i:i + self.page_size] for i in range(0, len(updates), self.page_size)]
+        await async_db.pipeline([
+            (
+                UPSERT_SNAPSHOTS_SQL,
+                (
+                    [u.account_id for u in page],
+                    [u.captured_at for u in page],
+                    [u.equity for u in page],
+                    [u.balance for u in page],
+                    [u.margin for u in page],
+                    [u.open_positions for u in page],
+                ),
+            )
+            for page in pages
+        ])
+
+    async def close(self) -> None:
+        from veilon_core import async_db
+
+        await async_db.close_pool()
+
+
+class NullSink(SnapshotSink):
+    """Counts rows instead of writing them (load tests)."""
+
+    def __init__(self):
+        self.rows_written = 0
+
+    async def write(self, updates: list[EquityUpdate]) -> None:
+        self.rows_written += len(updates)
+
+
+@dataclass
+class TrackerStats:
+    updates_received: int = 0
+    snapshots_written: int = 0
+    flushes: int = 0
+    flush_errors: int = 0
+    flush_seconds: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def as_dict(self) -> dict:
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        return {
+            "updates_received": self.updates_received,
+            "snapshots_written": self.snapshots_written,
+            "coalesced": self.updates_received - self.snapshots_written,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "updates_per_second": round(self.updates_received / elapsed, 1),
+            "avg_flush_ms": round(1000 * self.flush_seconds / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+
+class EquityTracker:
+    """
+    Runs `feed` over `account_ids` split into at most `max_connections`
+    shards and flushes the latest update per account to `sink` every
+    `flush_interval` seconds (or sooner once `max_pending` accounts are dirty).
+    """
+
+    def __init__(
+        self,
+        feed: EquityFeed,
+        account_ids: Sequence[int],
+        *,
+        sink: Optional[SnapshotSink] = None,
+        max_connections: int = 8,
+        flush_interval: float = 1.0,
+        max_pending: int = 50_000,
+    ):
+        self.feed = feed
+        self.account_ids = list(account_ids)
+        self.sink = sink or PostgresSnapshotSink()
+        self.max_connections = max(1, max_connections)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.stats = TrackerStats()
+        self._pending: dict[int, EquityUpdate] = {}
+        self._flush_now = asyncio.Event()
+
+    def shards(self) -> list[list[int]]:
+        n = min(self.max_connections, len(self.account_ids)) or 1
+        return [self.account_ids[i::n] for i in range(n)]
+
+    def publish(self, update: EquityUpdate) -> None:
+        # Latest wins: an account only ever has one pending snapshot.
+        self._pending[update.account_id] = update
+        self.stats.updates_received += 1
+        if len(self._pending) >= self.max_pending:
+            self._flush_now.set()
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+
+        batch, self._pending = list(self._pending.values()), {}
+        started = time.perf_counter()
+        try:
+            await self.sink.write(batch)
+        except Exception as e:
+            # Put the batch back unless a newer update arrived meanwhile.
+            self.stats.flush_errors += 1
+            for update in batch:
+                self._pending.setdefault(update.account_id, update)
+            print(f"[WARN] Equity snapshot flush failed ({len(batch)} rows): {e}")
+            return 0
+
+        self.stats.flushes += 1
+        self.stats.snapshots_written += len(batch)
+        self.stats.flush_seconds += time.perf_counter() - started
+        return len(batch)
+
+    async def _flusher(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def run(self, duration: Optional[float] = None) -> dict:
+        """
+        Run until cancelled, or for `duration` seconds. Pending updates are
+        flushed on the way out. Returns the stats dict.
+        """
+        self.stats = TrackerStats()
+        tasks = [asyncio.create_task(self.feed.stream(shard, self.publish)) for shard in self.shards()]
+        tasks.append(asyncio.create_task(self._flusher()))
+
+        try:
+            if duration is None:
+                await asyncio.gather(*tasks)
+            else:
+                done, _ = await asyncio.wait(tasks, timeout=duration, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if task.exception() is not None:
+                        raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.flush()
+            await self.sink.close()
+
+        return self.stats.as_dict()
+
+
+def ensure_equity_snapshots_table() -> None:
+    execute_command(ACCOUNT_EQUITY_SNAPSHOTS_DDL)
+
+
+def tracked_account_ids() -> list[int]:
+    """
+    Phase and funded accounts that are open and enabled.
+    """
+    rows = execute_query(
+        """
+        SELECT id
+        FROM accounts
+        WHERE closed_at IS NULL
+          AND COALESCE(is_enabled, TRUE)
+        ORDER BY id;
+        """
+    )
+    return [r["id"] for r in rows]
+
+
+def metaapi_account_map(account_ids: Optional[Sequence[int]] = None) -> dict[int, str]:
+    rows = execute_query(
+        """
+        SELECT id, metaapi_account_id
+        FROM accounts
+        WHERE metaapi_account_id IS NOT NULL
+          AND (%s IS NULL OR id = ANY(%s));
+        """,
+        (list(account_ids) if account_ids is not None else None,) * 2,
+    )
+    return {r["id"]: r["metaapi_account_id"] for r in rows}
+
+
+def run_synthetic_load_test(
+    accounts: int = 5_000,
+    rate: float = 20_000,
+    seconds: float = 10.0,
+    max_connections: int = 8,
+    write: bool = False,
+    async_db: bool = False,
+) -> dict:
+    """
+    Drive the tracker with SyntheticFeed at `rate` updates/second in total.
+    With write=False snapshots go to NullSink, so no database is needed;
+    async_db=True writes through AsyncPostgresSnapshotSink.
+    """
+    feed = SyntheticFeed(rate=rate / max_connections)
+    if not write:
+        sink = NullSink()
+    else:
+        sink = AsyncPostgresSnapshotSink() if async_db else PostgresSnapshotSink()
+    if write:
+        ensure_equity_snapshots_table()
+
+    tracker = EquityTracker(feed, range(1, accounts + 1), sink=sink, max_connections=max_connections)
+    return asyncio.run(tracker.run(duration=seconds))
+
+
+def serve(
+    max_connections: int = 8,
+    flush_interval: float = 1.0,
+    refresh_interval: float = ACCOUNT_REFRESH_INTERVAL,
+    async_db: bool = False,
+) -> None:
+    """
+    Tracker service: streams every tracked account that has a MetaApi
+    account id into account_equity_snapshots until interrupted. The
+    account set is re-read every `refresh_interval` seconds and the
+    tracker restarted (after a final flush) only when it changed.
+    """
+    ensure_equity_snapshots_table()
+
+    def tracked() -> dict[int, str]:
+        return metaapi_account_map(tracked_account_ids())
+
+    async def _serve() -> None:
+        while True:
+            account_map = await asyncio.to_thread(tracked)
+            if not account_map:
+                print("[tracker] no accounts with a MetaApi account id; waiting")
+                await asyncio.sleep(refresh_interval)
+                continue
+
+            sink = AsyncPostgresSnapshotSink() if async_db else PostgresSnapshotSink()
+            tracker = EquityTracker(
+                MetaApiFeed(account_map), list(account_map),
+                sink=sink, max_connections=max_connections, flush_interval=flush_interval,
+            )
+            print(f"[tracker] streaming {len(account_map)} accounts")
+            task = asyncio.create_task(tracker.run())
+            try:
+                while True:
+                    done, _ = await asyncio.wait({task}, timeout=refresh_interval)
+                    if done:
+                        task.result()  # a feed failure ends the service
+                        return
+                    if await asyncio.to_thread(tracked) != account_map:
+                        break
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            print(f"[tracker] account set changed; restarting ({tracker.stats.as_dict()})")
+
+    asyncio.run(_serve())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from veilon_core.config import load_env
+
+    parser = argparse.ArgumentParser(description="Equity tracker")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="stream tracked accounts from MetaApi")
+    serve_parser.add_argument("--connections", type=int, default=8, help="feed streams (MetaApi clients)")
+    serve_parser.add_argument("--flush-interval", type=float, default=1.0)
+    serve_parser.add_argument("--refresh-interval", type=float, default=ACCOUNT_REFRESH_INTERVAL,
+                              help="seconds between re-reads of the tracked accounts")
+    serve_parser.add_argument("--async-db", action="store_true", help="write through veilon_core.async_db")
+    load_parser = sub.add_parser("load-test", help="synthetic load test")
+    load_parser.add_argument("--accounts", type=int, default=5_000)
+    load_parser.add_argument("--rate", type=float, default=20_000, help="total updates per second")
+    load_parser.add_argument("--seconds", type=float, default=10.0)
+    load_parser.add_argument("--connections", type=int, default=8)
+    load_parser.add_argument("--write", action="store_true", help="write snapshots to Postgres")
+    load_parser.add_argument("--async-db", action="store_true", help="write through veilon_core.async_db")
+    args = parser.parse_args()
+
+    load_env()
+    if args.command == "serve":
+        serve(args.connections, args.flush_interval, args.refresh_interval, args.async_db)
+    else:
+        print(run_synthetic_load_test(args.accounts, args.rate, args.seconds, args.connections, args.write, args.async_db))
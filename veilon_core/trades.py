@@ -0,0 +1,394 @@
+from __future__ import annotations
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
+import numpy as np
+import pandas as pd
+from veilon_core.db import copy_frame, execute_command, execute_query, transaction
+
+# -------------------------------------------------------------------
+# Trade history ingestion.
+#
+# Sources yield DataFrames of deals (fills). Each batch is COPYed into a
+# temporary staging table and merged into `trades` with one
+# INSERT ... SELECT DISTINCT ON ... ON CONFLICT DO NOTHING keyed by
+# (account_id, deal_id), so re-ingesting the same deals is a no-op.
+# Per-account watermarks (latest executed_at ingested) let sources skip
+# history that is already loaded.
+# -------------------------------------------------------------------
+
+TRADES_DDL = """
+    CREATE TABLE IF NOT EXISTS trades (
+        id            BIGSERIAL       PRIMARY KEY,
+        account_id    BIGINT          NOT NULL,
+        deal_id       TEXT            NOT NULL,
+        position_id   TEXT,
+        symbol        TEXT            NOT NULL,
+        side          TEXT            NOT NULL,   -- buy | sell
+        entry         TEXT            NOT NULL,   -- in | out
+        volume        NUMERIC(18, 4)  NOT NULL,
+        price         NUMERIC(18, 6)  NOT NULL,
+        profit        NUMERIC(18, 2)  NOT NULL DEFAULT 0,
+        commission    NUMERIC(18, 2)  NOT NULL DEFAULT 0,
+        swap          NUMERIC(18, 2)  NOT NULL DEFAULT 0,
+        risk_amount   NUMERIC(18, 2),             -- initial risk, for R multiples
+        executed_at   TIMESTAMPTZ     NOT NULL,
+        ingested_at   TIMESTAMPTZ     NOT NULL DEFAULT NOW(),
+        UNIQUE (account_id, deal_id)
+    );
+
+    CREATE INDEX IF NOT EXISTS trades_account_executed_idx
+        ON trades (account_id, executed_at);
+
+    CREATE TABLE IF NOT EXISTS trade_ingest_watermarks (
+        account_id        BIGINT       PRIMARY KEY,
+        last_executed_at  TIMESTAMPTZ  NOT NULL,
+        last_trade_id     BIGINT,
+        updated_at        TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+"""
+
+TRADE_COLUMNS = [
+    "account_id",
+    "deal_id",
+    "position_id",
+    "symbol",
+    "side",
+    "entry",
+    "volume",
+    "price",
+    "profit",
+    "commission",
+    "swap",
+    "risk_amount",
+    "executed_at",
+]
+
+STAGING_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS trades_staging (
+        account_id    BIGINT,
+        deal_id       TEXT,
+        position_id   TEXT,
+        symbol        TEXT,
+        side          TEXT,
+        entry         TEXT,
+        volume        NUMERIC(18, 4),
+        price         NUMERIC(18, 6),
+        profit        NUMERIC(18, 2),
+        commission    NUMERIC(18, 2),
+        swap          NUMERIC(18, 2),
+        risk_amount   NUMERIC(18, 2),
+        executed_at   TIMESTAMPTZ
+    ) ON COMMIT DELETE ROWS;
+"""
+
+MERGE_SQL = """
+    WITH inserted AS (
+        INSERT INTO trades (
+            account_id, deal_id, position_id, symbol, side, entry, volume, price,
+            profit, commission, swap, risk_amount, executed_at
+        )
+        SELECT DISTINCT ON (account_id, deal_id)
+            account_id, deal_id, position_id, symbol, side, entry, volume, price,
+            COALESCE(profit, 0), COALESCE(commission, 0), COALESCE(swap, 0),
+            risk_amount, executed_at
+        FROM trades_staging
+        ORDER BY account_id, deal_id, executed_at DESC
+        ON CONFLICT (account_id, deal_id) DO NOTHING
+        RETURNING id, account_id, executed_at
+    ),
+    marks AS (
+        INSERT INTO trade_ingest_watermarks (account_id, last_executed_at, last_trade_id)
+        SELECT account_id, MAX(executed_at), MAX(id)
+        FROM inserted
+        GROUP BY account_id
+        ON CONFLICT (account_id) DO UPDATE
+        SET last_executed_at = GREATEST(trade_ingest_watermarks.last_executed_at, EXCLUDED.last_executed_at),
+            last_trade_id = GREATEST(trade_ingest_watermarks.last_trade_id, EXCLUDED.last_trade_id),
+            updated_at = NOW()
+        RETURNING 1
+    )
+    SELECT
+        (SELECT COUNT(*) FROM inserted) AS inserted,
+        (SELECT COUNT(*) FROM marks) AS accounts;
+"""
+
+
+def ensure_trades_tables() -> None:
+    execute_command(TRADES_DDL)
+
+
+def trade_watermarks(account_ids: Optional[Sequence[int]] = None) -> dict[int, datetime]:
+    rows = execute_query(
+        """
+        SELECT account_id, last_executed_at
+        FROM trade_ingest_watermarks
+        WHERE (%s IS NULL OR account_id = ANY(%s));
+        """,
+        (list(account_ids) if account_ids is not None else None,) * 2,
+    )
+    return {r["account_id"]: r["last_executed_at"] for r in rows}
+
+
+class TradeSource(ABC):
+    """
+    Yields batches of deals as DataFrames with TRADE_COLUMNS. `watermarks`
+    is account_id -> last ingested executed_at; sources may use it to skip
+    history (deals at the watermark itself must still be yielded).
+    """
+
+    @abstractmethod
+    def batches(self, watermarks: dict[int, datetime]) -> Iterator[pd.DataFrame]:
+        ...
+
+
+class FrameTradeSource(TradeSource):
+    """In-memory DataFrame, re-chunked to `chunk_size` rows."""
+
+    def __init__(self, frame: pd.DataFrame, chunk_size: int = 250_000):
+        self.frame = frame
+        self.chunk_size = chunk_size
+
+    def batches(self, watermarks: dict[int, datetime]) -> Iterator[pd.DataFrame]:
+        for start in range(0, len(self.frame), self.chunk_size):
+            yield self.frame.iloc[start:start + self.chunk_size]
+
+
+class FileTradeSource(TradeSource):
+    """
+    CSV or Parquet files with TRADE_COLUMNS headers. CSVs are read in
+    chunks so arbitrarily large exports stay within memory.
+    """
+
+    def __init__(self, paths: Iterable[str | Path], chunk_size: int = 250_000):
+        self.paths = [Path(p) for p in paths]
+        self.chunk_size = chunk_size
+
+    def batches(self, watermarks: dict[int, datetime]) -> Iterator[pd.DataFrame]:
+        for path in self.paths:
+            if path.suffix == ".parquet":
+                frame = pd.read_parquet(path, columns=TRADE_COLUMNS)
+                for start in range(0, len(frame), self.chunk_size):
+                    yield frame.iloc[start:start + self.chunk_size]
+            else:
+                yield from pd.read_csv(
+                    path,
+                    usecols=lambda c: c in TRADE_COLUMNS,
+                    dtype={"deal_id": str, "position_id": str},
+                    chunksize=self.chunk_size,
+                )
+
+
+class MetaApiTradeSource(TradeSource):
+    """
+    Pulls deals from MetaApi per account, starting at the account's
+    watermark (or `default_start`). `account_map` maps our account id to
+    the MetaApi account id.
+    """
+
+    SIDES = {"DEAL_TYPE_BUY": "buy", "DEAL_TYPE_SELL": "sell"}
+    ENTRIES = {"DEAL_ENTRY_IN": "in", "DEAL_ENTRY_OUT": "out", "DEAL_ENTRY_INOUT": "out", "DEAL_ENTRY_OUT_BY": "out"}
+
+    def __init__(self, account_map: dict[int, str], token: Optional[str] = None, default_start: Optional[datetime] = None):
+        self.account_map = account_map
+        self.token = token
+        self.default_start = default_start or datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+    def batches(self, watermarks: dict[int, datetime]) -> Iterator[pd.DataFrame]:
+        import asyncio
+
+        for account_id, metaapi_id in self.account_map.items():
+            start = watermarks.get(account_id, self.default_start)
+            deals = asyncio.run(self._fetch(metaapi_id, start))
+            frame = self._to_frame(account_id, deals)
+            if not frame.empty:
+                yield frame
+
+    async def _fetch(self, metaapi_id: str, start: datetime) -> list[dict]:
+        from metaapi_cloud_sdk import MetaApi
+
+        token = self.token
+        if token is None:
+            from veilon_core.config import METAAPI_TOKEN
+            token = METAAPI_TOKEN
+
+        api = MetaApi(token)
+        account = await api.metatrader_account_api.get_account(metaapi_id)
+        connection = account.get_rpc_connection()
+        await connection.connect()
+        try:
+            await connection.wait_synchronized()
+            result = await connection.get_deals_by_time_range(start, datetime.now(timezone.utc))
+            return result.get("deals", [])
+        finally:
+            await connection.close()
+
+    def _to_frame(self, account_id: int, deals: list[dict]) -> pd.DataFrame:
+        rows = [
+            {
+                "account_id": account_id,
+                "deal_id": str(d["id"]),
+                "position_id": d.get("positionId"),
+                "symbol": d.get("symbol"),
+                "side": self.SIDES[d["type"]],
+                "entry": self.ENTRIES.get(d.get("entryType"), "in"),
+                "volume": d.get("volume", 0),
+                "price": d.get("price", 0),
+                "profit": d.get("profit", 0),
+                "commission": d.get("commission", 0),
+                "swap": d.get("swap", 0),
+                "risk_amount": None,
+                "executed_at": d["time"],
+            }
+            for d in deals
+            if d.get("type") in self.SIDES  # skip balance/credit operations
+        ]
+        return pd.DataFrame(rows, columns=TRADE_COLUMNS)
+
+
+def _normalise(frame: pd.DataFrame, watermarks: dict[int, datetime]) -> pd.DataFrame:
+    """
+    Coerce types and drop rows strictly older than the account watermark.
+    Deals at the watermark are kept; the merge de-duplicates them.
+    """
+    frame = frame.reindex(columns=TRADE_COLUMNS)
+    frame = frame.assign(
+        account_id=frame["account_id"].astype("int64"),
+        deal_id=frame["deal_id"].astype(str),
+        executed_at=pd.to_datetime(frame["executed_at"], utc=True),
+    )
+
+    if watermarks:
+        marks = frame["account_id"].map(pd.Series(watermarks, dtype="datetime64[ns, UTC]"))
+        frame = frame[marks.isna() | (frame["executed_at"] >= marks)]
+
+    return frame
+
+
+def ingest_trades(source: TradeSource, *, batch_rows: int = 500_000, full: bool = False) -> dict:
+    """
+    Load every batch from `source` into `trades`. Batches are accumulated
+    up to `batch_rows` staged rows per transaction. Returns counts and
+    throughput; `duplicates` are staged rows already present in trades.
+
+    Deals older than an account's watermark are skipped before staging.
+    Use full=True to backfill late deals; the merge keeps it idempotent.
+    """
+    watermarks = {} if full else trade_watermarks()
+    stats = {"read": 0, "staged": 0, "inserted": 0, "transactions": 0}
+    started = time.perf_counter()
+
+    pending: list[pd.DataFrame] = []
+    pending_rows = 0
+
+    def _flush():
+        nonlocal pending, pending_rows
+        if not pending:
+            return
+        with transaction() as cursor:
+            # DISTINCT ON sorts the whole batch; keep that sort in memory.
+            cursor.execute("SET LOCAL work_mem = '256MB';")
+            cursor.execute(STAGING_DDL)
+            for frame in pending:
+                copy_frame(cursor, "trades_staging", frame, TRADE_COLUMNS)
+            cursor.execute(MERGE_SQL)
+            result = cursor.fetchone()
+        stats["staged"] += pending_rows
+        stats["inserted"] += result["inserted"]
+        stats["transactions"] += 1
+        pending, pending_rows = [], 0
+
+    for raw in source.batches(watermarks):
+        stats["read"] += len(raw)
+        frame = _normalise(raw, watermarks)
+        if frame.empty:
+            continue
+        pending.append(frame)
+        pending_rows += len(frame)
+        if pending_rows >= batch_rows:
+            _flush()
+    _flush()
+
+    elapsed = time.perf_counter() - started
+    stats["duplicates"] = stats["staged"] - stats["inserted"]
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_second"] = round(stats["read"] / elapsed) if elapsed else 0
+    return stats
+
+
+def account_trades(account_id: int, limit: int = 500) -> list[dict]:
+    return execute_query(
+        """
+        SELECT deal_id, symbol, side, entry, volume, price, profit, commission, swap, executed_at
+        FROM trades
+        WHERE account_id = %s
+        ORDER BY executed_at DESC
+        LIMIT %s;
+        """,
+        (account_id, limit),
+    )
+
+
+def synthetic_trades(n_trades: int = 1_000_000, n_accounts: int = 10_000, seed: int = 0) -> pd.DataFrame:
+    """
+    Seeded random deals (alternating in/out per position) for benchmarks.
+    """
+    rng = np.random.default_rng(seed)
+    account_id = rng.integers(1, n_accounts + 1, n_trades)
+    position = np.arange(n_trades) // 2
+    executed_at = pd.Timestamp("2026-01-01", tz="UTC") + pd.to_timedelta(
+        np.sort(rng.integers(0, 180 * 86_400, n_trades)), unit="s"
+    )
+    entry = np.where(np.arange(n_trades) % 2 == 0, "in", "out")
+    profit = np.where(entry == "out", np.round(rng.normal(15, 250, n_trades), 2), 0.0)
+
+    return pd.DataFrame({
+        "account_id": account_id,
+        "deal_id": np.char.add("D", np.arange(n_trades).astype(str)),
+        "position_id": np.char.add("P", position.astype(str)),
+        "symbol": rng.choice(["EURUSD", "GBPUSD", "XAUUSD", "US30", "NAS100"], n_trades),
+        "side": rng.choice(["buy", "sell"], n_trades),
+        "entry": entry,
+        "volume": np.round(rng.uniform(0.01, 5, n_trades), 2),
+        "price": np.round(rng.uniform(1, 2_000, n_trades), 5),
+        "profit": profit,
+        "commission": np.round(-rng.uniform(0, 7, n_trades), 2),
+        "swap": 0.0,
+        "risk_amount": np.where(entry == "out", np.round(rng.uniform(50, 500, n_trades), 2), np.nan),
+        "executed_at": executed_at,
+    })
+
+
+def benchmark(n_trades: int = 1_000_000, n_accounts: int = 10_000) -> dict:
+    """
+    Ingest a synthetic dataset twice: the first run measures insert
+    throughput, the second (same deals) the idempotent no-op path.
+    Only runs against a database marked as scratch.
+    """
+    from veilon_core.synthetic import require_scratch_database
+
+    require_scratch_database()
+    ensure_trades_tables()
+    frame = synthetic_trades(n_trades, n_accounts)
+    first = ingest_trades(FrameTradeSource(frame))
+    second = ingest_trades(FrameTradeSource(frame))
+    return {"first": first, "rerun": second}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Trade history ingestion")
+    parser.add_argument("files", nargs="*", help="CSV/Parquet files to ingest")
+    parser.add_argument("--bench", type=int, metavar="TRADES", help="benchmark on a synthetic dataset")
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--full", action="store_true", help="ignore watermarks (backfill)")
+    args = parser.parse_args()
+
+    if args.bench:
+        print(benchmark(args.bench, args.accounts))
+    else:
+        ensure_trades_tables()
+        print(ingest_trades(FileTradeSource(args.files), full=args.full))
@@ -0,0 +1,204 @@
+from __future__ import annotations
+import time
+from datetime import datetime, timezone
+from typing import Optional
+import pandas as pd
+from veilon_core.db import execute_command, execute_query
+from veilon_core.orders import SETTLED_ORDER_STATUSES
+
+# -------------------------------------------------------------------
+# Signup-month cohort funnels.
+#
+# A user's journey is signup -> first settled order -> first account
+# (Phase 1) -> first funding -> first paid payout. refresh_cohorts()
+# computes each user's milestone times and folds them into one row per
+# signup month in a single statement that reads users, orders, accounts
+# and payouts once each, then upserts user_cohort_funnels. Counts are
+# cumulative from signup: a user counts as funded whenever any of their
+# accounts was funded, even if it is not funded any more.
+#
+# Only the last RECENT_COHORT_MONTHS cohorts are recomputed nightly;
+# older cohorts have mostly stopped converting and keep their last
+# values until a full refresh. The Users page reads the small table.
+#
+#   python -m veilon_core.jobs cohorts [--full]
+#   python -m veilon_core.users --full        # refresh and print
+# -------------------------------------------------------------------
+
+RECENT_COHORT_MONTHS = 3
+
+# (column, label) in funnel order
+FUNNEL_STAGES = (
+    ("users", "Signed Up"),
+    ("ordered", "First Order"),
+    ("phase1", "Phase 1"),
+    ("funded", "Funded"),
+    ("paid_out", "First Payout"),
+)
+
+USER_COHORTS_DDL = """
+    CREATE TABLE IF NOT EXISTS user_cohort_funnels (
+        cohort_month           DATE         PRIMARY KEY,
+        users                  INTEGER      NOT NULL,
+        ordered                INTEGER      NOT NULL,
+        phase1                 INTEGER      NOT NULL,
+        funded                 INTEGER      NOT NULL,
+        paid_out               INTEGER      NOT NULL,
+        days_to_order_p50      REAL,        -- signup -> first order
+        days_to_fund_p50       REAL,        -- first account -> funded
+        days_to_fund_p90       REAL,
+        days_to_payout_p50     REAL,        -- funded -> first payout
+        refreshed_at           TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+    );
+
+    CREATE INDEX IF NOT EXISTS users_created_at_idx ON users (created_at);
+    CREATE INDEX IF NOT EXISTS accounts_user_id_idx ON accounts (user_id);
+"""
+
+REFRESH_COHORTS_SQL = """
+    WITH cohort_users AS (
+        SELECT
+            id AS user_id,
+            date_trunc('month', created_at AT TIME ZONE 'UTC')::date AS cohort_month,
+            created_at AS signed_up_at
+        FROM users
+        WHERE %(since)s::timestamptz IS NULL OR created_at >= %(since)s
+    ),
+    first_orders AS (
+        SELECT o.user_id, MIN(o.created_at) AS first_order_at
+        FROM orders o
+        JOIN cohort_users u ON u.user_id = o.user_id
+        WHERE o.status = ANY(%(settled)s)
+        GROUP BY o.user_id
+    ),
+    first_accounts AS (
+        SELECT a.user_id, MIN(a.created_at) AS phase1_at, MIN(a.funded_at) AS funded_at
+        FROM accounts a
+        JOIN cohort_users u ON u.user_id = a.user_id
+        GROUP BY a.user_id
+    ),
+    first_payouts AS (
+        SELECT a.user_id, MIN(COALESCE(p.paid_at, p.created_at)) AS first_payout_at
+        FROM payouts p
+        JOIN accounts a ON a.id = p.account_id
+        JOIN cohort_users u ON u.user_id = a.user_id
+        WHERE p.status = 'paid'
+        GROUP BY a.user_id
+    ),
+    journeys AS (
+        SELECT
+            u.cohort_month,
+            EXTRACT(EPOCH FROM o.first_order_at - u.signed_up_at) / 86400 AS days_to_order,
+            EXTRACT(EPOCH FROM a.funded_at - a.phase1_at) / 86400 AS days_to_fund,
+            EXTRACT(EPOCH FROM p.first_payout_at - a.funded_at) / 86400 AS days_to_payout,
+            o.first_order_at IS NOT NULL AS ordered,
+            a.phase1_at IS NOT NULL AS phase1,
+            a.funded_at IS NOT NULL AS funded,
+            p.first_payout_at IS NOT NULL AS paid_out
+        FROM cohort_users u
+        LEFT JOIN first_orders o ON o.user_id = u.user_id
+        LEFT JOIN first_accounts a ON a.user_id = u.user_id
+        LEFT JOIN first_payouts p ON p.user_id = u.user_id
+    )
+    INSERT INTO user_cohort_funnels (
+        cohort_month, users, ordered, phase1, funded, paid_out,
+        days_to_order_p50, days_to_fund_p50, days_to_fund_p90, days_to_payout_p50, refreshed_at
+    )
+    SELECT
+        cohort_month,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE ordered),
+        COUNT(*) FILTER (WHERE phase1),
+        COUNT(*) FILTER (WHERE funded),
+        COUNT(*) FILTER (WHERE paid_out),
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY days_to_order),
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY days_to_fund),
+        percentile_cont(0.9) WITHIN GROUP (ORDER BY days_to_fund),
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY days_to_payout),
+        NOW()
+    FROM journeys
+    GROUP BY cohort_month
+    ON CONFLICT (cohort_month) DO UPDATE
+    SET users = EXCLUDED.users,
+        ordered = EXCLUDED.ordered,
+        phase1 = EXCLUDED.phase1,
+        funded = EXCLUDED.funded,
+        paid_out = EXCLUDED.paid_out,
+        days_to_order_p50 = EXCLUDED.days_to_order_p50,
+        days_to_fund_p50 = EXCLUDED.days_to_fund_p50,
+        days_to_fund_p90 = EXCLUDED.days_to_fund_p90,
+        days_to_payout_p50 = EXCLUDED.days_to_payout_p50,
+        refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+COHORT_FUNNELS_SQL = """
+    SELECT *
+    FROM user_cohort_funnels
+    WHERE %(first)s::date IS NULL OR cohort_month >= %(first)s
+    ORDER BY cohort_month DESC;
+"""
+
+
+def ensure_cohort_tables() -> None:
+    from veilon_core.payouts import ensure_payouts_indexes
+
+    execute_command(USER_COHORTS_DDL)
+    ensure_payouts_indexes()
+
+
+def _month_start(months_back: int = 0) -> datetime:
+    now = datetime.now(timezone.utc)
+    index = now.year * 12 + now.month - 1 - months_back
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def refresh_cohorts(full: bool = False, months: int = RECENT_COHORT_MONTHS) -> dict:
+    """
+    Recomputes the cohorts of the last `months` signup months (including
+    the current one), or every cohort with full=True.
+    """
+    since = None if full else _month_start(months - 1)
+    started = time.perf_counter()
+    cohorts = execute_command(REFRESH_COHORTS_SQL, {"since": since, "settled": list(SETTLED_ORDER_STATUSES)})
+    return {
+        "cohorts": cohorts,
+        "since": since.date().isoformat() if since else None,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def cohort_funnels(months: Optional[int] = 12) -> pd.DataFrame:
+    """
+    The stored funnels of the last `months` cohorts (all with None),
+    newest first, with each stage's conversion as a share of signups
+    (`<stage>_rate`) and of the stage before it (`<stage>_step`).
+    Empty until the cohorts job has run.
+    """
+    first = _month_start(months - 1).date() if months else None
+    df = pd.DataFrame(execute_query(COHORT_FUNNELS_SQL, {"first": first}))
+    if df.empty:
+        return df
+    previous = "users"
+    for stage, _ in FUNNEL_STAGES[1:]:
+        df[f"{stage}_rate"] = (df[stage] / df["users"]).where(df["users"] > 0)
+        df[f"{stage}_step"] = (df[stage] / df[previous]).where(df[previous] > 0)
+        previous = stage
+    return df
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from veilon_core.config import load_env
+
+    parser = argparse.ArgumentParser(description="Signup-month cohort funnels")
+    parser.add_argument("--full", action="store_true", help="recompute every cohort")
+    parser.add_argument("--months", type=int, default=RECENT_COHORT_MONTHS, help="recent cohorts to recompute")
+    args = parser.parse_args()
+
+    load_env()
+    ensure_cohort_tables()
+    print(refresh_cohorts(args.full, args.months))
+    funnels = cohort_funnels(None)
+    if not funnels.empty:
+        print(funnels[[c for c, _ in FUNNEL_STAGES] + ["cohort_month", "days_to_fund_p50"]].to_string(index=False))